@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+إشعارات الأدمن في الخلفية مع تجميع الأحداث المتشابهة في ملخص دوري
+Background admin notification fan-out with coalescing digests
+"""
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# عناوين الملخص لكل نوع من الأحداث
+DIGEST_TITLES = {
+    'deposit': 'طلب إيداع جديد',
+    'withdraw': 'طلب سحب جديد',
+    'complaint': 'شكوى جديدة',
+    'member': 'عضو جديد',
+}
+
+# أقصى عدد أسطر تفصيلية في رسالة الملخص الواحدة
+DIGEST_MAX_LINES = 20
+
+_STOP = object()
+
+
+class AdminNotifier:
+    """طابور إشعارات الأدمن: الإرسال يتم في الخلفية وبالتوازي لكل الأدمن
+
+    notify ترجع فوراً، فلا ينتظر العميل إرسال N رسالة للأدمن. إذا كان
+    digest_window أكبر من صفر، تُجمع الأحداث من نفس النوع (kind) خلال النافذة
+    وتُرسل كرسالة ملخص واحدة لكل أدمن (مثلاً: 12 طلب إيداع جديد خلال آخر 30 ثانية)،
+    وإذا لم يقع إلا حدث واحد في النافذة يُرسل نصه الكامل كما هو.
+    """
+
+    def __init__(self, send, recipients, digest_window=0, workers=4):
+        self.send = send
+        self.recipients = recipients
+        self.digest_window = digest_window
+        self.queue = queue.Queue()
+        self.digests = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='admin-notify')
+        self.thread = None
+
+    def start(self):
+        """تشغيل خيط الطابور"""
+        self.thread = threading.Thread(target=self.loop, name='admin-notifier', daemon=True)
+        self.thread.start()
+
+    def notify(self, text, keyboard=None, kind=None, summary=None):
+        """إضافة إشعار للطابور (summary سطر مختصر يظهر في الملخص)"""
+        self.queue.put((text, keyboard, kind, summary))
+
+    def loop(self):
+        """استقبال الإشعارات وإرسالها أو تجميعها حتى موعد الملخص"""
+        while True:
+            deadlines = [deadline for deadline, _ in self.digests.values()]
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self.flush(force=True)
+                return
+            if item:
+                text, keyboard, kind, summary = item
+                if self.digest_window > 0 and kind:
+                    entry = self.digests.setdefault(kind, [time.monotonic() + self.digest_window, []])
+                    entry[1].append((text, keyboard, summary))
+                else:
+                    self.fan_out(text, keyboard)
+            self.flush()
+
+    def flush(self, force=False):
+        """إرسال الملخصات التي حان موعدها"""
+        now = time.monotonic()
+        for kind, (deadline, items) in list(self.digests.items()):
+            if not force and deadline > now:
+                continue
+            del self.digests[kind]
+            if len(items) == 1:
+                self.fan_out(items[0][0], items[0][1])
+            else:
+                self.fan_out(self.digest_text(kind, items), None)
+
+    def digest_text(self, kind, items):
+        """نص رسالة الملخص"""
+        title = DIGEST_TITLES.get(kind, kind)
+        text = f"🔔 {len(items)} {title} خلال آخر {self.digest_window:g} ثانية\n\n"
+        lines = [summary for _, _, summary in items if summary]
+        text += '\n'.join(f"• {line}" for line in lines[:DIGEST_MAX_LINES])
+        if len(lines) > DIGEST_MAX_LINES:
+            text += f"\n… و {len(lines) - DIGEST_MAX_LINES} أخرى"
+        return text
+
+    def fan_out(self, text, keyboard):
+        """إرسال الرسالة لكل الأدمن بالتوازي"""
+        for admin_id in self.recipients():
+            self.pool.submit(self.deliver, admin_id, text, keyboard)
+
+    def deliver(self, admin_id, text, keyboard):
+        """إرسال رسالة لأدمن واحد"""
+        try:
+            self.send(admin_id, text, keyboard)
+        except Exception as e:
+            logger.error(f"خطأ في إشعار الأدمن {admin_id}: {e}")
+
+    def stop(self):
+        """إرسال الملخصات المعلقة ثم إنهاء الخيط والعمال"""
+        if self.thread:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        self.pool.shutdown(wait=True)
@@ -5,14 +5,14 @@ LangSense Bot - نظام متكامل متقدم
 """
 
 import os
-import json
 import time
 import logging
 import csv
+import threading
 from datetime import datetime
-import urllib.request
-import urllib.parse
-import urllib.error
+
+from telegram_transport import get_transport
+from webhook_server import WebhookConfig, serve_webhook, delete_webhook
 
 # إعداد التسجيل
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,8 +22,10 @@ class AdvancedLangSenseBot:
     def __init__(self, token):
         self.token = token
         self.api_url = f"https://api.telegram.org/bot{token}"
+        self.transport = get_transport()
         self.offset = 0
         self.user_states = {}  # لحفظ حالات المستخدمين
+        self.update_lock = threading.Lock()  # معالجة تحديث واحد في كل مرة (خادم الـ webhook متعدد الـ threads)
         self.init_files()
         self.admin_ids = self.get_admin_ids()  # جلب معرفات الأدمن
         
@@ -88,14 +90,8 @@ class AdvancedLangSenseBot:
         url = f"{self.api_url}/{method}"
         try:
             if data:
-                json_data = json.dumps(data).encode('utf-8')
-                req = urllib.request.Request(url, data=json_data)
-                req.add_header('Content-Type', 'application/json')
-            else:
-                req = urllib.request.Request(url)
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                return json.loads(response.read().decode('utf-8'))
+                return self.transport.post_json(url, data, timeout=10)
+            return self.transport.get_json(url, timeout=10)
                 
         except Exception as e:
             logger.error(f"خطأ في API: {e}")
@@ -112,8 +108,7 @@ class AdvancedLangSenseBot:
         """جلب التحديثات"""
         url = f"{self.api_url}/getUpdates?offset={self.offset + 1}&timeout=10"
         try:
-            with urllib.request.urlopen(url, timeout=15) as response:
-                return json.loads(response.read().decode('utf-8'))
+            return self.transport.get_json(url, timeout=15)
         except Exception as e:
             logger.error(f"خطأ في جلب التحديثات: {e}")
             return None
@@ -1658,6 +1653,19 @@ withdraw فودافون كاش رقم المحفظة: 01012345678"""
         
         self.send_message(message['chat']['id'], response, self.admin_keyboard())
     
+    def handle_update(self, update):
+        """معالجة تحديث واحد (من polling أو webhook)"""
+        with self.update_lock:
+            if 'message' in update:
+                message = update['message']
+                if 'text' in message:
+                    if message['text'] == '/start':
+                        self.handle_start(message)
+                    else:
+                        self.handle_text(message)
+                elif 'contact' in message:
+                    self.handle_contact(message)
+    
     def run(self):
         """تشغيل البوت"""
         test_result = self.api_call('getMe')
@@ -1668,21 +1676,20 @@ withdraw فودافون كاش رقم المحفظة: 01012345678"""
         bot_info = test_result['result']
         logger.info(f"✅ النظام المتقدم يعمل: @{bot_info['username']}")
         
+        # وضع الـ webhook (UPDATE_MODE=webhook) بنفس مسار المعالجة
+        webhook_config = WebhookConfig.from_env()
+        if webhook_config.enabled:
+            serve_webhook(self.api_url, self.handle_update, webhook_config)
+            return
+        delete_webhook(self.api_url)
+        
         while True:
             try:
                 updates = self.get_updates()
                 if updates and updates.get('ok'):
                     for update in updates['result']:
                         self.offset = update['update_id']
-                        if 'message' in update:
-                            message = update['message']
-                            if 'text' in message:
-                                if message['text'] == '/start':
-                                    self.handle_start(message)
-                                else:
-                                    self.handle_text(message)
-                            elif 'contact' in message:
-                                self.handle_contact(message)
+                        self.handle_update(update)
                 time.sleep(1)
             except KeyboardInterrupt:
                 logger.info("تم إيقاف النظام")
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+محرك asyncio لبوت DUX الشامل: ناقل HTTP غير متزامن وحلقة جلب وتوزيع غير متزامنة
+Asyncio runtime for ComprehensiveDUXBot
+
+التفعيل: DUX_ENGINE=async عند تشغيل comprehensive_bot.py
+"""
+
+import os
+import ssl
+import json
+import asyncio
+import logging
+import inspect
+import threading
+from collections import deque
+from urllib.parse import urlsplit, urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram_transport import TelegramHTTPError, RateLimiter, retry_after, limited_chat, encode_json
+
+logger = logging.getLogger(__name__)
+
+# فاصل النسخ الاحتياطي التلقائي (6 ساعات)
+BACKUP_INTERVAL = 21600
+
+
+class AsyncConnectionPool:
+    """اتصالات HTTP/1.1 دائمة لخادم واحد فوق asyncio streams"""
+
+    def __init__(self, scheme, host, port=None, max_size=32):
+        self.scheme = scheme
+        self.host = host
+        self.port = port or (443 if scheme == 'https' else 80)
+        self.idle = deque()
+        self.slots = asyncio.Semaphore(max_size)
+
+    async def new_connection(self):
+        """فتح اتصال جديد"""
+        ssl_context = ssl.create_default_context() if self.scheme == 'https' else None
+        return await asyncio.open_connection(self.host, self.port, ssl=ssl_context)
+
+    async def acquire(self, fresh=False):
+        """أخذ اتصال خامل (أو فتح اتصال جديد)"""
+        await self.slots.acquire()
+        try:
+            while self.idle and not fresh:
+                reader, writer = self.idle.pop()
+                if not writer.is_closing() and not reader.at_eof():
+                    return (reader, writer), True
+                writer.close()
+            return await self.new_connection(), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn, reusable):
+        """إرجاع الاتصال للمجموعة أو إغلاقه"""
+        if reusable:
+            self.idle.append(conn)
+        else:
+            conn[1].close()
+        self.slots.release()
+
+    def close(self):
+        """إغلاق جميع الاتصالات الخاملة"""
+        while self.idle:
+            self.idle.pop()[1].close()
+
+
+class AsyncTelegramTransport:
+    """ناقل غير متزامن لواجهة Telegram: نفس حدود الإرسال ومعالجة 429 في الناقل المتزامن"""
+
+    def __init__(self, pool_size=32, timeout=10, limiter=None, max_retries=5):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter.from_env()
+        self.max_retries = max_retries
+        self.pools = {}
+
+    def pool_for(self, scheme, host, port):
+        """مجموعة الاتصالات الخاصة بخادم"""
+        key = (scheme, host, port)
+        if key not in self.pools:
+            self.pools[key] = AsyncConnectionPool(scheme, host, port, self.pool_size)
+        return self.pools[key]
+
+    async def request(self, url, body=None, content_type=None, timeout=None, chat_id=None):
+        """إرسال طلب وإرجاع الرد كـ JSON (مع حدود الإرسال عند تحديد chat_id)"""
+        if chat_id is None:
+            return await self.send_once(url, body, content_type, timeout)
+        for attempt in range(self.max_retries + 1):
+            wait = self.limiter.reserve(chat_id)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await self.send_once(url, body, content_type, timeout)
+            except TelegramHTTPError as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                delay = retry_after(e) or min(2 ** attempt, 30)
+                logger.warning(f"تجاوز حد الإرسال (429) للمحادثة {chat_id}، إعادة المحاولة بعد {delay} ثانية")
+                self.limiter.pause(delay)
+
+    async def send_once(self, url, body, content_type, timeout):
+        """تنفيذ طلب واحد مع إعادة المحاولة مرة على اتصال جديد إذا كان الاتصال الخامل مغلقاً"""
+        parts = urlsplit(url)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        pool = self.pool_for(parts.scheme, parts.hostname, parts.port)
+        method = 'GET' if body is None else 'POST'
+        head = [f"{method} {path} HTTP/1.1", f"Host: {parts.netloc}", "Connection: keep-alive"]
+        if body is not None:
+            head.append(f"Content-Length: {len(body)}")
+        if content_type:
+            head.append(f"Content-Type: {content_type}")
+        raw = ('\r\n'.join(head) + '\r\n\r\n').encode('utf-8') + (body or b'')
+
+        for attempt in range(2):
+            conn, reused = await pool.acquire(fresh=attempt > 0)
+            reusable = False
+            try:
+                status, payload, reusable = await asyncio.wait_for(self.exchange(conn, raw),
+                                                                   timeout or self.timeout)
+            except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+                if reused and attempt == 0:
+                    # اتصال خامل أغلقه الخادم: إعادة المحاولة على اتصال جديد
+                    continue
+                raise
+            finally:
+                pool.release(conn, reusable)
+            text = payload.decode('utf-8')
+            if status >= 400:
+                raise TelegramHTTPError(status, text)
+            return json.loads(text)
+
+    @staticmethod
+    async def exchange(conn, raw):
+        """كتابة الطلب وقراءة الرد: (الحالة، الجسم، هل يمكن إعادة استخدام الاتصال)"""
+        reader, writer = conn
+        writer.write(raw)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            payload = b''.join(chunks)
+        elif 'content-length' in headers:
+            payload = await reader.readexactly(int(headers['content-length']))
+        else:
+            return status, await reader.read(), False
+        return status, payload, headers.get('connection', '').lower() != 'close'
+
+    async def get_json(self, url, params=None, timeout=None):
+        """طلب GET مع معاملات اختيارية في الرابط"""
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        return await self.request(url, timeout=timeout)
+
+    async def post_json(self, url, data, timeout=None):
+        """طلب POST ببيانات JSON"""
+        return await self.request(url, encode_json(data), 'application/json', timeout,
+                                  chat_id=limited_chat(url, data))
+
+    def close(self):
+        """إغلاق جميع الاتصالات"""
+        for pool in self.pools.values():
+            pool.close()
+
+
+class AsyncBotEngine:
+    """تشغيل ComprehensiveDUXBot فوق asyncio
+
+    الجلب والتوزيع وحفظ علامة التحديثات والنسخ الاحتياطي مهام في حلقة واحدة.
+    لكل محادثة لديها تحديثات تنتظر مهمة asyncio واحدة تعالجها بالترتيب، والمحادثات
+    الخاملة لا تستهلك شيئاً. المعالجات غير المتزامنة (async def) تُنتظر مباشرة،
+    والمعالجات الحالية المتزامنة تعمل عبر محول على مجموعة threads محدودة
+    (executor) حتى لا توقف الحلقة، وكذلك عمليات الملفات.
+
+    أثناء التشغيل يمر bot.api_call (ومعه send_message) عبر الناقل غير المتزامن:
+    الطلب يُنفذ في الحلقة على اتصالاتها الدائمة وحدود إرسالها. المعالج المتزامن
+    ينتظر الرد في thread الخاص به، لذلك عدد الطلبات الجارية من المعالجات
+    المتزامنة لا يتجاوز DUX_WORKERS؛ المعالجات المكتوبة بـ async def تستخدم
+    engine.api_call مباشرة دون هذا الحد. إرسال الملفات (send_document) ما زال
+    عبر الناقل المتزامن.
+    """
+
+    def __init__(self, bot, handler=None, workers=None, max_pending=None):
+        self.bot = bot
+        self.transport = AsyncTelegramTransport()
+        self.executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv('DUX_WORKERS', '8')),
+                                           thread_name_prefix='dux-handler')
+        self.handler = self.adapt(handler or bot.handle_update)
+        self.max_pending = max_pending or int(os.getenv('DUX_MAX_PENDING', '1000'))
+        self.pending = {}
+        self.tasks = set()
+        self.slots = None
+        self.loop = None
+        self.loop_thread = None
+
+    def adapt(self, handler):
+        """محول المعالجات: async def كما هي، والمتزامنة تُشغّل خارج الحلقة"""
+        if inspect.iscoroutinefunction(handler):
+            return handler
+
+        async def run_sync(update):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, handler, update)
+        return run_sync
+
+    async def off_loop(self, func, *args):
+        """تشغيل عملية ملفات متزامنة خارج الحلقة (منفصلة عن threads المعالجات)"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def api_call(self, method, data=None):
+        """استدعاء API غير متزامن (للمعالجات المكتوبة بـ async def)"""
+        url = f"{self.bot.api_url}/{method}"
+        try:
+            if data:
+                return await self.transport.post_json(url, data, timeout=10)
+            return await self.transport.get_json(url, timeout=10)
+        except Exception as e:
+            logger.error(f"خطأ في API: {e}")
+            return None
+
+    def accepts_thread_calls(self):
+        """هل يمكن تمرير استدعاء متزامن للحلقة (الحلقة تعمل والاستدعاء من thread آخر)"""
+        return self.loop is not None and self.loop.is_running() and threading.get_ident() != self.loop_thread
+
+    def call_from_thread(self, method, data=None):
+        """استدعاء API من معالج متزامن: يُنفذ في الحلقة وينتظر thread المعالج الرد"""
+        return asyncio.run_coroutine_threadsafe(self.api_call(method, data), self.loop).result()
+
+    async def submit(self, key, update):
+        """إضافة تحديث لطابور محادثته (ينتظر إذا امتلأت الطوابير)"""
+        await self.slots.acquire()
+        if key in self.pending:
+            self.pending[key].append(update)
+            return
+        self.pending[key] = deque([update])
+        task = asyncio.create_task(self.drain(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def drain(self, key):
+        """معالجة تحديثات محادثة واحدة بالترتيب حتى يفرغ طابورها"""
+        queue = self.pending[key]
+        while queue:
+            update = queue.popleft()
+            try:
+                await self.handler(update)
+            except Exception as e:
+                logger.error(f"خطأ في معالجة التحديث: {e}")
+            finally:
+                self.slots.release()
+        del self.pending[key]
+
+    async def accept(self, update):
+        """تمرير تحديث جديد (المكرر يُتجاهل)"""
+        if self.bot.update_tracker.begin(update['update_id']):
+            await self.submit(self.bot.update_chat_key(update), update)
+
+    async def poll(self):
+        """حلقة الجلب: long polling غير متزامن ثم حفظ العلامة خارج الحلقة"""
+        while True:
+            try:
+                updates = await self.transport.get_json(f"{self.bot.api_url}/getUpdates",
+                                                        {'offset': self.bot.offset + 1, 'timeout': 25},
+                                                        timeout=35)
+                if updates and updates.get('ok'):
+                    for update in updates['result']:
+                        self.bot.offset = update['update_id']
+                        await self.accept(update)
+                await self.off_loop(self.bot.update_tracker.save)
+                await self.off_loop(self.bot.save_conversation_state)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"خطأ في جلب التحديثات: {e}")
+                await asyncio.sleep(1)
+
+    async def backups(self):
+        """النسخ الاحتياطي التلقائي كل 6 ساعات بدون thread نائم"""
+        while True:
+            await asyncio.sleep(BACKUP_INTERVAL)
+            try:
+                await self.off_loop(self.bot.send_backup_to_admins)
+            except Exception as e:
+                logger.error(f"خطأ في نظام النسخ الاحتياطي: {e}")
+
+    async def main(self):
+        """تشغيل المهام حتى الإيقاف ثم إنهاء ما في الطوابير"""
+        self.slots = asyncio.Semaphore(self.max_pending)
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.bot.engine = self
+        backup_task = asyncio.create_task(self.backups())
+        try:
+            await self.poll()
+        finally:
+            backup_task.cancel()
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            # ما بعد هذه النقطة (مثل إيقاف إشعارات الأدمن) يعود للناقل المتزامن
+            self.bot.engine = None
+            await self.off_loop(self.bot.update_tracker.save)
+            await self.off_loop(self.bot.save_conversation_state, True)
+            await self.off_loop(self.bot.admin_notifier.stop)
+            self.transport.close()
+
+    def run(self):
+        """تشغيل المحرك"""
+        logger.info("✅ نظام DUX الشامل يعمل بمحرك asyncio")
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            logger.info("تم إيقاف البوت")
+        finally:
+            self.executor.shutdown(wait=True)
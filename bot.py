@@ -9,11 +9,11 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import BOT_TOKEN
 from handlers import start, admin, broadcast, user_settings, announcements
 from services.broadcast_service import BroadcastService
+from services.fsm_storage import SQLAlchemyStorage
 
 logger = logging.getLogger(__name__)
 
@@ -44,8 +44,9 @@ async def main(async_session):
         # Set session maker for handlers
         session_maker = async_session
         
-        # Initialize dispatcher with memory storage
-        storage = MemoryStorage()
+        # Initialize dispatcher with database-backed FSM storage
+        # (conversations survive restarts and are shared between bot processes)
+        storage = SQLAlchemyStorage(async_session)
         dp = Dispatcher(storage=storage)
         
         # Initialize broadcast service
@@ -4,27 +4,81 @@
 import os
 import json
 import csv
-import urllib.request
-import urllib.parse
 import logging
 import threading
 import time
 import zipfile
 from datetime import datetime
 
+from telegram_transport import get_transport, RawJSON
+from update_dispatcher import UpdateDispatcher, KeyedLock, UpdateTracker
+from webhook_server import WebhookConfig, serve_webhook, delete_webhook
+from admin_notifier import AdminNotifier
+from paged_views import PagedViews, split_text, TELEGRAM_TEXT_LIMIT
+from state_store import StateStore
+from message_router import MessageRouter, state_step
+from dux_storage import (UserTable, EventLedger, SettingsStore, Catalog, StatsAggregator, UserSearchIndex,
+                         create_storage_backend,
+                         USER_FIELDS, TRANSACTION_FIELDS, COMPLAINT_FIELDS, COMPANY_FIELDS, PAYMENT_METHOD_FIELDS)
+
 # إعداد التسجيل
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# أزرار إعادة التعيين (أولوية قبل أي حالة)
+RESET_BUTTONS = ('🔄 إعادة تعيين النظام', '🔄 Reset System', '🔄 إعادة تعيين', '🆘 إصلاح شامل')
+
+# كلمات الموافقة والرفض وتحديث العنوان في أوامر الأدمن الحرة
+APPROVE_WORDS = ('موافقة', 'موافق', 'اوافق', 'أوافق', 'قبول', 'مقبول', 'تأكيد', 'تاكيد', 'نعم')
+REJECT_WORDS = ('رفض', 'رافض', 'لا', 'مرفوض', 'إلغاء', 'الغاء', 'منع')
+ADDRESS_WORDS = ('عنوان', 'العنوان', 'تحديث_عنوان')
+
 class ComprehensiveDUXBot:
-    def __init__(self, token):
+    def __init__(self, token, background_backups=True):
         self.token = token
         self.api_url = f"https://api.telegram.org/bot{token}"
-        self.offset = 0
-        self.user_states = {}
-        self.temp_company_data = {}  # إضافة المتغير المفقود
+        # ناقل HTTP مشترك باتصالات دائمة بدلاً من فتح اتصال جديد لكل طلب
+        self.transport = get_transport()
+        # محرك asyncio النشط (يضبطه AsyncBotEngine): الطلبات تمر عبر ناقله غير المتزامن
+        self.engine = None
+        # آخر تحديث مُعالج محفوظ على القرص: الاستئناف بعد إعادة التشغيل بدون تكرار
+        self.update_tracker = UpdateTracker('update_offset.json')
+        self.offset = self.update_tracker.watermark
+        # حالات المحادثات: صلاحية محدودة وحد أقصى للذاكرة ولقطات على القرص تُستعاد عند التشغيل
+        state_ttl = int(os.getenv('DUX_STATE_TTL', '86400'))
+        state_max = int(os.getenv('DUX_STATE_MAX', '10000'))
+        self.user_states = StateStore('user_states.json', ttl=state_ttl, max_entries=state_max)
+        self.temp_company_data = StateStore('temp_company_data.json', ttl=state_ttl, max_entries=state_max)
+        # قفل لكل مستخدم حول حالته في user_states أثناء المعالجة المتوازية
+        self.user_locks = KeyedLock()
+        # توزيع التحديثات على عمال متوازيين مع ترتيب رسائل كل محادثة
+        self.dispatcher = UpdateDispatcher(self.handle_update,
+                                           workers=int(os.getenv('DUX_WORKERS', '8')),
+                                           max_pending=int(os.getenv('DUX_MAX_PENDING', '1000')))
         self.init_files()
+        # محرك التخزين (CSV افتراضياً أو SQLite عبر DUX_STORAGE_BACKEND=sqlite)
+        self.storage = create_storage_backend()
+        # إحصائيات لوحة الأدمن تُحدّث مع كل كتابة في المستخدمين والمعاملات والشكاوى
+        self.stats = StatsAggregator()
+        # فهرس البحث في المستخدمين للأدمن (يُحدّث مع كل تسجيل أو تعديل)
+        self.user_search = UserSearchIndex()
+        self.users = UserTable(self.storage, listeners=[self.stats, self.user_search])
+        self.ledger = EventLedger(self.storage, 'events.jsonl', 'events_checkpoint.json', stats=self.stats)
+        self.settings = SettingsStore(self.storage)
+        self.catalog = Catalog(self.storage)
+        # عروض الأدمن المقسمة لصفحات (أزرار تنقل inline مع editMessageText)
+        self.paged_views = PagedViews()
+        self.paged_views.register('pending', self.render_pending_page, page_size=5)
+        self.paged_views.register('approved', self.render_approved_page, page_size=20)
+        self.paged_views.register('payment_methods', self.render_payment_methods_page, page_size=10)
+        self.paged_views.register('search', self.render_search_page, page_size=10)
+        # جداول توجيه الرسائل والأوامر
+        self.build_routes()
         self.admin_ids = self.get_admin_ids()
+        # إشعارات الأدمن في الخلفية (ADMIN_DIGEST_SECONDS لتجميعها في ملخص دوري)
+        self.admin_notifier = AdminNotifier(self.send_message, lambda: self.admin_ids,
+                                            digest_window=float(os.getenv('ADMIN_DIGEST_SECONDS', '0')))
+        self.admin_notifier.start()
         
         # تحميل معرفات الأدمن من متغيرات البيئة
         admin_ids_str = os.getenv("ADMIN_USER_IDS", "")
@@ -60,8 +114,9 @@ class ComprehensiveDUXBot:
         
         logger.info(f"تم تحميل {len(self.admin_user_ids)} مدير دائم: {self.admin_user_ids}")
         
-        # بدء نظام النسخ الاحتياطي التلقائي
-        self.start_backup_scheduler()
+        # بدء نظام النسخ الاحتياطي التلقائي (محرك asyncio يجدوله بنفسه)
+        if background_backups:
+            self.start_backup_scheduler()
         
     def init_files(self):
         """إنشاء جميع ملفات النظام"""
@@ -75,7 +130,7 @@ class ComprehensiveDUXBot:
         if not os.path.exists('transactions.csv'):
             with open('transactions.csv', 'w', newline='', encoding='utf-8-sig') as f:
                 writer = csv.writer(f)
-                writer.writerow(['id', 'customer_id', 'telegram_id', 'name', 'type', 'company', 'wallet_number', 'amount', 'exchange_address', 'status', 'date', 'admin_note', 'processed_by'])
+                writer.writerow(['id', 'customer_id', 'telegram_id', 'name', 'type', 'company', 'wallet_number', 'amount', 'exchange_address', 'status', 'date', 'admin_note', 'processed_by', 'currency'])
         
         # ملف الشركات
         if not os.path.exists('companies.csv'):
@@ -104,7 +159,7 @@ class ComprehensiveDUXBot:
         if not os.path.exists('complaints.csv'):
             with open('complaints.csv', 'w', newline='', encoding='utf-8-sig') as f:
                 writer = csv.writer(f)
-                writer.writerow(['id', 'customer_id', 'message', 'status', 'date', 'admin_response'])
+                writer.writerow(['id', 'customer_id', 'subject', 'message', 'status', 'date', 'admin_response'])
         
         # ملف إعدادات النظام
         if not os.path.exists('system_settings.csv'):
@@ -125,24 +180,26 @@ class ComprehensiveDUXBot:
         logger.info("تم إنشاء جميع ملفات النظام بنجاح")
         
     def api_call(self, method, data=None):
-        """استدعاء API مُحسن"""
+        """استدعاء API مُحسن (عبر الناقل غير المتزامن عند التشغيل بمحرك asyncio)"""
+        engine = self.engine
+        if engine is not None and engine.accepts_thread_calls():
+            return engine.call_from_thread(method, data)
         url = f"{self.api_url}/{method}"
         try:
             if data:
-                json_data = json.dumps(data).encode('utf-8')
-                req = urllib.request.Request(url, data=json_data)
-                req.add_header('Content-Type', 'application/json')
-            else:
-                req = urllib.request.Request(url)
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                return json.loads(response.read().decode('utf-8'))
+                return self.transport.post_json(url, data, timeout=10)
+            return self.transport.get_json(url, timeout=10)
         except Exception as e:
             logger.error(f"خطأ في API: {e}")
             return None
     
     def send_message(self, chat_id, text, keyboard=None):
-        """إرسال رسالة"""
+        """إرسال رسالة (النص الأطول من حد Telegram يُرسل على أجزاء والأزرار مع آخرها)"""
+        if len(text) > TELEGRAM_TEXT_LIMIT:
+            chunks = split_text(text)
+            for chunk in chunks[:-1]:
+                self.api_call('sendMessage', {'chat_id': chat_id, 'text': chunk, 'parse_mode': 'HTML'})
+            text = chunks[-1]
         data = {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}
         if keyboard:
             data['reply_markup'] = keyboard
@@ -152,8 +209,7 @@ class ComprehensiveDUXBot:
         """جلب التحديثات"""
         url = f"{self.api_url}/getUpdates?offset={self.offset + 1}&timeout=10"
         try:
-            with urllib.request.urlopen(url, timeout=15) as response:
-                return json.loads(response.read().decode('utf-8'))
+            return self.transport.get_json(url, timeout=15)
         except Exception as e:
             logger.error(f"خطأ في جلب التحديثات: {e}")
             return None
@@ -169,60 +225,33 @@ class ComprehensiveDUXBot:
                 int(telegram_id) in self.admin_user_ids or 
                 int(telegram_id) in self.temp_admin_user_ids)
     
-    def notify_admins(self, message):
-        """إشعار جميع الأدمن"""
-        for admin_id in self.admin_ids:
-            try:
-                self.send_message(admin_id, message, self.admin_keyboard())
-            except:
-                pass
+    def notify_admins(self, message, kind=None, summary=None):
+        """إشعار جميع الأدمن (في الخلفية، مع التجميع حسب النوع إن كان مفعلاً)"""
+        self.admin_notifier.notify(message, self.admin_keyboard(), kind, summary)
     
     def find_user(self, telegram_id):
         """البحث عن مستخدم"""
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['telegram_id'] == str(telegram_id):
-                        return row
-        except:
-            pass
+            return self.users.find_by_telegram_id(telegram_id)
+        except Exception as e:
+            logger.error(f"خطأ في البحث عن مستخدم: {e}")
         return None
     
     def get_companies(self, service_type=None):
         """جلب الشركات النشطة"""
-        companies = []
         try:
-            # التأكد من وجود الملف
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # التأكد من أن الشركة نشطة
-                    if row.get('is_active', '').lower() in ['active', 'yes', '1', 'true']:
-                        # فلترة حسب نوع الخدمة
-                        if not service_type:
-                            companies.append(row)
-                        elif row['type'] == service_type or row['type'] == 'both':
-                            companies.append(row)
-        except FileNotFoundError:
-            # إنشاء ملف الشركات إذا لم يكن موجوداً
-            with open('companies.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(['id', 'name', 'type', 'details', 'is_active'])
+            return self.catalog.active_companies(service_type or None)
         except Exception as e:
             # تسجيل الخطأ للتشخيص
             logger.error(f"خطأ في قراءة ملف الشركات: {e}")
-        
-        return companies
+        return []
     
     def get_exchange_address(self):
         """جلب عنوان الصرافة النشط"""
         try:
-            with open('exchange_addresses.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['is_active'] == 'yes':
-                        return row['address']
+            for row in self.storage.load('exchange_addresses'):
+                if row['is_active'] == 'yes':
+                    return row['address']
         except:
             pass
         return "العنوان غير متوفر حالياً"
@@ -230,57 +259,58 @@ class ComprehensiveDUXBot:
     def get_setting(self, key):
         """جلب إعداد النظام"""
         try:
-            with open('system_settings.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['setting_key'] == key:
-                        return row['setting_value']
-        except:
-            pass
+            return self.settings.get(key)
+        except Exception as e:
+            logger.error(f"خطأ في قراءة الإعداد {key}: {e}")
         return None
     
+    def cached_keyboard(self, key, build):
+        """لوحة مفاتيح بصيغة JSON جاهزة للإرسال، تُبنى مرة واحدة لكل مفتاح وإصدار من الكتالوج"""
+        return self.catalog.keyboard(key, lambda: RawJSON(json.dumps(build(), ensure_ascii=False)))
+    
     def main_keyboard(self, lang='ar', user_id=None):
-        """القائمة الرئيسية"""
-        if lang == 'ar':
-            keyboard = [
-                [{'text': '💰 طلب إيداع'}, {'text': '💸 طلب سحب'}],
-                [{'text': '📋 طلباتي'}, {'text': '👤 حسابي'}],
-                [{'text': '📨 شكوى'}, {'text': '🆘 دعم'}],
-                [{'text': '💱 تغيير العملة'}, {'text': '🔄 إعادة تعيين'}],
-                [{'text': '🇺🇸 English'}],
-                [{'text': '/admin'}]
-            ]
-            
-            # إضافة زر التسجيل للمستخدمين غير المسجلين
-            if user_id and not self.find_user(user_id):
-                keyboard.insert(-2, [{'text': '📝 تسجيل حساب'}])
-            
-            return {
-                'keyboard': keyboard,
-                'resize_keyboard': True
-            }
-        else:
-            keyboard = [
-                [{'text': '💰 Deposit Request'}, {'text': '💸 Withdrawal Request'}],
-                [{'text': '📋 My Requests'}, {'text': '👤 Profile'}],
-                [{'text': '📨 Complaint'}, {'text': '🆘 Support'}],
-                [{'text': '💱 Change Currency'}, {'text': '🔄 Reset System'}],
-                [{'text': '🇸🇦 العربية'}],
-                [{'text': '/admin'}]
-            ]
-            
-            # إضافة زر التسجيل للمستخدمين غير المسجلين
-            if user_id and not self.find_user(user_id):
-                keyboard.insert(-2, [{'text': '📝 Register Account'}])
+        """القائمة الرئيسية (محفوظة لكل لغة وحالة تسجيل)"""
+        lang = 'ar' if lang == 'ar' else 'en'
+        registered = not user_id or self.find_user(user_id) is not None
+        
+        def build():
+            if lang == 'ar':
+                keyboard = [
+                    [{'text': '💰 طلب إيداع'}, {'text': '💸 طلب سحب'}],
+                    [{'text': '📋 طلباتي'}, {'text': '👤 حسابي'}],
+                    [{'text': '📨 شكوى'}, {'text': '🆘 دعم'}],
+                    [{'text': '💱 تغيير العملة'}, {'text': '🔄 إعادة تعيين'}],
+                    [{'text': '🇺🇸 English'}],
+                    [{'text': '/admin'}]
+                ]
+                
+                # إضافة زر التسجيل للمستخدمين غير المسجلين
+                if not registered:
+                    keyboard.insert(-2, [{'text': '📝 تسجيل حساب'}])
+            else:
+                keyboard = [
+                    [{'text': '💰 Deposit Request'}, {'text': '💸 Withdrawal Request'}],
+                    [{'text': '📋 My Requests'}, {'text': '👤 Profile'}],
+                    [{'text': '📨 Complaint'}, {'text': '🆘 Support'}],
+                    [{'text': '💱 Change Currency'}, {'text': '🔄 Reset System'}],
+                    [{'text': '🇸🇦 العربية'}],
+                    [{'text': '/admin'}]
+                ]
+                
+                # إضافة زر التسجيل للمستخدمين غير المسجلين
+                if not registered:
+                    keyboard.insert(-2, [{'text': '📝 Register Account'}])
             
             return {
                 'keyboard': keyboard,
                 'resize_keyboard': True
             }
+        
+        return self.cached_keyboard(('main', lang, registered), build)
     
     def admin_keyboard(self):
         """لوحة مفاتيح الأدمن الشاملة"""
-        return {
+        return self.cached_keyboard(('admin',), lambda: {
             'keyboard': [
                 [{'text': '📋 الطلبات المعلقة'}, {'text': '✅ طلبات مُوافقة'}],
                 [{'text': '👥 إدارة المستخدمين'}, {'text': '🔍 البحث'}],
@@ -298,21 +328,23 @@ class ComprehensiveDUXBot:
             ],
             'resize_keyboard': True,
             'one_time_keyboard': False
-        }
+        })
     
-    def companies_keyboard(self, service_type):
-        """لوحة اختيار الشركات مع تحديث فوري"""
-        companies = self.get_companies(service_type)
-        keyboard = []
-        
-        # إضافة أزرار الشركات
-        for company in companies:
-            keyboard.append([{'text': f"🏢 {company['name']}"}])
-        
-        # إضافة أزرار العودة وإعادة التعيين
-        keyboard.append([{'text': '🔙 العودة للقائمة الرئيسية'}, {'text': '🔄 إعادة تعيين النظام'}])
+    def companies_keyboard(self, service_type, lang='ar'):
+        """لوحة اختيار الشركات (محفوظة حتى تعديل الشركات)"""
+        def build():
+            keyboard = []
+            
+            # إضافة أزرار الشركات
+            for company in self.get_companies(service_type):
+                keyboard.append([{'text': f"🏢 {company['name']}"}])
+            
+            # أزرار العودة وإعادة التعيين بنفس النص لكل اللغات لأن المعالجات تطابقها حرفياً
+            keyboard.append([{'text': '🔙 العودة للقائمة الرئيسية'}, {'text': '🔄 إعادة تعيين النظام'}])
+            
+            return {'keyboard': keyboard, 'resize_keyboard': True, 'one_time_keyboard': True}
         
-        return {'keyboard': keyboard, 'resize_keyboard': True, 'one_time_keyboard': True}
+        return self.cached_keyboard(('companies', service_type, lang), build)
     
     def handle_start(self, message):
         """معالج بداية المحادثة"""
@@ -440,14 +472,11 @@ class ComprehensiveDUXBot:
                 self.send_message(message['chat']['id'], "❌ يرجى مشاركة جهة الاتصال أو كتابة الرقم:")
                 return
             
-            # إنشاء رقم عميل تلقائي
-            customer_id = f"C{str(int(datetime.now().timestamp()))[-6:]}"
-            
-            # حفظ المستخدم
-            with open('users.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow([user_id, name, phone, customer_id, 'ar', 
-                               datetime.now().strftime('%Y-%m-%d'), 'no', ''])
+            # حفظ المستخدم (رقم العميل يُولّد تلقائياً دون تكرار)
+            customer_id = self.users.add_user({
+                'telegram_id': user_id, 'name': name, 'phone': phone,
+                'language': 'ar', 'date': datetime.now().strftime('%Y-%m-%d'), 'is_banned': 'no', 'ban_reason': ''
+            })['customer_id']
             
             welcome_text = f"""✅ تم التسجيل بنجاح!
 
@@ -468,7 +497,7 @@ class ComprehensiveDUXBot:
 📱 الهاتف: {phone}
 🆔 رقم العميل: {customer_id}
 📅 التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}"""
-            self.notify_admins(admin_msg)
+            self.notify_admins(admin_msg, 'member', f"{name} ({customer_id})")
     
     def create_deposit_request(self, message):
         """إنشاء طلب إيداع"""
@@ -518,9 +547,10 @@ class ComprehensiveDUXBot:
         """معالجة تدفق الإيداع الكامل"""
         user_id = message['from']['id']
         state = self.user_states.get(user_id, '')
+        step = state_step(state)
         text = message['text']
         
-        if state == 'selecting_deposit_company':
+        if step == 'selecting_deposit_company':
             # إزالة الرمز التعبيري من اسم الشركة
             selected_company_name = text.replace('🏢 ', '')
             
@@ -539,11 +569,7 @@ class ComprehensiveDUXBot:
             # عرض وسائل الدفع للشركة المختارة
             self.show_payment_method_selection(message, selected_company['id'], 'deposit')
             
-        elif state.startswith('deposit_wallet_'):
-            parts = state.split('_', 3)
-            company_id = parts[2]
-            company_name = parts[3] if len(parts) > 3 else ''
-            method_id = parts[4] if len(parts) > 4 else ''
+        elif step == 'deposit_wallet':
             wallet_number = text.strip()
             
             if len(wallet_number) < 5:
@@ -552,8 +578,8 @@ class ComprehensiveDUXBot:
             
             # الانتقال لمرحلة إدخال المبلغ
             user = self.find_user(user_id)
-            user_currency = user.get('currency', self.get_setting('default_currency') or 'SAR')
-            min_deposit = self.get_setting('min_deposit') or '50'
+            user_currency = user.get('currency', self.settings.get_str('default_currency', 'SAR'))
+            min_deposit = self.settings.get_decimal('min_deposit', '50')
             currency_symbol = self.get_currency_symbol(user_currency)
             amount_text = f"""✅ تم حفظ رقم المحفظة: {wallet_number}
 
@@ -563,20 +589,17 @@ class ComprehensiveDUXBot:
 💡 أدخل المبلغ بالأرقام فقط (مثال: 500)"""
             
             self.send_message(message['chat']['id'], amount_text)
-            self.user_states[user_id] = f'deposit_amount_{company_id}_{company_name}_{method_id}_{wallet_number}'
+            self.user_states[user_id] = dict(state, step='deposit_amount', wallet_number=wallet_number)
             
-        elif state.startswith('deposit_amount_'):
-            parts = state.split('_', 4)
-            company_id = parts[2]
-            company_name = parts[3]
-            method_id = parts[4] if len(parts) > 4 else ''
-            wallet_number = parts[5] if len(parts) > 5 else ''
+        elif step == 'deposit_amount':
+            company_name = state['company_name']
+            wallet_number = state['wallet_number']
             
             try:
                 amount = float(text.strip())
                 user = self.find_user(user_id)
-                user_currency = user.get('currency', self.get_setting('default_currency') or 'SAR')
-                min_deposit = float(self.get_setting('min_deposit') or '50')
+                user_currency = user.get('currency', self.settings.get_str('default_currency', 'SAR'))
+                min_deposit = self.settings.get_decimal('min_deposit', '50')
                 
                 if amount < min_deposit:
                     currency_symbol = self.get_currency_symbol(user_currency)
@@ -587,15 +610,14 @@ class ComprehensiveDUXBot:
                 self.send_message(message['chat']['id'], "❌ مبلغ غير صحيح. يرجى إدخال رقم صحيح:")
                 return
             
-            # إنشاء المعاملة
-            trans_id = f"DEP{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
-            # حفظ المعاملة
-            with open('transactions.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow([trans_id, user['customer_id'], user['telegram_id'], user['name'], 
-                               'deposit', company_name, wallet_number, amount, '', 'pending', 
-                               datetime.now().strftime('%Y-%m-%d %H:%M'), '', '', user_currency])
+            # حفظ المعاملة (المعرف DEP يُولّد داخل السجل دون تكرار)
+            trans_id = self.ledger.add_transaction({
+                'customer_id': user['customer_id'], 'telegram_id': user['telegram_id'],
+                'name': user['name'], 'type': 'deposit', 'company': company_name, 'wallet_number': wallet_number,
+                'amount': amount, 'exchange_address': '', 'status': 'pending',
+                'date': datetime.now().strftime('%Y-%m-%d %H:%M'), 'admin_note': '', 'processed_by': '',
+                'currency': user_currency
+            }, 'DEP')['id']
             
             # رسالة تأكيد للعميل
             confirmation = f"""✅ تم إرسال طلب الإيداع بنجاح
@@ -613,10 +635,8 @@ class ComprehensiveDUXBot:
             self.send_message(message['chat']['id'], confirmation, self.main_keyboard(user.get('language', 'ar')))
             del self.user_states[user_id]
             
-            # إشعار فوري للأدمن بطلب الإيداع
-            for admin_id in self.admin_ids:
-                try:
-                    admin_notification = f"""🔔 طلب إيداع جديد
+            # إشعار الأدمن بطلب الإيداع (في الخلفية)
+            admin_notification = f"""🔔 طلب إيداع جديد
 
 🆔 رقم المعاملة: {trans_id}
 👤 العميل: {user['name']} ({user['customer_id']})
@@ -626,17 +646,17 @@ class ComprehensiveDUXBot:
 📅 التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}
 
 لمراجعة الطلب: موافقة {trans_id} أو رفض {trans_id} [سبب]"""
-                    self.send_message(admin_id, admin_notification)
-                except:
-                    pass
+            self.admin_notifier.notify(admin_notification, kind='deposit',
+                                       summary=f"{trans_id} • {user['name']} • {self.format_amount_with_currency(amount, user_currency)}")
     
     def process_withdrawal_flow(self, message):
         """معالجة تدفق السحب الكامل"""
         user_id = message['from']['id']
         state = self.user_states.get(user_id, '')
+        step = state_step(state)
         text = message['text']
         
-        if state == 'selecting_withdraw_company':
+        if step == 'selecting_withdraw_company':
             # إزالة الرمز التعبيري من اسم الشركة
             selected_company_name = text.replace('🏢 ', '')
             
@@ -655,11 +675,7 @@ class ComprehensiveDUXBot:
             # عرض وسائل الدفع للشركة المختارة
             self.show_payment_method_selection(message, selected_company['id'], 'withdraw')
             
-        elif state.startswith('withdraw_wallet_'):
-            parts = state.split('_', 3)
-            company_id = parts[2]
-            company_name = parts[3] if len(parts) > 3 else ''
-            method_id = parts[4] if len(parts) > 4 else ''
+        elif step == 'withdraw_wallet':
             wallet_number = text.strip()
             
             if len(wallet_number) < 5:
@@ -668,9 +684,9 @@ class ComprehensiveDUXBot:
             
             # الانتقال لمرحلة إدخال المبلغ
             user = self.find_user(user_id)
-            user_currency = user.get('currency', self.get_setting('default_currency') or 'SAR')
-            min_withdrawal = self.get_setting('min_withdrawal') or '100'
-            max_withdrawal = self.get_setting('max_daily_withdrawal') or '10000'
+            user_currency = user.get('currency', self.settings.get_str('default_currency', 'SAR'))
+            min_withdrawal = self.settings.get_decimal('min_withdrawal', '100')
+            max_withdrawal = self.settings.get_decimal('max_daily_withdrawal', '10000')
             currency_symbol = self.get_currency_symbol(user_currency)
             amount_text = f"""✅ تم حفظ رقم المحفظة: {wallet_number}
 
@@ -681,21 +697,16 @@ class ComprehensiveDUXBot:
 💡 أدخل المبلغ بالأرقام فقط (مثال: 1000)"""
             
             self.send_message(message['chat']['id'], amount_text)
-            self.user_states[user_id] = f'withdraw_amount_{company_id}_{company_name}_{method_id}_{wallet_number}'
+            self.user_states[user_id] = dict(state, step='withdraw_amount', wallet_number=wallet_number)
             
-        elif state.startswith('withdraw_amount_'):
-            parts = state.split('_', 4)
-            company_id = parts[2]
-            company_name = parts[3]
-            method_id = parts[4] if len(parts) > 4 else ''
-            wallet_number = parts[5] if len(parts) > 5 else ''
+        elif step == 'withdraw_amount':
             
             try:
                 amount = float(text.strip())
                 user = self.find_user(user_id)
-                user_currency = user.get('currency', self.get_setting('default_currency') or 'SAR')
-                min_withdrawal = float(self.get_setting('min_withdrawal') or '100')
-                max_withdrawal = float(self.get_setting('max_daily_withdrawal') or '10000')
+                user_currency = user.get('currency', self.settings.get_str('default_currency', 'SAR'))
+                min_withdrawal = self.settings.get_decimal('min_withdrawal', '100')
+                max_withdrawal = self.settings.get_decimal('max_daily_withdrawal', '10000')
                 
                 if amount < min_withdrawal:
                     currency_symbol = self.get_currency_symbol(user_currency)
@@ -723,18 +734,15 @@ class ComprehensiveDUXBot:
 🔐 يرجى إرسال كود التأكيد:"""
             
             self.send_message(message['chat']['id'], confirm_text)
-            self.user_states[user_id] = f'withdraw_confirmation_code_{company_id}_{company_name}_{wallet_number}_{amount}_{withdrawal_address}'
-            
-
-        elif state.startswith('withdraw_confirmation_code_'):
-            # فصل البيانات من الحالة
-            data_part = state.replace('withdraw_confirmation_code_', '')
-            parts = data_part.split('_')
-            company_id = parts[0] if len(parts) > 0 else ''
-            company_name = parts[1] if len(parts) > 1 else ''
-            wallet_number = parts[2] if len(parts) > 2 else ''
-            amount = parts[3] if len(parts) > 3 else ''
-            withdrawal_address = parts[4] if len(parts) > 4 else ''
+            self.user_states[user_id] = dict(state, step='withdraw_confirmation_code', amount=amount,
+                                             withdrawal_address=withdrawal_address)
+            
+        elif step == 'withdraw_confirmation_code':
+            # بيانات الطلب من الحالة المنظمة (لا تتأثر بوجود _ في الاسم أو العنوان)
+            company_name = state['company_name']
+            wallet_number = state['wallet_number']
+            amount = state['amount']
+            withdrawal_address = state['withdrawal_address']
             confirmation_code = text.strip()
             
             if len(confirmation_code) < 3:
@@ -743,7 +751,7 @@ class ComprehensiveDUXBot:
             
             # التأكيد النهائي مع أزرار
             user = self.find_user(user_id)
-            user_currency = user.get('currency', self.get_setting('default_currency') or 'SAR')
+            user_currency = user.get('currency', self.settings.get_str('default_currency', 'SAR'))
             currency_symbol = self.get_currency_symbol(user_currency)
             final_confirm_text = f"""📋 مراجعة نهائية لطلب السحب:
 
@@ -766,31 +774,29 @@ class ComprehensiveDUXBot:
             }
             
             self.send_message(message['chat']['id'], final_confirm_text, confirm_keyboard)
-            self.user_states[user_id] = f'withdraw_final_confirm_{company_id}_{company_name}_{wallet_number}_{amount}_{withdrawal_address}_{confirmation_code}'
-            
-        elif state.startswith('withdraw_final_confirm_'):
-            # فصل البيانات من الحالة
-            data_part = state.replace('withdraw_final_confirm_', '')
-            parts = data_part.split('_')
-            company_id = parts[0] if len(parts) > 0 else ''
-            company_name = parts[1] if len(parts) > 1 else ''
-            wallet_number = parts[2] if len(parts) > 2 else ''
-            amount = parts[3] if len(parts) > 3 else ''
-            withdrawal_address = parts[4] if len(parts) > 4 else ''
-            confirmation_code = parts[5] if len(parts) > 5 else ''
+            self.user_states[user_id] = dict(state, step='withdraw_final_confirm', confirmation_code=confirmation_code)
+            
+        elif step == 'withdraw_final_confirm':
+            company_name = state['company_name']
+            wallet_number = state['wallet_number']
+            amount = state['amount']
+            withdrawal_address = state['withdrawal_address']
+            confirmation_code = state['confirmation_code']
             
             # معالجة أزرار التأكيد والإلغاء
             if text == '✅ تأكيد الطلب':
                 # إنشاء المعاملة
                 user = self.find_user(user_id)
-                trans_id = f"WTH{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                user_currency = user.get('currency', self.settings.get_str('default_currency', 'SAR'))
                 
-                # حفظ المعاملة مع عنوان السحب وكود التأكيد
-                with open('transactions.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([trans_id, user['customer_id'], user['telegram_id'], user['name'], 
-                                   'withdraw', company_name, wallet_number, amount, withdrawal_address, 'pending', 
-                                   datetime.now().strftime('%Y-%m-%d %H:%M'), confirmation_code, '', user_currency])
+                # حفظ المعاملة مع عنوان السحب وكود التأكيد (المعرف WTH يُولّد داخل السجل دون تكرار)
+                trans_id = self.ledger.add_transaction({
+                    'customer_id': user['customer_id'], 'telegram_id': user['telegram_id'],
+                    'name': user['name'], 'type': 'withdraw', 'company': company_name, 'wallet_number': wallet_number,
+                    'amount': amount, 'exchange_address': withdrawal_address, 'status': 'pending',
+                    'date': datetime.now().strftime('%Y-%m-%d %H:%M'), 'admin_note': confirmation_code,
+                    'processed_by': '', 'currency': user_currency
+                }, 'WTH')['id']
                 
                 # رسالة تأكيد للعميل
                 confirmation_msg = f"""✅ تم إرسال طلب السحب بنجاح
@@ -810,10 +816,8 @@ class ComprehensiveDUXBot:
                 self.send_message(message['chat']['id'], confirmation_msg, self.main_keyboard(user.get('language', 'ar')))
                 del self.user_states[user_id]
                 
-                # إشعار فوري للأدمن
-                for admin_id in self.admin_ids:
-                    try:
-                        admin_notification = f"""🔔 طلب سحب جديد
+                # إشعار الأدمن بطلب السحب (في الخلفية)
+                admin_notification = f"""🔔 طلب سحب جديد
 
 🆔 رقم المعاملة: {trans_id}
 👤 العميل: {user['name']} ({user['customer_id']})
@@ -825,9 +829,8 @@ class ComprehensiveDUXBot:
 📅 التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}
 
 لمراجعة الطلب: موافقة {trans_id} أو رفض {trans_id} [سبب]"""
-                        self.send_message(admin_id, admin_notification)
-                    except:
-                        pass
+                self.admin_notifier.notify(admin_notification, kind='withdraw',
+                                           summary=f"{trans_id} • {user['name']} • {amount} ريال")
                 
             elif text == '❌ إلغاء':
                 user = self.find_user(user_id)
@@ -860,27 +863,24 @@ class ComprehensiveDUXBot:
         found_transactions = False
         
         try:
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['customer_id'] == user['customer_id']:
-                        found_transactions = True
-                        status_emoji = "⏳" if row['status'] == 'pending' else "✅" if row['status'] == 'approved' else "❌"
-                        type_emoji = "💰" if row['type'] == 'deposit' else "💸"
+            for row in self.ledger.customer_transactions(user['customer_id']):
+                found_transactions = True
+                status_emoji = "⏳" if row['status'] == 'pending' else "✅" if row['status'] == 'approved' else "❌"
+                type_emoji = "💰" if row['type'] == 'deposit' else "💸"
                         
-                        transactions_text += f"{status_emoji} {type_emoji} {row['id']}\n"
-                        transactions_text += f"🏢 {row['company']}\n"
-                        transactions_text += f"💰 {row['amount']} ريال\n"
-                        transactions_text += f"📅 {row['date']}\n"
+                transactions_text += f"{status_emoji} {type_emoji} {row['id']}\n"
+                transactions_text += f"🏢 {row['company']}\n"
+                transactions_text += f"💰 {row['amount']} ريال\n"
+                transactions_text += f"📅 {row['date']}\n"
                         
-                        if row['status'] == 'rejected' and row.get('admin_note'):
-                            transactions_text += f"📝 السبب: {row['admin_note']}\n"
-                        elif row['status'] == 'approved':
-                            transactions_text += f"✅ تمت الموافقة\n"
-                        elif row['status'] == 'pending':
-                            transactions_text += f"⏳ قيد المراجعة\n"
+                if row['status'] == 'rejected' and row.get('admin_note'):
+                    transactions_text += f"📝 السبب: {row['admin_note']}\n"
+                elif row['status'] == 'approved':
+                    transactions_text += f"✅ تمت الموافقة\n"
+                elif row['status'] == 'pending':
+                    transactions_text += f"⏳ قيد المراجعة\n"
                         
-                        transactions_text += "\n"
+                transactions_text += "\n"
         except:
             pass
         
@@ -922,6 +922,152 @@ class ComprehensiveDUXBot:
         
         self.send_message(message['chat']['id'], admin_welcome, self.admin_keyboard())
     
+    def build_routes(self):
+        """بناء جداول توجيه الرسائل مرة واحدة عند التشغيل
+        
+        كل جدول قاموس للنصوص المطابقة وشجرة بادئات للأوامر ذات المعامل، فيتم التوجيه
+        ببحث واحد بدلاً من المرور على سلسلة if/elif.
+        """
+        # مراحل التسجيل والإيداع والسحب (قبل فحص المستخدم المسجل)
+        self.flow_routes = MessageRouter()
+        self.flow_routes.add_prefix('registering', self.handle_registration, with_rest=False)
+        self.flow_routes.add(['selecting_deposit_company', 'deposit_wallet', 'deposit_amount'],
+                             self.process_deposit_flow)
+        self.flow_routes.add(['selecting_withdraw_company', 'withdraw_wallet', 'withdraw_amount',
+                              'withdraw_confirmation_code', 'withdraw_final_confirm'],
+                             self.process_withdrawal_flow)
+        self.flow_routes.add('selecting_payment_method',
+                             lambda message: self.handle_payment_method_selection(message, message.get('text', '')))
+        
+        # أزرار قائمة المستخدم باللغتين
+        self.user_routes = MessageRouter()
+        self.user_routes.add(['💰 طلب إيداع', '💰 Deposit Request'], self.create_deposit_request)
+        self.user_routes.add(['💸 طلب سحب', '💸 Withdrawal Request'], self.create_withdrawal_request)
+        self.user_routes.add(['📋 طلباتي', '📋 My Requests'], self.show_user_transactions)
+        self.user_routes.add(['👤 حسابي', '👤 Profile'], self.show_user_profile)
+        self.user_routes.add(['📨 شكوى', '📨 Complaint'], self.handle_complaint_start)
+        self.user_routes.add(['🆘 دعم', '🆘 Support'], self.show_support_info)
+        self.user_routes.add(['🇺🇸 English', '🇸🇦 العربية'],
+                             lambda message: self.handle_language_change(message, message['text']))
+        self.user_routes.add(['💱 تغيير العملة', '💱 Change Currency'], self.show_currency_selection)
+        # بدء عملية التسجيل للمستخدمين غير المسجلين
+        self.user_routes.add(['📝 تسجيل حساب', '📝 Register Account'], self.start_registration)
+        self.user_routes.add('/myid', self.send_user_id)
+        self.user_routes.add(['🔙 العودة للقائمة الرئيسية', '🔙 العودة', '⬅️ العودة', '🏠 الرئيسية',
+                              '🏠 القائمة الرئيسية', '🆘 إصلاح', 'reset', 'fix'] + list(RESET_BUTTONS),
+                             self.reset_user_session)
+        
+        # حالات المستخدم التي تستقبل نصاً حراً
+        self.user_state_routes = MessageRouter()
+        self.user_state_routes.add('writing_complaint', lambda message: self.save_complaint(message, message['text']))
+        self.user_state_routes.add('selecting_currency',
+                                   lambda message: self.handle_currency_selection(message, message['text']))
+        
+        # حالات معالجات الأدمن (البادئة تحمل معرف الشركة أو الوسيلة أو الشكوى)
+        self.admin_state_routes = MessageRouter()
+        self.admin_state_routes.add('admin_broadcasting',
+                                    lambda message: self.send_broadcast_message(message, message.get('text', '')))
+        self.admin_state_routes.add_prefix('adding_company_', self.handle_company_wizard, with_rest=False)
+        self.admin_state_routes.add_prefix('editing_company_', self.handle_company_edit_wizard, with_rest=False)
+        self.admin_state_routes.add('selecting_company_edit', self.handle_company_edit_wizard)
+        self.admin_state_routes.add('confirming_company_delete', self.handle_company_delete_confirmation)
+        self.admin_state_routes.add_prefix('deleting_company_', self.finalize_company_delete)
+        self.admin_state_routes.add('sending_user_message_id', self.handle_user_message_id)
+        self.admin_state_routes.add_prefix('sending_user_message_', self.handle_user_message_content)
+        self.admin_state_routes.add('selecting_method_to_edit', self.handle_method_edit_selection)
+        self.admin_state_routes.add('selecting_method_to_delete', self.handle_method_delete_selection)
+        self.admin_state_routes.add_prefix('editing_method_', self.handle_method_edit_data)
+        self.admin_state_routes.add('adding_payment_simple', self.handle_simple_payment_company_selection)
+        self.admin_state_routes.add_prefix('adding_payment_method_', self.handle_simple_payment_method_data,
+                                           with_rest=False)
+        self.admin_state_routes.add('selecting_method_to_edit_simple', self.handle_simple_method_edit_selection)
+        self.admin_state_routes.add('selecting_method_to_delete_simple', self.handle_simple_method_delete_selection)
+        self.admin_state_routes.add_prefix('editing_method_simple_', self.handle_simple_method_edit_data)
+        self.admin_state_routes.add('selecting_method_to_disable', self.handle_method_disable_selection)
+        self.admin_state_routes.add('selecting_method_to_enable', self.handle_method_enable_selection)
+        self.admin_state_routes.add_prefix('replying_to_complaint_', self.handle_complaint_reply_buttons)
+        self.admin_state_routes.add_prefix('editing_support_', lambda message: self.handle_support_data_edit(
+            message, self.user_states.get(message['from']['id'])), with_rest=False)
+        
+        # أزرار لوحة الأدمن
+        self.admin_routes = MessageRouter()
+        admin_buttons = {
+            '📋 الطلبات المعلقة': self.show_pending_requests,
+            '✅ طلبات مُوافقة': self.show_approved_transactions,
+            '👥 إدارة المستخدمين': self.show_users_management,
+            '🔍 البحث': self.prompt_admin_search,
+            '👥 إدارة الأدمن': self.show_admin_management,
+            '📋 عرض قائمة المديرين': self.show_detailed_admin_list,
+            '➕ إضافة مدير دائم': self.prompt_add_permanent_admin,
+            '🕐 إضافة مدير مؤقت': self.prompt_add_temp_admin,
+            '➖ إزالة مدير': self.prompt_remove_admin,
+            '📊 إحصائيات المديرين': self.show_admin_statistics,
+            '🆔 معرف المستخدم': self.send_user_id,
+            '💳 وسائل الدفع': self.show_payment_methods_management,
+            '📊 الإحصائيات': self.show_detailed_stats,
+            '📊 تقرير Excel احترافي': self.generate_professional_excel_report,
+            '📢 إرسال جماعي': self.prompt_broadcast,
+            '🚫 حظر مستخدم': self.prompt_ban_user,
+            '✅ إلغاء حظر': self.prompt_unban_user,
+            '📝 إضافة شركة': self.start_add_company_wizard,
+            '⚙️ إدارة الشركات': self.show_companies_management_enhanced,
+            '🔄 تحديث القائمة': self.show_companies_management_enhanced,
+            '➕ إضافة شركة جديدة': self.prompt_add_company,
+            '✏️ تعديل شركة': self.prompt_edit_company,
+            '🗑️ حذف شركة': self.prompt_delete_company,
+            '↩️ العودة للوحة الأدمن': self.handle_admin_panel,
+            '🏠 لوحة الأدمن': self.handle_admin_panel,
+            '↩️ العودة': self.admin_go_back,
+            '🔙 العودة': self.admin_go_back,
+            '⬅️ العودة': self.admin_go_back,
+            '📍 إدارة العناوين': self.show_addresses_management,
+            '🛠️ تعديل بيانات الدعم': self.show_support_data_editor,
+            '📞 تعديل رقم الهاتف': self.start_phone_edit_wizard,
+            '💬 تعديل حساب التليجرام': self.start_telegram_edit_wizard,
+            '📧 تعديل البريد الإلكتروني': self.start_email_edit_wizard,
+            '🕒 تعديل ساعات العمل': self.start_hours_edit_wizard,
+            '🔄 تحديث بيانات الدعم': self.show_support_data_editor,
+            '⚙️ إعدادات النظام': self.show_system_settings,
+            '📨 الشكاوى': self.show_complaints_admin,
+            '🔄 تحديث الشكاوى': self.show_complaints_admin,
+            '🔄 تحديث': self.show_complaints_admin,
+            '📋 نسخ أوامر سريعة': self.show_quick_copy_commands,
+            '📧 إرسال رسالة لعميل': self.start_send_user_message,
+            '💾 نسخة احتياطية فورية': self.manual_backup_command,
+            '➕ إضافة وسيلة دفع': self.start_simple_payment_method_wizard,
+            '✏️ تعديل وسيلة دفع': self.start_edit_payment_method_wizard,
+            '🗑️ حذف وسيلة دفع': self.start_delete_payment_method_wizard,
+            '📊 عرض وسائل الدفع': self.show_all_payment_methods_simplified,
+            '⏹️ إيقاف وسيلة دفع': self.start_disable_payment_method_wizard,
+            '▶️ تشغيل وسيلة دفع': self.start_enable_payment_method_wizard,
+            '🏠 القائمة الرئيسية': self.admin_exit_to_main,
+            '🏠 الرئيسية': self.admin_exit_to_main,
+            '✅ حفظ الشركة': self.save_new_company,
+            '✅ حفظ التغييرات': self.save_company_changes_command,
+            '❌ إلغاء': self.cancel_admin_operation,
+            'إلغاء': self.cancel_admin_operation,
+            'الغاء': self.cancel_admin_operation,
+        }
+        for button, handler in admin_buttons.items():
+            self.admin_routes.add(button, handler)
+        
+        # أوامر الأدمن النصية: البادئة ثم المعامل
+        self.admin_routes.add_prefix('حظر ', self.ban_command)
+        self.admin_routes.add_prefix(['الغاء_حظر ', 'الغاء حظر '], self.unban_command)
+        self.admin_routes.add_prefix('موافقة ', self.approve_command)
+        self.admin_routes.add_prefix('رفض ', self.reject_command)
+        self.admin_routes.add_prefix('📞 رد على ', self.start_complaint_reply_wizard)
+        self.admin_routes.add_prefix('بحث ', self.search_users_admin)
+        self.admin_routes.add_prefix(['اضافة_ادمن ', 'اضافة ادمن '], self.add_admin_user)
+        self.admin_routes.add_prefix('ادمن_مؤقت ', self.add_temp_admin)
+        self.admin_routes.add_prefix('ازالة_ادمن ', self.remove_admin_user)
+        self.admin_routes.add_prefix('اضافة_شركة ', lambda message: self.add_company_simple_with_display(
+            message, message['text']), with_rest=False)
+        self.admin_routes.add_prefix('حذف_شركة ', self.delete_company_simple)
+        self.admin_routes.add_prefix('عنوان_جديد ', self.update_address_simple)
+        self.admin_routes.add_prefix('تعديل_اعداد ', lambda message: self.update_setting_simple(
+            message, message['text']), with_rest=False)
+    
     def process_message(self, message):
         """معالج الرسائل الرئيسي"""
         if 'text' not in message and 'contact' not in message:
@@ -937,35 +1083,14 @@ class ComprehensiveDUXBot:
             return
             
         # معالجة زر إعادة التعيين أولاً (أولوية عالية)
-        if text in ['🔄 إعادة تعيين النظام', '🔄 Reset System', '🔄 إعادة تعيين', '🆘 إصلاح شامل']:
-            user = self.find_user(user_id)
-            if user:
-                self.super_reset_user_system(user_id, chat_id, user)
-            else:
-                self.handle_start(message)
+        if text in RESET_BUTTONS:
+            self.reset_user_session(message)
             return
         
-        # معالجة الحالات المختلفة
-        if user_id in self.user_states:
-            state = self.user_states[user_id]
-            
-            # معالجة التسجيل
-            if isinstance(state, str) and state.startswith('registering'):
-                self.handle_registration(message)
-                return
-            
-            # معالجة الإيداع والسحب
-            elif isinstance(state, str) and ('deposit' in state or 'withdraw' in state):
-                if 'deposit' in state:
-                    self.process_deposit_flow(message)
-                else:
-                    self.process_withdrawal_flow(message)
-                return
-            
-            # معالجة اختيار وسيلة الدفع
-            elif isinstance(state, dict) and state.get('step') == 'selecting_payment_method':
-                self.handle_payment_method_selection(message, text)
-                return
+        # معالجة مراحل التسجيل والإيداع والسحب واختيار وسيلة الدفع
+        state = self.user_states.get(user_id)
+        if state is not None and self.flow_routes.dispatch(state_step(state), message):
+            return
         
         # فحص المستخدم المسجل
         user = self.find_user(user_id)
@@ -986,146 +1111,66 @@ class ComprehensiveDUXBot:
                 return
             
             # معالجة حالات الأدمن الخاصة
-            if user_id in self.user_states:
-                admin_state = self.user_states[user_id]
-                if isinstance(admin_state, str):
-                    if admin_state == 'admin_broadcasting':
-                        self.send_broadcast_message(message, text)
-                        return
-                    elif admin_state.startswith('adding_company_'):
-                        self.handle_company_wizard(message)
-                        return
-                    elif admin_state.startswith('editing_company_') or admin_state == 'selecting_company_edit':
-                        self.handle_company_edit_wizard(message)
-                        return
-                    elif admin_state == 'confirming_company_delete':
-                        self.handle_company_delete_confirmation(message)
-                        return
-                    elif admin_state.startswith('deleting_company_'):
-                        company_id = admin_state.replace('deleting_company_', '')
-                        self.finalize_company_delete(message, company_id)
-                        return
-                    elif admin_state == 'sending_user_message_id':
-                        self.handle_user_message_id(message)
-                        return
-                    elif admin_state.startswith('sending_user_message_'):
-                        customer_id = admin_state.replace('sending_user_message_', '')
-                        self.handle_user_message_content(message, customer_id)
-                        return
-                    elif admin_state == 'selecting_method_to_edit':
-                        self.handle_method_edit_selection(message)
-                        return
-                    elif admin_state == 'selecting_method_to_delete':
-                        self.handle_method_delete_selection(message)
-                        return
-                    elif admin_state.startswith('editing_method_'):
-                        method_id = admin_state.replace('editing_method_', '')
-                        self.handle_method_edit_data(message, method_id)
-                        return
-                    elif admin_state == 'adding_payment_simple':
-                        self.handle_simple_payment_company_selection(message)
-                        return
-                    elif admin_state.startswith('adding_payment_method_'):
-                        self.handle_simple_payment_method_data(message)
-                        return
-                    elif admin_state == 'selecting_method_to_edit_simple':
-                        self.handle_simple_method_edit_selection(message)
-                        return
-                    elif admin_state == 'selecting_method_to_delete_simple':
-                        self.handle_simple_method_delete_selection(message)
-                        return
-                    elif admin_state.startswith('editing_method_simple_'):
-                        method_id = admin_state.replace('editing_method_simple_', '')
-                        self.handle_simple_method_edit_data(message, method_id)
-                        return
-                    elif admin_state == 'selecting_method_to_disable':
-                        self.handle_method_disable_selection(message)
-                        return
-                    elif admin_state == 'selecting_method_to_enable':
-                        self.handle_method_enable_selection(message)
-                        return
-                    elif admin_state.startswith('replying_to_complaint_'):
-                        complaint_id = admin_state.replace('replying_to_complaint_', '')
-                        self.handle_complaint_reply_buttons(message, complaint_id)
-                        return
-                    elif admin_state.startswith('editing_support_'):
-                        self.handle_support_data_edit(message, admin_state)
-                        return
-
+            if isinstance(state, str) and self.admin_state_routes.dispatch(state, message):
+                return
             
             # معالجة النصوص والأزرار للأدمن
             self.handle_admin_actions(message)
             return
         
-        # جلب عملة المستخدم أو العملة الافتراضية
-        user_currency = user.get('currency', self.get_setting('default_currency') or 'SAR')
-        
-        # معالجة القوائم الرئيسية للمستخدمين
-        if text in ['💰 طلب إيداع', '💰 Deposit Request']:
-            logger.info(f"معالجة طلب إيداع من {user_id}")
-            self.create_deposit_request(message)
-        elif text in ['💸 طلب سحب', '💸 Withdrawal Request']:
-            logger.info(f"معالجة طلب سحب من {user_id}")
-            self.create_withdrawal_request(message)
-        elif text in ['📋 طلباتي', '📋 My Requests']:
-            self.show_user_transactions(message)
-        elif text in ['👤 حسابي', '👤 Profile']:
-            self.show_user_profile(message)
-        elif text in ['📨 شكوى', '📨 Complaint']:
-            self.handle_complaint_start(message)
-        elif text in ['🆘 دعم', '🆘 Support']:
-            support_text = f"""🆘 الدعم الفني
-
-📞 رقم الهاتف: {self.get_setting('support_phone') or '+966501234567'}
-⏰ ساعات العمل: 24/7
-🏢 الشركة: DUX
-
-يمكنك أيضاً إرسال شكوى من خلال النظام"""
-            self.send_message(chat_id, support_text, self.main_keyboard(user.get('language', 'ar'), user_id))
-        elif text in ['🇺🇸 English', '🇸🇦 العربية']:
-            self.handle_language_change(message, text)
-        elif text in ['💱 تغيير العملة', '💱 Change Currency']:
-            self.show_currency_selection(message)
-        elif text in ['📝 تسجيل حساب', '📝 Register Account']:
-            # بدء عملية التسجيل للمستخدمين غير المسجلين
-            self.start_registration(message)
-        elif text == '/myid':
-            self.send_message(chat_id, f"🆔 معرف المستخدم الخاص بك: {user_id}")
-        elif text in ['🔙 العودة للقائمة الرئيسية', '🔙 العودة', '⬅️ العودة', '🏠 الرئيسية', '🏠 القائمة الرئيسية', '🔄 إعادة تعيين', '🔄 إعادة تعيين النظام', '🆘 إصلاح', 'reset', 'fix', '🔄 Reset System', '🆘 إصلاح شامل']:
-            # إجراء إعادة تعيين شاملة وقوية
-            self.super_reset_user_system(user_id, chat_id, user)
-        else:
-            # معالجة حالات المستخدم الخاصة
-            if user_id in self.user_states:
-                state = self.user_states[user_id]
-                if state == 'writing_complaint':
-                    self.save_complaint(message, text)
-                    return
-                elif state == 'selecting_currency':
-                    self.handle_currency_selection(message, text)
-                    return
-            
-            # رسالة خطأ محسنة مع زر إصلاح قوي
-            error_keyboard = {
-                'keyboard': [
-                    [{'text': '🔄 إعادة تعيين النظام'}, {'text': '🆘 إصلاح شامل'}],
-                    [{'text': '💰 طلب إيداع'}, {'text': '💸 طلب سحب'}],
-                    [{'text': '📋 طلباتي'}, {'text': '👤 حسابي'}],
-                    [{'text': '🏠 القائمة الرئيسية'}]
-                ],
-                'resize_keyboard': True,
-                'one_time_keyboard': True
-            }
-            
-            error_msg = f"""❌ أمر غير مفهوم أو خطأ في النظام
+        # معالجة القوائم الرئيسية للمستخدمين ثم حالات المستخدم الخاصة
+        if self.user_routes.dispatch(text, message):
+            return
+        if isinstance(state, str) and self.user_state_routes.dispatch(state, message):
+            return
+        
+        # رسالة خطأ محسنة مع زر إصلاح قوي
+        error_keyboard = self.cached_keyboard(('unknown_command',), lambda: {
+            'keyboard': [
+                [{'text': '🔄 إعادة تعيين النظام'}, {'text': '🆘 إصلاح شامل'}],
+                [{'text': '💰 طلب إيداع'}, {'text': '💸 طلب سحب'}],
+                [{'text': '📋 طلباتي'}, {'text': '👤 حسابي'}],
+                [{'text': '🏠 القائمة الرئيسية'}]
+            ],
+            'resize_keyboard': True,
+            'one_time_keyboard': True
+        })
+        
+        error_msg = f"""❌ أمر غير مفهوم أو خطأ في النظام
 
 🔧 لحل أي مشكلة، اختر:
 • 🔄 إعادة تعيين النظام - إصلاح بسيط
 • 🆘 إصلاح شامل - حل جميع المشاكل
 
 أو اختر من الخدمات المتاحة:"""
-            
-            self.send_message(chat_id, error_msg, error_keyboard)
+        
+        self.send_message(chat_id, error_msg, error_keyboard)
+    
+    def reset_user_session(self, message):
+        """إعادة تعيين شاملة لجلسة المستخدم (أو البدء من جديد لغير المسجل)"""
+        user = self.find_user(message['from']['id'])
+        if user:
+            self.super_reset_user_system(message['from']['id'], message['chat']['id'], user)
+        else:
+            self.handle_start(message)
+    
+    def send_user_id(self, message):
+        """إرسال معرف المستخدم"""
+        keyboard = self.admin_keyboard() if self.is_admin(message['from']['id']) else None
+        self.send_message(message['chat']['id'], f"🆔 معرف المستخدم الخاص بك: {message['from']['id']}", keyboard)
+    
+    def show_support_info(self, message):
+        """عرض بيانات الدعم الفني"""
+        user = self.find_user(message['from']['id']) or {}
+        support_text = f"""🆘 الدعم الفني
+
+📞 رقم الهاتف: {self.settings.get_str('support_phone', '+966501234567')}
+⏰ ساعات العمل: 24/7
+🏢 الشركة: DUX
+
+يمكنك أيضاً إرسال شكوى من خلال النظام"""
+        self.send_message(message['chat']['id'], support_text,
+                          self.main_keyboard(user.get('language', 'ar'), message['from']['id']))
     
     def start_registration(self, message):
         """بدء عملية التسجيل للمستخدمين غير المسجلين"""
@@ -1263,234 +1308,113 @@ class ComprehensiveDUXBot:
             logger.error(f"خطأ في فحص ملفات النظام: {e}")
 
     def handle_admin_actions(self, message):
-        """معالجة إجراءات الأدمن"""
+        """معالجة إجراءات الأدمن: الأزرار والأوامر النصية عبر جدول التوجيه"""
         text = message['text']
-        chat_id = message['chat']['id']
-        user_id = message['from']['id']
         
-        # الأزرار الرئيسية
-        if text == '📋 الطلبات المعلقة':
-            self.show_pending_requests(message)
-        elif text == '✅ طلبات مُوافقة':
-            self.show_approved_transactions(message)
-        elif text == '👥 إدارة المستخدمين':
-            self.show_users_management(message)
-        elif text == '🔍 البحث':
-            self.prompt_admin_search(message)
-        elif text == '👥 إدارة الأدمن':
-            self.show_admin_management(message)
-        elif text == '📋 عرض قائمة المديرين':
-            self.show_detailed_admin_list(message)
-        elif text == '➕ إضافة مدير دائم':
-            self.prompt_add_permanent_admin(message)
-        elif text == '🕐 إضافة مدير مؤقت':
-            self.prompt_add_temp_admin(message)
-        elif text == '➖ إزالة مدير':
-            self.prompt_remove_admin(message)
-        elif text == '📊 إحصائيات المديرين':
-            self.show_admin_statistics(message)
-        elif text == '🆔 معرف المستخدم':
-            self.send_message(message['chat']['id'], f"🆔 معرف المستخدم الخاص بك: {message['from']['id']}", self.admin_keyboard())
-        elif text == '💳 وسائل الدفع':
-            self.show_payment_methods_management(message)
-        elif text == '📊 الإحصائيات':
-            self.show_detailed_stats(message)
-        elif text == '📊 تقرير Excel احترافي':
-            self.generate_professional_excel_report(message)
-        elif text == '📢 إرسال جماعي':
-            self.prompt_broadcast(message)
-        elif text == '🚫 حظر مستخدم':
-            self.prompt_ban_user(message)
-        elif text == '✅ إلغاء حظر':
-            self.prompt_unban_user(message)
-        
-        # معالجة أوامر النص المباشرة
-        elif text.startswith('حظر '):
-            parts = text.split(' ', 2)
-            if len(parts) >= 3:
-                customer_id = parts[1]
-                reason = parts[2]
-                self.ban_user_admin(message, customer_id, reason)
-            else:
-                self.send_message(chat_id, "❌ الصيغة الصحيحة:\nحظر [رقم_العميل] [سبب_الحظر]\nمثال: حظر C810563 مخالفة الشروط", self.admin_keyboard())
+        if self.admin_routes.dispatch(text, message):
+            return
         
-        elif text.startswith('الغاء_حظر ') or text.startswith('الغاء حظر '):
-            customer_id = text.replace('الغاء_حظر ', '').replace('الغاء حظر ', '').strip()
-            if customer_id:
-                self.unban_user_admin(message, customer_id)
+        # أوامر نصية للأدمن (مبسطة مع احتمالات متعددة)
+        lowered = text.lower()
+        if any(word in lowered for word in APPROVE_WORDS):
+            self.approve_command(message, text)
+        elif any(word in lowered for word in REJECT_WORDS):
+            self.reject_command(message, text)
+        elif any(word in lowered for word in ADDRESS_WORDS):
+            # استخراج العنوان الجديد
+            new_address = text
+            for word in ADDRESS_WORDS:
+                new_address = new_address.replace(word, '').strip()
+            if new_address:
+                self.update_address_simple(message, new_address)
             else:
-                self.send_message(chat_id, "❌ الصيغة الصحيحة:\nالغاء_حظر [رقم_العميل]\nمثال: الغاء_حظر C810563", self.admin_keyboard())
-        elif text == '📝 إضافة شركة':
-            self.start_add_company_wizard(message)
-        elif text == '⚙️ إدارة الشركات':
-            self.show_companies_management_enhanced(message)
-        elif text == '🔄 تحديث القائمة':
-            self.show_companies_management_enhanced(message)
-        elif text == '➕ إضافة شركة جديدة':
-            self.prompt_add_company(message)
-        elif text == '✏️ تعديل شركة':
-            self.prompt_edit_company(message)
-        elif text == '🗑️ حذف شركة':
-            self.prompt_delete_company(message)
-        elif text == '🔄 تحديث القائمة':
+                self.send_message(message['chat']['id'], "يرجى كتابة العنوان الجديد. مثال: عنوان شارع الملك فهد", self.admin_keyboard())
+        else:
+            self.send_message(message['chat']['id'], "أمر غير مفهوم. استخدم الأزرار أو الأوامر الصحيحة.", self.admin_keyboard())
+    
+    @staticmethod
+    def find_transaction_id(words):
+        """موضع ورقم المعاملة (DEP/WTH) في كلمات الأمر، أو (-1, None)"""
+        for i, word in enumerate(words):
+            if word.startswith(('DEP', 'WTH')):
+                return i, word
+        return -1, None
+    
+    def approve_command(self, message, args):
+        """موافقة [رقم_المعاملة]"""
+        _, trans_id = self.find_transaction_id(args.split())
+        if trans_id:
+            self.approve_transaction(message, trans_id)
+        else:
+            self.send_message(message['chat']['id'], "❌ لم يتم العثور على رقم المعاملة. مثال: موافقة DEP123456", self.admin_keyboard())
+    
+    def reject_command(self, message, args):
+        """رفض [رقم_المعاملة] [السبب]"""
+        words = args.split()
+        index, trans_id = self.find_transaction_id(words)
+        if trans_id:
+            reason = ' '.join(words[index + 1:]) or 'غير محدد'
+            self.reject_transaction(message, trans_id, reason)
+        else:
+            self.send_message(message['chat']['id'], "❌ لم يتم العثور على رقم المعاملة. مثال: رفض DEP123456 سبب الرفض", self.admin_keyboard())
+    
+    def ban_command(self, message, args):
+        """حظر [رقم_العميل] [سبب_الحظر]"""
+        parts = args.split(' ', 1)
+        if len(parts) == 2 and parts[1].strip():
+            self.ban_user_admin(message, parts[0], parts[1].strip())
+        else:
+            self.send_message(message['chat']['id'], "❌ الصيغة الصحيحة:\nحظر [رقم_العميل] [سبب_الحظر]\nمثال: حظر C810563 مخالفة الشروط", self.admin_keyboard())
+    
+    def unban_command(self, message, customer_id):
+        """الغاء_حظر [رقم_العميل]"""
+        if customer_id:
+            self.unban_user_admin(message, customer_id)
+        else:
+            self.send_message(message['chat']['id'], "❌ الصيغة الصحيحة:\nالغاء_حظر [رقم_العميل]\nمثال: الغاء_حظر C810563", self.admin_keyboard())
+    
+    def admin_go_back(self, message):
+        """العودة للقائمة المناسبة حسب حالة الأدمن"""
+        user_state = state_step(self.user_states.get(message['from']['id']))
+        if 'payment' in user_state or 'method' in user_state:
+            self.show_payment_methods_management(message)
+        elif 'company' in user_state:
             self.show_companies_management_enhanced(message)
-        elif text in ['↩️ العودة للوحة الأدمن', '🏠 لوحة الأدمن']:
+        else:
             self.handle_admin_panel(message)
-        elif text in ['↩️ العودة', '🔙 العودة', '⬅️ العودة']:
-            # تحديد السياق المناسب للعودة حسب الحالة
-            user_state = self.user_states.get(message['from']['id'])
-            if user_state:
-                if 'payment' in str(user_state) or 'method' in str(user_state):
-                    self.show_payment_methods_management(message)
-                elif 'company' in str(user_state):
-                    self.show_companies_management_enhanced(message)
-                else:
-                    self.handle_admin_panel(message)
-            else:
-                self.handle_admin_panel(message)
-        elif text == '📍 إدارة العناوين':
-            self.show_addresses_management(message)
-        elif text == '🛠️ تعديل بيانات الدعم':
-            self.show_support_data_editor(message)
-        elif text == '📞 تعديل رقم الهاتف':
-            self.start_phone_edit_wizard(message)
-        elif text == '💬 تعديل حساب التليجرام':
-            self.start_telegram_edit_wizard(message)
-        elif text == '📧 تعديل البريد الإلكتروني':
-            self.start_email_edit_wizard(message)
-        elif text == '🕒 تعديل ساعات العمل':
-            self.start_hours_edit_wizard(message)
-        elif text == '🔄 تحديث بيانات الدعم':
-            self.show_support_data_editor(message)
-        elif text == '⚙️ إعدادات النظام':
-            self.show_system_settings(message)
-        elif text == '📨 الشكاوى':
-            self.show_complaints_admin(message)
-        elif text in ['🔄 تحديث الشكاوى', '🔄 تحديث']:
-            self.show_complaints_admin(message)
-        elif text.startswith('📞 رد على '):
-            complaint_id = text.replace('📞 رد على ', '').strip()
-            self.start_complaint_reply_wizard(message, complaint_id)
-        elif text == '📋 نسخ أوامر سريعة':
-            self.show_quick_copy_commands(message)
-        elif text == '📧 إرسال رسالة لعميل':
-            self.start_send_user_message(message)
-        elif text == '💾 نسخة احتياطية فورية':
-            self.manual_backup_command(message)
-        elif text == '➕ إضافة وسيلة دفع':
-            self.start_simple_payment_method_wizard(message)
-        elif text == '✏️ تعديل وسيلة دفع':
-            self.start_edit_payment_method_wizard(message)
-        elif text == '🗑️ حذف وسيلة دفع':
-            self.start_delete_payment_method_wizard(message)
-        elif text == '📊 عرض وسائل الدفع':
-            self.show_all_payment_methods_simplified(message)
-        elif text == '⏹️ إيقاف وسيلة دفع':
-            self.start_disable_payment_method_wizard(message)
-        elif text == '▶️ تشغيل وسيلة دفع':
-            self.start_enable_payment_method_wizard(message)
-        elif text in ['🏠 القائمة الرئيسية', '🏠 الرئيسية']:
-            # إنهاء جلسة الأدمن والعودة للقائمة الرئيسية
-            if message['from']['id'] in self.user_states:
-                del self.user_states[message['from']['id']]
-            user = self.find_user(message['from']['id'])
-            if user:
-                welcome_text = f"""🏠 مرحباً بك مرة أخرى
+    
+    def admin_exit_to_main(self, message):
+        """إنهاء جلسة الأدمن والعودة للقائمة الرئيسية"""
+        self.user_states.pop(message['from']['id'], None)
+        user = self.find_user(message['from']['id'])
+        if user:
+            welcome_text = f"""🏠 مرحباً بك مرة أخرى
 
 👤 العميل: {user.get('name', 'غير محدد')}
 🆔 رقم العميل: {user.get('customer_id', 'غير محدد')}
 
 اختر الخدمة المطلوبة:"""
-                self.send_message(chat_id, welcome_text, self.main_keyboard(user.get('language', 'ar')))
+            self.send_message(message['chat']['id'], welcome_text, self.main_keyboard(user.get('language', 'ar')))
+    
+    def save_new_company(self, message):
+        """حفظ الشركة الجديدة بعد التأكيد"""
+        chat_id = message['chat']['id']
+        user_id = message['from']['id']
+        if self.user_states.get(user_id) != 'confirming_company':
+            self.send_message(chat_id, "❌ لا توجد شركة للحفظ. ابدأ بإضافة شركة جديدة أولاً.", self.admin_keyboard())
+            return
+        company_data = self.temp_company_data.get(user_id)
+        if not company_data:
+            self.send_message(chat_id, "❌ لا توجد بيانات شركة محفوظة", self.admin_keyboard())
+            return
+        company_id = str(int(datetime.now().timestamp()))
         
-        # أوامر نصية للأدمن (مبسطة مع احتمالات متعددة)
-        elif any(word in text.lower() for word in ['موافقة', 'موافق', 'اوافق', 'أوافق', 'قبول', 'مقبول', 'تأكيد', 'تاكيد', 'نعم']):
-            # استخراج رقم المعاملة
-            words = text.split()
-            trans_id = None
-            for word in words:
-                if any(word.startswith(prefix) for prefix in ['DEP', 'WTH']):
-                    trans_id = word
-                    break
-            
-            if trans_id:
-                self.approve_transaction(message, trans_id)
-            else:
-                self.send_message(message['chat']['id'], "❌ لم يتم العثور على رقم المعاملة. مثال: موافقة DEP123456", self.admin_keyboard())
-                
-        elif any(word in text.lower() for word in ['رفض', 'رافض', 'لا', 'مرفوض', 'إلغاء', 'الغاء', 'منع']):
-            # استخراج رقم المعاملة والسبب
-            words = text.split()
-            trans_id = None
-            reason_start = -1
-            
-            for i, word in enumerate(words):
-                if any(word.startswith(prefix) for prefix in ['DEP', 'WTH']):
-                    trans_id = word
-                    reason_start = i + 1
-                    break
+        try:
+            # حفظ الشركة
+            self.catalog.add_company({'id': company_id, 'name': company_data['name'], 'type': company_data['type'],
+                                      'details': company_data['details'], 'is_active': 'active'})
             
-            if trans_id:
-                reason = ' '.join(words[reason_start:]) if reason_start != -1 and reason_start < len(words) else 'غير محدد'
-                self.reject_transaction(message, trans_id, reason)
-            else:
-                self.send_message(message['chat']['id'], "❌ لم يتم العثور على رقم المعاملة. مثال: رفض DEP123456 سبب الرفض", self.admin_keyboard())
-        elif text.startswith('بحث '):
-            query = text.replace('بحث ', '')
-            self.search_users_admin(message, query)
-        elif text.startswith('اضافة_ادمن '):
-            user_id_to_add = text.replace('اضافة_ادمن ', '')
-            self.add_admin_user(message, user_id_to_add)
-        elif text.startswith('اضافة ادمن '):
-            user_id_to_add = text.replace('اضافة ادمن ', '')
-            self.add_admin_user(message, user_id_to_add)
-        elif text.startswith('ادمن_مؤقت '):
-            user_id_to_add = text.replace('ادمن_مؤقت ', '')
-            self.add_temp_admin(message, user_id_to_add)
-        elif text.startswith('ازالة_ادمن '):
-            user_id_to_remove = text.replace('ازالة_ادمن ', '')
-            self.remove_admin_user(message, user_id_to_remove)
-        elif text.startswith('حظر '):
-            parts = text.replace('حظر ', '').split(' ', 1)
-            customer_id = parts[0]
-            reason = parts[1] if len(parts) > 1 else 'مخالفة الشروط'
-            self.ban_user_admin(message, customer_id, reason)
-        elif text.startswith('الغاء_حظر '):
-            customer_id = text.replace('الغاء_حظر ', '')
-            self.unban_user_admin(message, customer_id)
-        elif text.startswith('اضافة_شركة '):
-            self.add_company_simple_with_display(message, text)
-        elif text.startswith('حذف_شركة '):
-            company_id = text.replace('حذف_شركة ', '')
-            self.delete_company_simple(message, company_id)
-        elif text.startswith('عنوان_جديد '):
-            new_address = text.replace('عنوان_جديد ', '')
-            self.update_address_simple(message, new_address)
-        elif any(word in text.lower() for word in ['عنوان', 'العنوان', 'تحديث_عنوان']):
-            # استخراج العنوان الجديد
-            new_address = text
-            for word in ['عنوان', 'العنوان', 'تحديث_عنوان']:
-                new_address = new_address.replace(word, '').strip()
-            if new_address:
-                self.update_address_simple(message, new_address)
-            else:
-                self.send_message(message['chat']['id'], "يرجى كتابة العنوان الجديد. مثال: عنوان شارع الملك فهد", self.admin_keyboard())
-        elif text.startswith('تعديل_اعداد '):
-            self.update_setting_simple(message, text)
-        elif text == '✅ حفظ الشركة':
-            # التعامل مع حفظ الشركة - تنفيذ مباشر
-            if user_id in self.user_states and self.user_states[user_id] == 'confirming_company':
-                if user_id in self.temp_company_data:
-                    company_data = self.temp_company_data[user_id]
-                    company_id = str(int(datetime.now().timestamp()))
-                    
-                    try:
-                        # حفظ الشركة في الملف
-                        with open('companies.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                            writer = csv.writer(f)
-                            writer.writerow([company_id, company_data['name'], company_data['type'], company_data['details'], 'active'])
-                        
-                        success_msg = f"""🎉 تم إضافة الشركة بنجاح!
+            success_msg = f"""🎉 تم إضافة الشركة بنجاح!
 
 🆔 المعرف: {company_id}
 🏢 الاسم: {company_data['name']}
@@ -1498,98 +1422,90 @@ class ComprehensiveDUXBot:
 📋 التفاصيل: {company_data['details']}
 
 الشركة متاحة الآن للعملاء ✅"""
-                        
-                        self.send_message(chat_id, success_msg, self.admin_keyboard())
-                        
-                        # تنظيف البيانات المؤقتة
-                        del self.user_states[user_id]
-                        del self.temp_company_data[user_id]
-                        
-                    except Exception as e:
-                        self.send_message(chat_id, f"❌ فشل في حفظ الشركة: {str(e)}", self.admin_keyboard())
-                else:
-                    self.send_message(chat_id, "❌ لا توجد بيانات شركة محفوظة", self.admin_keyboard())
-            else:
-                self.send_message(chat_id, "❌ لا توجد شركة للحفظ. ابدأ بإضافة شركة جديدة أولاً.", self.admin_keyboard())
-        elif text == '✅ حفظ التغييرات':
-            # التعامل مع حفظ تغييرات الشركة
-            if user_id in self.user_states and self.user_states[user_id] == 'editing_company_menu':
-                self.save_company_changes(message)
-            else:
-                self.send_message(chat_id, "❌ لا توجد تغييرات للحفظ. ابدأ بتعديل شركة أولاً.", self.admin_keyboard())
-        elif text in ['❌ إلغاء', 'إلغاء', 'الغاء']:
-            # إلغاء العملية الحالية
-            if user_id in self.user_states:
-                del self.user_states[user_id]
-            if user_id in self.edit_company_data:
-                del self.edit_company_data[user_id]
-            self.send_message(chat_id, "❌ تم إلغاء العملية", self.admin_keyboard())
-        else:
-            self.send_message(chat_id, "أمر غير مفهوم. استخدم الأزرار أو الأوامر الصحيحة.", self.admin_keyboard())
-    
-    def show_pending_requests(self, message):
-        """عرض الطلبات المعلقة للأدمن مع أوامر نسخ سهلة"""
-        pending_text = "📋 الطلبات المعلقة:\n\n"
-        found_pending = False
-        copy_commands = []
-        
-        try:
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['status'] == 'pending':
-                        found_pending = True
-                        type_emoji = "💰" if row['type'] == 'deposit' else "💸"
-                        
-                        pending_text += f"{type_emoji} **{row['id']}**\n"
-                        pending_text += f"👤 {row['name']} ({row['customer_id']})\n"
-                        pending_text += f"🏢 {row['company']}\n"
-                        pending_text += f"💳 {row['wallet_number']}\n"
-                        pending_text += f"💰 {row['amount']} ريال\n"
-                        
-                        if row.get('exchange_address'):
-                            pending_text += f"📍 {row['exchange_address']}\n"
-                        
-                        pending_text += f"📅 {row['date']}\n"
-                        
-                        # إضافة أوامر النسخ السريع
-                        pending_text += f"\n📋 **أوامر سريعة للنسخ:**\n"
-                        pending_text += f"✅ `موافقة {row['id']}`\n"
-                        pending_text += f"❌ `رفض {row['id']} السبب_هنا`\n"
-                        pending_text += f"▫️▫️▫️▫️▫️▫️▫️▫️▫️▫️\n\n"
-                        
-                        # حفظ الأوامر للنسخ الجماعي
-                        copy_commands.append({
-                            'id': row['id'],
-                            'approve': f"موافقة {row['id']}",
-                            'reject': f"رفض {row['id']} السبب_هنا"
-                        })
-        except:
-            pass
-        
-        if not found_pending:
-            pending_text += "✅ لا توجد طلبات معلقة"
-        else:
-            # إضافة قسم الأوامر الجاهزة للنسخ
-            pending_text += "\n🔥 **أوامر جاهزة للنسخ المباشر:**\n\n"
             
-            for cmd in copy_commands:
-                pending_text += f"**{cmd['id']}:**\n"
-                pending_text += f"✅ `{cmd['approve']}`\n"
-                pending_text += f"❌ `{cmd['reject']}`\n\n"
+            self.send_message(chat_id, success_msg, self.admin_keyboard())
             
-            pending_text += "💡 **طرق سهلة للاستخدام:**\n"
-            pending_text += "• انقر على الأمر واختر 'نسخ'\n"
-            pending_text += "• أو اكتب مباشرة: موافقة + رقم المعاملة\n"
-            pending_text += "• للرفض: رفض + رقم المعاملة + السبب\n\n"
-            
-            pending_text += "📝 **أمثلة أوامر الموافقة:**\n"
-            pending_text += "`موافقة` أو `موافق` أو `تأكيد` أو `نعم`\n\n"
+            # تنظيف البيانات المؤقتة
+            del self.user_states[user_id]
+            del self.temp_company_data[user_id]
             
-            pending_text += "📝 **أمثلة أوامر الرفض:**\n"
-            pending_text += "`رفض` أو `لا` أو `مرفوض` أو `إلغاء`"
-        
-        self.send_message(message['chat']['id'], pending_text, self.admin_keyboard())
+        except Exception as e:
+            self.send_message(chat_id, f"❌ فشل في حفظ الشركة: {str(e)}", self.admin_keyboard())
+    
+    def save_company_changes_command(self, message):
+        """حفظ تغييرات الشركة من قائمة التعديل"""
+        if self.user_states.get(message['from']['id']) == 'editing_company_menu':
+            self.save_company_changes(message)
+        else:
+            self.send_message(message['chat']['id'], "❌ لا توجد تغييرات للحفظ. ابدأ بتعديل شركة أولاً.", self.admin_keyboard())
+    
+    def cancel_admin_operation(self, message):
+        """إلغاء العملية الحالية للأدمن"""
+        user_id = message['from']['id']
+        self.user_states.pop(user_id, None)
+        getattr(self, 'edit_company_data', {}).pop(user_id, None)
+        self.send_message(message['chat']['id'], "❌ تم إلغاء العملية", self.admin_keyboard())
+    
+    def show_pending_requests(self, message):
+        """عرض الطلبات المعلقة للأدمن مع أوامر نسخ سهلة (5 طلبات لكل صفحة)"""
+        self.show_paged(message, 'pending')
+    
+    def render_pending_page(self, params, offset, limit):
+        """صفحة من الطلبات المعلقة"""
+        rows, total = self.ledger.transactions_page('pending', offset, limit)
+        pending_text = f"📋 الطلبات المعلقة ({total}):\n\n"
+        if not rows:
+            return pending_text + "✅ لا توجد طلبات معلقة", total
+        
+        for row in rows:
+            type_emoji = "💰" if row['type'] == 'deposit' else "💸"
+                    
+            pending_text += f"{type_emoji} **{row['id']}**\n"
+            pending_text += f"👤 {row['name']} ({row['customer_id']})\n"
+            pending_text += f"🏢 {row['company']}\n"
+            pending_text += f"💳 {row['wallet_number']}\n"
+            pending_text += f"💰 {row['amount']} ريال\n"
+                    
+            if row.get('exchange_address'):
+                pending_text += f"📍 {row['exchange_address']}\n"
+                    
+            pending_text += f"📅 {row['date']}\n"
+                    
+            # إضافة أوامر النسخ السريع
+            pending_text += f"\n📋 **أوامر سريعة للنسخ:**\n"
+            pending_text += f"✅ `موافقة {row['id']}`\n"
+            pending_text += f"❌ `رفض {row['id']} السبب_هنا`\n"
+            pending_text += f"▫️▫️▫️▫️▫️▫️▫️▫️▫️▫️\n\n"
+        
+        pending_text += "💡 **طرق سهلة للاستخدام:**\n"
+        pending_text += "• انقر على الأمر واختر 'نسخ'\n"
+        pending_text += "• أو اكتب مباشرة: موافقة + رقم المعاملة\n"
+        pending_text += "• للرفض: رفض + رقم المعاملة + السبب"
+        return pending_text, total
+    
+    def show_paged(self, message, view, params=None, keyboard=None, page=1):
+        """إرسال الصفحة الأولى من عرض مقسم (مع أزرار التنقل إذا كان أكثر من صفحة)"""
+        token = self.paged_views.open(view, params)
+        text, markup, _ = self.paged_views.render(token, page)
+        self.send_message(message['chat']['id'], text, markup or keyboard or self.admin_keyboard())
+    
+    def handle_callback_query(self, callback):
+        """أزرار التنقل: تعديل نفس الرسالة للصفحة المطلوبة بدلاً من إرسال رسالة جديدة"""
+        answer = {'callback_query_id': callback['id']}
+        parsed = PagedViews.parse(callback.get('data'))
+        if parsed and 'message' in callback and self.is_admin(callback['from']['id']):
+            page = self.paged_views.render(*parsed)
+            if page is None:
+                answer['text'] = "⌛ انتهت صلاحية هذه القائمة، افتحها من جديد"
+            else:
+                text, markup, _ = page
+                data = {'chat_id': callback['message']['chat']['id'],
+                        'message_id': callback['message']['message_id'],
+                        'text': text, 'parse_mode': 'HTML'}
+                if markup:
+                    data['reply_markup'] = markup
+                self.api_call('editMessageText', data)
+        self.api_call('answerCallbackQuery', answer)
     
     def approve_transaction(self, message, trans_id):
         """الموافقة على معاملة"""
@@ -1649,98 +1565,51 @@ class ComprehensiveDUXBot:
     
     def update_transaction_status(self, trans_id, new_status, note='', admin_id=''):
         """تحديث حالة المعاملة"""
-        transactions = []
-        success = False
+        changes = {'status': new_status}
+        if note:
+            changes['admin_note'] = note
+        if admin_id:
+            changes['processed_by'] = admin_id
         
         try:
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == trans_id:
-                        row['status'] = new_status
-                        if note:
-                            row['admin_note'] = note
-                        if admin_id:
-                            row['processed_by'] = admin_id
-                        success = True
-                    transactions.append(row)
-            
-            if success:
-                with open('transactions.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'customer_id', 'telegram_id', 'name', 'type', 'company', 'wallet_number', 'amount', 'exchange_address', 'status', 'date', 'admin_note', 'processed_by']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(transactions)
-        except:
-            pass
-        
-        return success
+            return self.ledger.amend(trans_id, **changes) is not None
+        except Exception as e:
+            logger.error(f"خطأ في تحديث حالة المعاملة: {e}")
+        return False
     
     def get_transaction(self, trans_id):
         """جلب معاملة محددة"""
         try:
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == trans_id:
-                        return row
-        except:
-            pass
+            return self.ledger.get(trans_id)
+        except Exception as e:
+            logger.error(f"خطأ في جلب المعاملة: {e}")
         return None
     
     def show_detailed_stats(self, message):
         """عرض إحصائيات مفصلة"""
         stats_text = "📊 إحصائيات النظام الشاملة\n\n"
         
+        # العدادات جاهزة مسبقاً (تُحدّث مع كل عملية كتابة)
+        stats = self.stats.snapshot()
+        
         # إحصائيات المستخدمين
-        total_users = 0
-        banned_users = 0
-        try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    total_users += 1
-                    if row.get('is_banned') == 'yes':
-                        banned_users += 1
-        except:
-            pass
+        total_users = stats['users']['total']
+        banned_users = stats['users']['banned']
         
         # إحصائيات المعاملات
-        total_transactions = 0
-        pending_count = 0
-        approved_count = 0
-        rejected_count = 0
-        total_deposit_amount = 0
-        total_withdraw_amount = 0
+        status_counts = stats['transactions']['by_status']
+        total_transactions = stats['transactions']['total']
+        pending_count = status_counts.get('pending', 0)
+        approved_count = status_counts.get('approved', 0)
+        rejected_count = status_counts.get('rejected', 0)
         
-        try:
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    total_transactions += 1
-                    amount = float(row.get('amount', 0))
-                    
-                    if row['status'] == 'pending':
-                        pending_count += 1
-                    elif row['status'] == 'approved':
-                        approved_count += 1
-                        if row['type'] == 'deposit':
-                            total_deposit_amount += amount
-                        else:
-                            total_withdraw_amount += amount
-                    elif row['status'] == 'rejected':
-                        rejected_count += 1
-        except:
-            pass
+        # المبالغ المُوافق عليها (كل ما ليس إيداعاً يُحتسب سحباً)
+        approved_amounts = stats['transactions']['approved_amount_by_type']
+        total_deposit_amount = approved_amounts.get('deposit', 0)
+        total_withdraw_amount = stats['transactions']['approved_amount'] - total_deposit_amount
         
         # إحصائيات الشكاوى
-        total_complaints = 0
-        try:
-            with open('complaints.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                total_complaints = sum(1 for row in reader)
-        except:
-            pass
+        total_complaints = stats['complaints']['total']
         
         stats_text += f"👥 المستخدمون:\n"
         stats_text += f"├ إجمالي المستخدمين: {total_users}\n"
@@ -1829,24 +1698,9 @@ class ComprehensiveDUXBot:
         company_id = str(int(datetime.now().timestamp()))
         
         try:
-            # التأكد من وجود الملف وإنشاؤه إذا لم يكن موجوداً
-            file_exists = True
-            try:
-                with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                    pass
-            except FileNotFoundError:
-                file_exists = False
-            
-            # إنشاء الملف مع الرؤوس إذا لم يكن موجوداً
-            if not file_exists:
-                with open('companies.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['id', 'name', 'type', 'details', 'is_active'])
-            
             # إضافة الشركة الجديدة
-            with open('companies.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow([company_id, company_name, service_type, details, 'active'])
+            self.catalog.add_company({'id': company_id, 'name': company_name, 'type': service_type,
+                                      'details': details, 'is_active': 'active'})
             
             # رسالة النجاح مع عرض قائمة الشركات المحدثة
             success_msg = f"""✅ تم إضافة الشركة بنجاح!
@@ -1860,16 +1714,14 @@ class ComprehensiveDUXBot:
             
             # عرض جميع الشركات
             try:
-                with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    company_count = 0
-                    for row in reader:
-                        company_count += 1
-                        status = "✅" if row.get('is_active') == 'active' else "❌"
-                        type_display = {'deposit': 'إيداع', 'withdraw': 'سحب', 'both': 'الكل'}.get(row['type'], row['type'])
-                        success_msg += f"\n{status} {row['name']} (ID: {row['id']}) - {type_display}"
-                    
-                    success_msg += f"\n\n📊 إجمالي الشركات: {company_count}"
+                company_count = 0
+                for row in self.catalog.all_companies():
+                    company_count += 1
+                    status = "✅" if row.get('is_active') == 'active' else "❌"
+                    type_display = {'deposit': 'إيداع', 'withdraw': 'سحب', 'both': 'الكل'}.get(row['type'], row['type'])
+                    success_msg += f"\n{status} {row['name']} (ID: {row['id']}) - {type_display}"
+                
+                success_msg += f"\n\n📊 إجمالي الشركات: {company_count}"
             except:
                 pass
             
@@ -1883,18 +1735,95 @@ class ComprehensiveDUXBot:
     def update_address_simple(self, message, new_address):
         """تحديث عنوان الصرافة"""
         try:
-            with open('exchange_addresses.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(['id', 'address', 'is_active'])
-                writer.writerow(['1', new_address, 'yes'])
+            self.storage.replace('exchange_addresses', [{'id': '1', 'address': new_address, 'is_active': 'yes'}])
             
             self.send_message(message['chat']['id'], f"✅ تم تحديث عنوان الصرافة:\n{new_address}", self.admin_keyboard())
         except Exception as e:
             self.send_message(message['chat']['id'], f"❌ فشل في تحديث العنوان: {str(e)}", self.admin_keyboard())
     
+    def update_chat_key(self, update):
+        """مفتاح ترتيب التحديث (المحادثة أو المستخدم)"""
+        if 'message' in update:
+            return update['message']['chat']['id']
+        if 'callback_query' in update:
+            callback = update['callback_query']
+            return callback.get('message', {}).get('chat', {}).get('id', callback['from']['id'])
+        return update['update_id']
+    
+    def accept_update(self, update):
+        """تمرير تحديث جديد للموزع (التحديثات المكررة تُتجاهل)"""
+        if self.update_tracker.begin(update['update_id']):
+            # ينتظر هنا إذا امتلأت طوابير المعالجة
+            self.dispatcher.submit(self.update_chat_key(update), update)
+    
+    def handle_update(self, update):
+        """معالجة تحديث واحد (تُستدعى من عمال الموزع) وتسجيل انتهائه"""
+        try:
+            self.process_update(update)
+        finally:
+            self.update_tracker.done(update['update_id'])
+    
+    def process_update(self, update):
+        """معالجة محتوى التحديث"""
+        if 'message' in update:
+            message = update['message']
+            # تسجيل الرسائل للتشخيص
+            if 'text' in message:
+                logger.info(f"رسالة مستلمة: {message['text']} من {message['from']['id']}")
+            try:
+                with self.user_locks.hold(message.get('from', message['chat'])['id']):
+                    self.process_message(message)
+            except Exception as msg_error:
+                logger.error(f"خطأ في معالجة الرسالة: {msg_error}")
+                # إرسال رسالة خطأ للمستخدم
+                try:
+                    error_keyboard = self.cached_keyboard(('handler_error',), lambda: {
+                        'keyboard': [
+                            [{'text': '🔄 إعادة تعيين النظام'}],
+                            [{'text': '💰 طلب إيداع'}, {'text': '💸 طلب سحب'}]
+                        ],
+                        'resize_keyboard': True
+                    })
+                    self.send_message(message['chat']['id'], 
+                                    "❌ حدث خطأ. اضغط على 'إعادة تعيين النظام' للإصلاح", 
+                                    error_keyboard)
+                except:
+                    pass
+        elif 'callback_query' in update:
+            callback = update['callback_query']
+            try:
+                with self.user_locks.hold(callback['from']['id']):
+                    self.handle_callback_query(callback)
+            except Exception as callback_error:
+                logger.error(f"خطأ في معالجة الزر: {callback_error}")
+    
+    def save_conversation_state(self, force=False):
+        """حفظ لقطات حالات المحادثات (دورياً، أو فوراً عند الإيقاف)"""
+        for store in (self.user_states, self.temp_company_data):
+            if force:
+                store.snapshot()
+            else:
+                store.maybe_snapshot()
+    
     def run(self):
         """تشغيل البوت"""
         logger.info(f"✅ نظام DUX الشامل يعمل: @{os.getenv('BOT_TOKEN', 'unknown').split(':')[0] if os.getenv('BOT_TOKEN') else 'unknown'}")
+        self.dispatcher.start()
+        
+        # وضع الـ webhook (UPDATE_MODE=webhook): نفس مسار المعالجة عبر الموزع
+        webhook_config = WebhookConfig.from_env()
+        if webhook_config.enabled:
+            def accept_webhook_update(update):
+                self.accept_update(update)
+                self.update_tracker.save()
+                self.save_conversation_state()
+            serve_webhook(self.api_url, accept_webhook_update, webhook_config)
+            self.dispatcher.stop()
+            self.update_tracker.save()
+            self.save_conversation_state(force=True)
+            self.admin_notifier.stop()
+            return
+        delete_webhook(self.api_url)
         
         while True:
             try:
@@ -1902,35 +1831,17 @@ class ComprehensiveDUXBot:
                 if updates and updates.get('ok'):
                     for update in updates['result']:
                         self.offset = update['update_id']
-                        
-                        if 'message' in update:
-                            message = update['message']
-                            # تسجيل الرسائل للتشخيص
-                            if 'text' in message:
-                                logger.info(f"رسالة مستلمة: {message['text']} من {message['from']['id']}")
-                            try:
-                                self.process_message(message)
-                            except Exception as msg_error:
-                                logger.error(f"خطأ في معالجة الرسالة: {msg_error}")
-                                # إرسال رسالة خطأ للمستخدم
-                                try:
-                                    error_keyboard = {
-                                        'keyboard': [
-                                            [{'text': '🔄 إعادة تعيين النظام'}],
-                                            [{'text': '💰 طلب إيداع'}, {'text': '💸 طلب سحب'}]
-                                        ],
-                                        'resize_keyboard': True
-                                    }
-                                    self.send_message(message['chat']['id'], 
-                                                    "❌ حدث خطأ. اضغط على 'إعادة تعيين النظام' للإصلاح", 
-                                                    error_keyboard)
-                                except:
-                                    pass
-                        elif 'callback_query' in update:
-                            pass  # يمكن إضافة معالجة الأزرار المتقدمة لاحقاً
+                        self.accept_update(update)
+                # حفظ العلامة بعد كل دفعة (ما انتهت معالجته فقط)
+                self.update_tracker.save()
+                self.save_conversation_state()
                             
             except KeyboardInterrupt:
                 logger.info("تم إيقاف البوت")
+                self.dispatcher.stop()
+                self.update_tracker.save()
+                self.save_conversation_state(force=True)
+                self.admin_notifier.stop()
                 break
             except Exception as e:
                 logger.error(f"خطأ عام: {e}")
@@ -1949,20 +1860,8 @@ class ComprehensiveDUXBot:
         new_lang = 'en' if '🇺🇸' in text else 'ar'
         
         # تحديث لغة المستخدم في الملف
-        users = []
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['telegram_id'] == str(user_id):
-                        row['language'] = new_lang
-                    users.append(row)
-            
-            with open('users.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                fieldnames = ['telegram_id', 'name', 'phone', 'customer_id', 'language', 'date', 'is_banned', 'ban_reason']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(users)
+            self.users.update_by_telegram_id(user_id, language=new_lang)
             
             welcome_msg = "Language changed to English!" if new_lang == 'en' else "تم تغيير اللغة إلى العربية!"
             self.send_message(message['chat']['id'], welcome_msg, self.main_keyboard(new_lang))
@@ -1980,43 +1879,10 @@ class ComprehensiveDUXBot:
 • رقم العميل
 • رقم الهاتف
 
-مثال: بحث أحمد"""
+مثال: بحث أحمد
+للصفحة الثانية من النتائج: بحث أحمد #2"""
         self.send_message(message['chat']['id'], search_help, self.admin_keyboard())
         
-    def search_users_admin(self, message, query):
-        """البحث في المستخدمين للأدمن"""
-        try:
-            results = []
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # البحث في الاسم أو رقم العميل أو الهاتف
-                    if (query.lower() in row.get('name', '').lower() or 
-                        query in row.get('customer_id', '') or 
-                        query in row.get('phone', '')):
-                        results.append(row)
-            
-            if not results:
-                self.send_message(message['chat']['id'], f"❌ لم يتم العثور على نتائج للبحث: {query}", self.admin_keyboard())
-                return
-            
-            response = f"🔍 نتائج البحث عن: {query}\n\n"
-            for user in results:
-                ban_status = "🚫 محظور" if user.get('is_banned') == 'yes' else "✅ نشط"
-                response += f"👤 {user.get('name', 'غير محدد')}\n"
-                response += f"🆔 {user.get('customer_id', 'غير محدد')}\n"
-                response += f"📱 {user.get('phone', 'غير محدد')}\n"
-                response += f"🔸 {ban_status}\n\n"
-            
-            if len(response) > 4000:
-                response = response[:4000] + "\n... والمزيد من النتائج"
-            
-            self.send_message(message['chat']['id'], response, self.admin_keyboard())
-            
-        except Exception as e:
-            logger.error(f"خطأ في البحث: {e}")
-            self.send_message(message['chat']['id'], "❌ حدث خطأ أثناء البحث", self.admin_keyboard())
-    
     def add_admin_user(self, message, user_id_to_add):
         """إضافة أدمن جديد"""
         try:
@@ -2307,15 +2173,13 @@ class ComprehensiveDUXBot:
         # البحث عن المستخدمين المحظورين
         banned_users = []
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row.get('is_banned', 'no') == 'yes':
-                        banned_users.append({
-                            'customer_id': row['customer_id'],
-                            'name': row['name'],
-                            'ban_reason': row.get('ban_reason', 'غير محدد')
-                        })
+            for row in self.users.all_users():
+                if row.get('is_banned', 'no') == 'yes':
+                    banned_users.append({
+                        'customer_id': row['customer_id'],
+                        'name': row['name'],
+                        'ban_reason': row.get('ban_reason', 'غير محدد')
+                    })
         except:
             pass
         
@@ -2482,12 +2346,10 @@ class ComprehensiveDUXBot:
         companies_text = "🔧 تعديل الشركات:\n\n"
         
         try:
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    status = "✅" if row.get('is_active') == 'active' else "❌"
-                    companies_text += f"{status} {row['id']} - {row['name']}\n"
-                    companies_text += f"   📋 {row['type']} - {row['details']}\n\n"
+            for row in self.catalog.all_companies():
+                status = "✅" if row.get('is_active') == 'active' else "❌"
+                companies_text += f"{status} {row['id']} - {row['name']}\n"
+                companies_text += f"   📋 {row['type']} - {row['details']}\n\n"
         except:
             companies_text += "❌ لا توجد شركات\n\n"
         
@@ -2506,12 +2368,10 @@ class ComprehensiveDUXBot:
             # البحث عن الشركة
             company_found = None
             try:
-                with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        if row['id'] == text:
-                            company_found = row
-                            break
+                for row in self.catalog.all_companies():
+                    if row['id'] == text:
+                        company_found = row
+                        break
             except:
                 pass
             
@@ -2655,24 +2515,10 @@ class ComprehensiveDUXBot:
         """حفظ تغييرات الشركة"""
         user_id = message['from']['id']
         try:
-            companies = []
             updated_company = self.edit_company_data[user_id]
             
-            # قراءة جميع الشركات
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == updated_company['id']:
-                        companies.append(updated_company)
-                    else:
-                        companies.append(row)
-            
-            # كتابة الملف المحدث
-            with open('companies.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                fieldnames = ['id', 'name', 'type', 'details', 'is_active']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(companies)
+            # حفظ الشركة المحدثة
+            self.catalog.save_company(updated_company)
             
             type_display = {'deposit': 'إيداع فقط', 'withdraw': 'سحب فقط', 'both': 'إيداع وسحب'}.get(updated_company['type'])
             
@@ -2699,11 +2545,9 @@ class ComprehensiveDUXBot:
         companies_text = "🏢 إدارة الشركات المتقدمة\n\n"
         
         try:
-            # قراءة جميع الشركات من الملف مع إعادة تحميل الملف
-            companies = []
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                companies = list(reader)  # تحويل إلى قائمة فوراً
+            # قراءة جميع الشركات مع إعادة تحميل الكتالوج
+            self.catalog.invalidate()
+            companies = self.catalog.all_companies()
             
             if len(companies) == 0:
                 companies_text += "❌ لا توجد شركات مسجلة\n\n"
@@ -2719,13 +2563,6 @@ class ComprehensiveDUXBot:
                     
         except Exception as e:
             companies_text += f"❌ خطأ في قراءة ملف الشركات: {str(e)}\n\n"
-            # محاولة إظهار محتوى الملف للتشخيص
-            try:
-                with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                    content = f.read()
-                    companies_text += f"محتوى الملف:\n{content[:200]}...\n\n"
-            except:
-                companies_text += "فشل في قراءة محتوى الملف\n\n"
         
         # أزرار الإدارة المتقدمة
         management_keyboard = {
@@ -2751,12 +2588,10 @@ class ComprehensiveDUXBot:
         companies_text = "🗑️ حذف الشركات:\n\n"
         
         try:
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    status = "✅" if row.get('is_active') == 'active' else "❌"
-                    companies_text += f"{status} {row['id']} - {row['name']}\n"
-                    companies_text += f"   📋 {row['type']} - {row['details']}\n\n"
+            for row in self.catalog.all_companies():
+                status = "✅" if row.get('is_active') == 'active' else "❌"
+                companies_text += f"{status} {row['id']} - {row['name']}\n"
+                companies_text += f"   📋 {row['type']} - {row['details']}\n\n"
         except:
             companies_text += "❌ لا توجد شركات\n\n"
         
@@ -2774,12 +2609,10 @@ class ComprehensiveDUXBot:
         # البحث عن الشركة
         company_found = None
         try:
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == company_id:
-                        company_found = row
-                        break
+            for row in self.catalog.all_companies():
+                if row['id'] == company_id:
+                    company_found = row
+                    break
         except:
             pass
         
@@ -2817,24 +2650,12 @@ class ComprehensiveDUXBot:
         
         if text == '🗑️ نعم، احذف الشركة':
             # تنفيذ الحذف
-            companies = []
-            deleted_company = None
-            
             try:
-                with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        if row['id'] != company_id:
-                            companies.append(row)
-                        else:
-                            deleted_company = row
+                deleted_company = self.catalog.company(company_id, include_inactive=True)
                 
-                # كتابة الملف بدون الشركة المحذوفة
-                with open('companies.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'name', 'type', 'details', 'is_active']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(companies)
+                # حذف الشركة
+                if deleted_company:
+                    self.catalog.delete_company(company_id)
                 
                 if deleted_company:
                     success_msg = f"""✅ تم حذف الشركة بنجاح!
@@ -2908,17 +2729,11 @@ class ComprehensiveDUXBot:
     
     def get_payment_methods_by_company(self, company_id, transaction_type=None):
         """الحصول على وسائل الدفع لشركة معينة"""
-        methods = []
         try:
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if (row['company_id'] == str(company_id) and 
-                        row['status'] == 'active'):
-                        methods.append(row)
-        except:
-            pass
-        return methods
+            return self.catalog.company_methods(company_id)
+        except Exception as e:
+            logger.error(f"خطأ في قراءة وسائل الدفع للشركة {company_id}: {e}")
+        return []
     
     def show_payment_method_selection(self, message, company_id, transaction_type):
         """عرض وسائل الدفع المتاحة للشركة"""
@@ -2931,19 +2746,28 @@ class ComprehensiveDUXBot:
                             self.main_keyboard('ar'))
             return
         
-        methods_text = f"💳 اختر وسيلة الدفع:\n\n"
-        keyboard = []
-        
-        for method in methods:
-            methods_text += f"🔹 {method['method_name']}\n"
-            methods_text += f"   📋 {method['method_type']}\n"
-            if method['additional_info']:
-                methods_text += f"   💡 {method['additional_info']}\n"
-            methods_text += "\n"
-            
-            keyboard.append([{'text': method['method_name']}])
+        def build_text():
+            methods_text = f"💳 اختر وسيلة الدفع:\n\n"
+            for method in methods:
+                methods_text += f"🔹 {method['method_name']}\n"
+                methods_text += f"   📋 {method['method_type']}\n"
+                if method['additional_info']:
+                    methods_text += f"   💡 {method['additional_info']}\n"
+                methods_text += "\n"
+            return methods_text
+        
+        def build_keyboard():
+            keyboard = [[{'text': method['method_name']}] for method in methods]
+            keyboard.append([{'text': '🔙 العودة لاختيار الشركة'}])
+            return {
+                'keyboard': keyboard,
+                'resize_keyboard': True,
+                'one_time_keyboard': True
+            }
         
-        keyboard.append([{'text': '🔙 العودة لاختيار الشركة'}])
+        # النص واللوحة (JSON جاهز) محفوظان في الكتالوج لكل شركة
+        methods_text = self.catalog.text(('methods', str(company_id)), build_text)
+        reply_keyboard = self.cached_keyboard(('methods', str(company_id)), build_keyboard)
         
         # حفظ الحالة
         self.user_states[user_id] = {
@@ -2953,12 +2777,6 @@ class ComprehensiveDUXBot:
             'methods': methods
         }
         
-        reply_keyboard = {
-            'keyboard': keyboard,
-            'resize_keyboard': True,
-            'one_time_keyboard': True
-        }
-        
         self.send_message(message['chat']['id'], methods_text, reply_keyboard)
     
     def add_payment_method(self, company_id, method_name, method_type, account_data, additional_info=""):
@@ -2968,18 +2786,16 @@ class ComprehensiveDUXBot:
             new_id = int(datetime.now().timestamp() * 1000) % 1000000
             
             # إضافة الوسيلة الجديدة
-            with open('payment_methods.csv', 'a', encoding='utf-8-sig', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    new_id,
-                    company_id,
-                    method_name,
-                    method_type,
-                    account_data,
-                    additional_info,
-                    'active',
-                    datetime.now().strftime('%Y-%m-%d')
-                ])
+            self.catalog.add_method({
+                'id': new_id,
+                'company_id': company_id,
+                'method_name': method_name,
+                'method_type': method_type,
+                'account_data': account_data,
+                'additional_info': additional_info,
+                'status': 'active',
+                'created_date': datetime.now().strftime('%Y-%m-%d')
+            })
             return True
         except:
             return False
@@ -2987,28 +2803,14 @@ class ComprehensiveDUXBot:
     def edit_payment_method(self, method_id, new_data):
         """تعديل وسيلة دفع موجودة"""
         try:
-            methods = []
-            found = False
-            
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        # تحديث البيانات
-                        for key, value in new_data.items():
-                            if key in row:
-                                row[key] = value
-                        found = True
-                    methods.append(row)
-            
-            if found:
-                # كتابة البيانات المحدثة
-                with open('payment_methods.csv', 'w', encoding='utf-8-sig', newline='') as f:
-                    if methods:
-                        fieldnames = methods[0].keys()
-                        writer = csv.DictWriter(f, fieldnames=fieldnames)
-                        writer.writeheader()
-                        writer.writerows(methods)
+            row = self.catalog.method(method_id)
+            
+            if row:
+                # تحديث البيانات
+                for key, value in new_data.items():
+                    if key in row:
+                        row[key] = value
+                self.catalog.save_method(row)
                 return True
         except:
             pass
@@ -3017,25 +2819,10 @@ class ComprehensiveDUXBot:
     def delete_payment_method(self, method_id):
         """حذف وسيلة دفع مع إرجاع البيانات المحذوفة"""
         try:
-            methods = []
-            deleted_method = None
-            
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] != str(method_id):
-                        methods.append(row)
-                    else:
-                        deleted_method = row.copy()
+            deleted_method = self.catalog.method(method_id)
             
             if deleted_method:
-                # كتابة الملف حتى لو كان فارغ
-                with open('payment_methods.csv', 'w', encoding='utf-8-sig', newline='') as f:
-                    fieldnames = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    if methods:  # فقط اكتب الصفوف إذا كانت موجودة
-                        writer.writerows(methods)
+                self.catalog.delete_method(method_id)
                 
                 logger.info(f"تم حذف وسيلة الدفع {method_id}: {deleted_method.get('method_name', 'غير محدد')}")
                 return True, deleted_method
@@ -3125,9 +2912,8 @@ class ComprehensiveDUXBot:
             company_id = str(int(datetime.now().timestamp()))
             
             try:
-                with open('companies.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([company_id, company_name, service_type, details, 'active'])
+                self.catalog.add_company({'id': company_id, 'name': company_name, 'type': service_type,
+                                          'details': details, 'is_active': 'active'})
                 
                 service_ar = "إيداع فقط" if service_type == 'deposit' else "سحب فقط" if service_type == 'withdraw' else "إيداع وسحب"
                 
@@ -3153,12 +2939,10 @@ class ComprehensiveDUXBot:
         companies_text = "🏢 إدارة الشركات:\n\n"
         
         try:
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    status = "✅" if row.get('is_active') == 'active' else "❌"
-                    companies_text += f"{status} {row['id']} - {row['name']}\n"
-                    companies_text += f"   📋 {row['type']} - {row['details']}\n\n"
+            for row in self.catalog.all_companies():
+                status = "✅" if row.get('is_active') == 'active' else "❌"
+                companies_text += f"{status} {row['id']} - {row['name']}\n"
+                companies_text += f"   📋 {row['type']} - {row['details']}\n\n"
         except:
             pass
         
@@ -3190,11 +2974,9 @@ class ComprehensiveDUXBot:
         settings_text = "⚙️ إعدادات النظام:\n\n"
         
         try:
-            with open('system_settings.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    settings_text += f"🔧 {row['setting_key']}: {row['setting_value']}\n"
-                    settings_text += f"   📝 {row['description']}\n\n"
+            for row in self.settings.all_settings():
+                settings_text += f"🔧 {row['setting_key']}: {row['setting_value']}\n"
+                settings_text += f"   📝 {row['description']}\n\n"
         except:
             pass
         
@@ -3210,31 +2992,29 @@ class ComprehensiveDUXBot:
         keyboard = []
         
         try:
-            with open('complaints.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                pending_complaints = [row for row in reader if row['status'] == 'pending']
+            pending_complaints = [row for row in self.ledger.all_complaints() if row['status'] == 'pending']
+            
+            if not pending_complaints:
+                complaints_text += "✅ لا توجد شكاوى معلقة"
+                keyboard = [
+                    [{'text': '🔄 تحديث'}],
+                    [{'text': '↩️ العودة للوحة الأدمن'}]
+                ]
+            else:
+                for complaint in pending_complaints:
+                    complaints_text += f"🆔 {complaint['id']}\n"
+                    complaints_text += f"👤 {complaint['customer_id']}\n"
+                    complaints_text += f"📝 {complaint['message']}\n"
+                    complaints_text += f"📅 {complaint['date']}\n\n"
+                    
+                    # إضافة أزرار رد سريعة
+                    keyboard.append([{'text': f"📞 رد على {complaint['id']}"}])
                 
-                if not pending_complaints:
-                    complaints_text += "✅ لا توجد شكاوى معلقة"
-                    keyboard = [
-                        [{'text': '🔄 تحديث'}],
-                        [{'text': '↩️ العودة للوحة الأدمن'}]
-                    ]
-                else:
-                    for complaint in pending_complaints:
-                        complaints_text += f"🆔 {complaint['id']}\n"
-                        complaints_text += f"👤 {complaint['customer_id']}\n"
-                        complaints_text += f"📝 {complaint['message']}\n"
-                        complaints_text += f"📅 {complaint['date']}\n\n"
-                        
-                        # إضافة أزرار رد سريعة
-                        keyboard.append([{'text': f"📞 رد على {complaint['id']}"}])
+                keyboard.extend([
+                    [{'text': '🔄 تحديث'}],
+                    [{'text': '↩️ العودة للوحة الأدمن'}]
+                ])
                     
-                    keyboard.extend([
-                        [{'text': '🔄 تحديث'}],
-                        [{'text': '↩️ العودة للوحة الأدمن'}]
-                    ])
-                        
         except Exception as e:
             complaints_text += f"❌ خطأ في قراءة الشكاوى: {e}"
             keyboard = [
@@ -3257,13 +3037,8 @@ class ComprehensiveDUXBot:
         complaint_data = None
         
         try:
-            with open('complaints.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == complaint_id:
-                        complaint_found = True
-                        complaint_data = row
-                        break
+            complaint_data = self.ledger.get_complaint(complaint_id)
+            complaint_found = complaint_data is not None
         except:
             pass
         
@@ -3315,26 +3090,10 @@ class ComprehensiveDUXBot:
     
     def ban_user_admin(self, message, customer_id, reason):
         """حظر مستخدم من قبل الأدمن"""
-        users = []
-        success = False
-        
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['customer_id'] == customer_id:
-                        row['is_banned'] = 'yes'
-                        row['ban_reason'] = reason
-                        success = True
-                    users.append(row)
+            success = self.users.update_by_customer_id(customer_id, is_banned='yes', ban_reason=reason)
             
             if success:
-                with open('users.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['telegram_id', 'name', 'phone', 'customer_id', 'language', 'date', 'is_banned', 'ban_reason']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(users)
-                
                 self.send_message(message['chat']['id'], f"✅ تم حظر العميل {customer_id}\nالسبب: {reason}", self.admin_keyboard())
             else:
                 self.send_message(message['chat']['id'], f"❌ لم يتم العثور على العميل {customer_id}", self.admin_keyboard())
@@ -3343,26 +3102,10 @@ class ComprehensiveDUXBot:
     
     def unban_user_admin(self, message, customer_id):
         """إلغاء حظر مستخدم من قبل الأدمن"""
-        users = []
-        success = False
-        
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['customer_id'] == customer_id:
-                        row['is_banned'] = 'no'
-                        row['ban_reason'] = ''
-                        success = True
-                    users.append(row)
+            success = self.users.update_by_customer_id(customer_id, is_banned='no', ban_reason='')
             
             if success:
-                with open('users.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['telegram_id', 'name', 'phone', 'customer_id', 'language', 'date', 'is_banned', 'ban_reason']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(users)
-                
                 self.send_message(message['chat']['id'], f"✅ تم إلغاء حظر العميل {customer_id}", self.admin_keyboard())
             else:
                 self.send_message(message['chat']['id'], f"❌ لم يتم العثور على العميل {customer_id}", self.admin_keyboard())
@@ -3371,25 +3114,12 @@ class ComprehensiveDUXBot:
     
     def delete_company_simple(self, message, company_id):
         """حذف شركة بسيط"""
-        companies = []
-        deleted = False
-        
         try:
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] != company_id:
-                        companies.append(row)
-                    else:
-                        deleted = True
-                        deleted_name = row.get('name', 'Unknown')
-            
-            if deleted:
-                with open('companies.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'name', 'type', 'details', 'is_active']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(companies)
+            company = self.catalog.company(company_id, include_inactive=True)
+            
+            if company:
+                deleted_name = company.get('name', 'Unknown')
+                self.catalog.delete_company(company_id)
                 
                 self.send_message(message['chat']['id'], f"✅ تم حذف الشركة: {deleted_name} (ID: {company_id})", self.admin_keyboard())
             else:
@@ -3415,25 +3145,10 @@ class ComprehensiveDUXBot:
         setting_key = parts[0]
         setting_value = parts[1]
         
-        settings = []
-        updated = False
-        
         try:
-            with open('system_settings.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['setting_key'] == setting_key:
-                        row['setting_value'] = setting_value
-                        updated = True
-                    settings.append(row)
+            updated = self.settings.set(setting_key, setting_value)
             
             if updated:
-                with open('system_settings.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['setting_key', 'setting_value', 'description']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(settings)
-                
                 self.send_message(message['chat']['id'], f"✅ تم تحديث الإعداد:\n{setting_key} = {setting_value}", self.admin_keyboard())
             else:
                 self.send_message(message['chat']['id'], f"❌ لم يتم العثور على الإعداد: {setting_key}", self.admin_keyboard())
@@ -3446,20 +3161,13 @@ class ComprehensiveDUXBot:
         if not user:
             return
         
-        complaint_id = f"COMP{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
         try:
-            # إنشاء ملف الشكاوى مع الهيكل الصحيح إذا لم يكن موجوداً
-            if not os.path.exists('complaints.csv'):
-                with open('complaints.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['id', 'customer_id', 'subject', 'message', 'status', 'date', 'admin_response'])
-            
-            # إضافة الشكوى الجديدة
-            with open('complaints.csv', 'a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow([complaint_id, user['customer_id'], 'شكوى جديدة', complaint_text, 'pending', 
-                               datetime.now().strftime('%Y-%m-%d %H:%M'), ''])
+            # إضافة الشكوى الجديدة (المعرف COMP يُولّد داخل السجل دون تكرار)
+            complaint_id = self.ledger.add_complaint({
+                'customer_id': user['customer_id'], 'subject': 'شكوى جديدة',
+                'message': complaint_text, 'status': 'pending',
+                'date': datetime.now().strftime('%Y-%m-%d %H:%M'), 'admin_response': ''
+            }, 'COMP')['id']
             
             confirmation = f"""✅ تم إرسال شكواك بنجاح
 
@@ -3481,7 +3189,7 @@ class ComprehensiveDUXBot:
 📝 الشكوى: {complaint_text}
 📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}"""
             
-            self.notify_admins(admin_msg)
+            self.notify_admins(admin_msg, 'complaint', f"{complaint_id} • {user['name']} ({user['customer_id']})")
             
         except Exception as e:
             logger.error(f"خطأ في حفظ الشكوى: {e}")
@@ -3495,9 +3203,7 @@ class ComprehensiveDUXBot:
         failed_count = 0
         
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                users = list(reader)
+            users = self.users.all_users()
             
             # إرسال للمستخدمين النشطين فقط
             for user in users:
@@ -3534,34 +3240,24 @@ class ComprehensiveDUXBot:
             del self.user_states[message['from']['id']]
 
     def show_approved_transactions(self, message):
-        """عرض المعاملات المُوافق عليها"""
-        approved_text = "✅ المعاملات المُوافق عليها (آخر 20 معاملة):\n\n"
-        found_approved = False
-        count = 0
-        
-        try:
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                transactions = list(reader)
-                
-                # عكس الترتيب للحصول على أحدث المعاملات
-                for row in reversed(transactions):
-                    if row['status'] == 'approved' and count < 20:
-                        found_approved = True
-                        count += 1
-                        type_emoji = "💰" if row['type'] == 'deposit' else "💸"
-                        
-                        approved_text += f"{type_emoji} {row['id']}\n"
-                        approved_text += f"👤 {row['name']}\n"
-                        approved_text += f"💰 {row['amount']} ريال\n"
-                        approved_text += f"📅 {row['date']}\n\n"
-        except:
-            pass
-        
-        if not found_approved:
-            approved_text += "لا توجد معاملات مُوافق عليها"
-        
-        self.send_message(message['chat']['id'], approved_text, self.admin_keyboard())
+        """عرض المعاملات المُوافق عليها (الأحدث أولاً، 20 معاملة لكل صفحة)"""
+        self.show_paged(message, 'approved')
+    
+    def render_approved_page(self, params, offset, limit):
+        """صفحة من المعاملات المُوافق عليها"""
+        rows, total = self.ledger.transactions_page('approved', offset, limit, newest_first=True)
+        approved_text = f"✅ المعاملات المُوافق عليها ({total}):\n\n"
+        if not rows:
+            return approved_text + "لا توجد معاملات مُوافق عليها", total
+        
+        for row in rows:
+            type_emoji = "💰" if row['type'] == 'deposit' else "💸"
+                    
+            approved_text += f"{type_emoji} {row['id']}\n"
+            approved_text += f"👤 {row['name']}\n"
+            approved_text += f"💰 {row['amount']} ريال\n"
+            approved_text += f"📅 {row['date']}\n\n"
+        return approved_text.rstrip('\n'), total
     
     def show_users_management(self, message):
         """عرض إدارة المستخدمين"""
@@ -3570,13 +3266,11 @@ class ComprehensiveDUXBot:
         banned_count = 0
         
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row.get('is_banned') == 'yes':
-                        banned_count += 1
-                    else:
-                        active_count += 1
+            for row in self.users.all_users():
+                if row.get('is_banned') == 'yes':
+                    banned_count += 1
+                else:
+                    active_count += 1
         except:
             pass
         
@@ -3593,25 +3287,33 @@ class ComprehensiveDUXBot:
         self.send_message(message['chat']['id'], users_text, self.admin_keyboard())
     
     def search_users_admin(self, message, query):
-        """البحث في المستخدمين للأدمن"""
-        results = []
+        """البحث في المستخدمين للأدمن (مرتب حسب قوة التطابق، 10 نتائج لكل صفحة)
+
+        التنقل بين الصفحات بأزرار السابق/التالي، ويمكن البدء من صفحة معينة
+        بكتابة رقمها بعد #، مثال: بحث أحمد #2
+        """
+        page = 1
+        if '#' in query:
+            query, _, page_text = query.rpartition('#')
+            page = int(page_text) if page_text.strip().isdigit() else 1
+        query = query.strip()
+        self.show_paged(message, 'search', {'query': query}, page=page)
+    
+    def render_search_page(self, params, offset, limit):
+        """صفحة من نتائج البحث في المستخدمين"""
+        query = params['query']
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if (query.lower() in row['name'].lower() or 
-                        query in row['customer_id'] or 
-                        query in row['phone']):
-                        results.append(row)
-        except:
-            pass
+            results, total = self.user_search.search(query, offset=offset, limit=limit)
+        except Exception as e:
+            logger.error(f"خطأ في البحث: {e}")
+            results, total = [], 0
         
-        if not results:
-            self.send_message(message['chat']['id'], f"❌ لم يتم العثور على نتائج للبحث: {query}", self.admin_keyboard())
-            return
+        if not total:
+            return f"❌ لم يتم العثور على نتائج للبحث: {query}", 0
         
-        search_text = f"🔍 نتائج البحث عن: {query}\n\n"
-        for user in results[:10]:  # أول 10 نتائج فقط
+        search_text = f"🔍 نتائج البحث عن: {query}\n"
+        search_text += f"📊 {total} نتيجة\n\n"
+        for user in results:
             status = "🚫 محظور" if user.get('is_banned') == 'yes' else "✅ نشط"
             search_text += f"👤 {user['name']}\n"
             search_text += f"🆔 {user['customer_id']}\n"
@@ -3620,8 +3322,7 @@ class ComprehensiveDUXBot:
             if user.get('is_banned') == 'yes' and user.get('ban_reason'):
                 search_text += f"📝 سبب الحظر: {user['ban_reason']}\n"
             search_text += "\n"
-        
-        self.send_message(message['chat']['id'], search_text, self.admin_keyboard())
+        return search_text.rstrip('\n'), total
     
     def start_simple_payment_method_wizard(self, message):
         """معالج مبسط لإضافة وسيلة دفع"""
@@ -3989,35 +3690,19 @@ class ComprehensiveDUXBot:
     def update_payment_method_safe(self, method_id, new_name, new_type, new_account, new_info=""):
         """تحديث آمن لوسيلة الدفع مع تحقق شامل"""
         try:
-            methods = []
-            updated = False
-            original_method = None
-            
-            # قراءة الملف والبحث عن الوسيلة
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        original_method = row.copy()
-                        # تحديث البيانات
-                        row['method_name'] = new_name
-                        row['method_type'] = new_type
-                        row['account_data'] = new_account
-                        row['additional_info'] = new_info
-                        updated = True
-                        logger.info(f"تم العثور على وسيلة الدفع {method_id} وتحديثها")
-                    methods.append(row)
-            
-            if not updated:
+            # البحث عن الوسيلة
+            row = self.catalog.method(method_id)
+            
+            if not row:
                 logger.error(f"لم يتم العثور على وسيلة الدفع {method_id}")
                 return False
             
-            # كتابة الملف المحدث
-            with open('payment_methods.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                fieldnames = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(methods)
+            # تحديث البيانات
+            row['method_name'] = new_name
+            row['method_type'] = new_type
+            row['account_data'] = new_account
+            row['additional_info'] = new_info
+            self.catalog.save_method(row)
             
             logger.info(f"✅ تم حفظ التحديث بنجاح - الوسيلة {method_id}: {new_name}")
             return True
@@ -4201,24 +3886,12 @@ class ComprehensiveDUXBot:
     def toggle_payment_method_status(self, method_id, new_status):
         """تغيير حالة وسيلة الدفع (تشغيل/إيقاف)"""
         try:
-            methods = []
-            updated = False
-            
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        row['status'] = new_status
-                        updated = True
-                        logger.info(f"تم تغيير حالة وسيلة الدفع {method_id} إلى {new_status}")
-                    methods.append(row)
+            row = self.catalog.method(method_id)
             
-            if updated:
-                with open('payment_methods.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(methods)
+            if row:
+                row['status'] = new_status
+                self.catalog.save_method(row)
+                logger.info(f"تم تغيير حالة وسيلة الدفع {method_id} إلى {new_status}")
                 
                 return True
             
@@ -4227,62 +3900,48 @@ class ComprehensiveDUXBot:
             logger.error(f"خطأ في تغيير حالة وسيلة الدفع {method_id}: {e}")
             return False
     
-    def get_all_payment_methods(self):
-        """الحصول على جميع وسائل الدفع"""
-        methods = []
-        try:
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    methods.append(row)
-        except:
-            pass
-        return methods
-    
-    def get_payment_method_by_id(self, method_id):
-        """الحصول على وسيلة دفع بالمعرف"""
-        try:
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        return row
-        except Exception as e:
-            logger.error(f"خطأ في البحث عن وسيلة الدفع {method_id}: {e}")
-        return None
-    
     def show_all_payment_methods(self, message):
-        """عرض جميع وسائل الدفع المتاحة"""
+        """عرض جميع وسائل الدفع المتاحة (10 وسائل لكل صفحة)"""
+        keyboard = [
+            [{'text': '➕ إضافة وسيلة دفع'}, {'text': '✏️ تعديل وسيلة دفع'}],
+            [{'text': '🔄 تحديث القائمة'}, {'text': '↩️ العودة'}]
+        ]
+        
+        reply_keyboard = {
+            'keyboard': keyboard,
+            'resize_keyboard': True,
+            'one_time_keyboard': False
+        }
+        
+        self.show_paged(message, 'payment_methods', keyboard=reply_keyboard)
+    
+    def render_payment_methods_page(self, params, offset, limit):
+        """صفحة من وسائل الدفع مجمعة حسب الشركة"""
         methods_text = "💳 جميع وسائل الدفع:\n\n"
+        total = 0
         
         try:
-            companies = self.get_companies()
-            company_names = {c['id']: c['name'] for c in companies}
+            company_names = {c['id']: c['name'] for c in self.get_companies()}
+            methods, total = self.catalog.methods_page(offset, limit)
             
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                methods_by_company = {}
-                
-                for row in reader:
-                    company_id = row['company_id']
-                    if company_id not in methods_by_company:
-                        methods_by_company[company_id] = []
-                    methods_by_company[company_id].append(row)
-                
-                for company_id, methods in methods_by_company.items():
-                    company_name = company_names.get(company_id, f"شركة #{company_id}")
-                    methods_text += f"🏢 **{company_name}**:\n"
+            methods_by_company = {}
+            for row in methods:
+                methods_by_company.setdefault(row['company_id'], []).append(row)
+            
+            for company_id, methods in methods_by_company.items():
+                company_name = company_names.get(company_id, f"شركة #{company_id}")
+                methods_text += f"🏢 **{company_name}**:\n"
                     
-                    for method in methods:
-                        status_emoji = "✅" if method['status'] == 'active' else "⏹️"
-                        status_text = "نشطة" if method['status'] == 'active' else "متوقفة"
-                        methods_text += f"  {status_emoji} {method['method_name']} (#{method['id']}) - {status_text}\n"
-                        methods_text += f"      📋 النوع: {method['method_type']}\n"
-                        methods_text += f"      💳 البيانات: {method['account_data']}\n"
-                        if method['additional_info']:
-                            methods_text += f"      💡 ملاحظات: {method['additional_info']}\n"
-                        methods_text += "\n"
-                    methods_text += "▫️▫️▫️▫️▫️▫️▫️▫️\n\n"
+                for method in methods:
+                    status_emoji = "✅" if method['status'] == 'active' else "⏹️"
+                    status_text = "نشطة" if method['status'] == 'active' else "متوقفة"
+                    methods_text += f"  {status_emoji} {method['method_name']} (#{method['id']}) - {status_text}\n"
+                    methods_text += f"      📋 النوع: {method['method_type']}\n"
+                    methods_text += f"      💳 البيانات: {method['account_data']}\n"
+                    if method['additional_info']:
+                        methods_text += f"      💡 ملاحظات: {method['additional_info']}\n"
+                    methods_text += "\n"
+                methods_text += "▫️▫️▫️▫️▫️▫️▫️▫️\n\n"
         except:
             methods_text += "❌ خطأ في قراءة البيانات"
         
@@ -4294,19 +3953,7 @@ class ComprehensiveDUXBot:
         
         methods_text += "💡 **مثال:**\n"
         methods_text += "`اضافة_وسيلة_دفع 1 حساب_مدى bank_account رقم:1234567890`"
-        
-        keyboard = [
-            [{'text': '➕ إضافة وسيلة دفع'}, {'text': '✏️ تعديل وسيلة دفع'}],
-            [{'text': '🔄 تحديث القائمة'}, {'text': '↩️ العودة'}]
-        ]
-        
-        reply_keyboard = {
-            'keyboard': keyboard,
-            'resize_keyboard': True,
-            'one_time_keyboard': False
-        }
-        
-        self.send_message(message['chat']['id'], methods_text, reply_keyboard)
+        return methods_text, total
     
     def start_add_payment_method(self, message):
         """بدء إضافة وسيلة دفع جديدة"""
@@ -4390,19 +4037,17 @@ class ComprehensiveDUXBot:
         
         self.send_message(message['chat']['id'], wallet_text)
         
-        # تحديث الحالة
-        if transaction_type == 'deposit':
-            self.user_states[user_id] = f'deposit_wallet_{company_id}_{company["name"] if company else "unknown"}_{selected_method["id"]}'
-        else:
-            self.user_states[user_id] = f'withdraw_wallet_{company_id}_{company["name"] if company else "unknown"}_{selected_method["id"]}'
+        # تحديث الحالة (حالة منظمة بحقول محددة بدلاً من نص يُعاد تقسيمه)
+        self.user_states[user_id] = {
+            'step': 'deposit_wallet' if transaction_type == 'deposit' else 'withdraw_wallet',
+            'company_id': str(company_id),
+            'company_name': company['name'] if company else 'unknown',
+            'method_id': str(selected_method['id'])
+        }
     
     def get_company_by_id(self, company_id):
         """الحصول على شركة بواسطة ID"""
-        companies = self.get_companies()
-        for company in companies:
-            if company['id'] == str(company_id):
-                return company
-        return None
+        return self.catalog.company(company_id)
     
     def start_send_user_message(self, message):
         """بدء إرسال رسالة لعميل محدد"""
@@ -4435,12 +4080,7 @@ class ComprehensiveDUXBot:
         # البحث عن العميل
         user_found = None
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['customer_id'] == customer_id:
-                        user_found = row
-                        break
+            user_found = self.users.find_by_customer_id(customer_id)
         except:
             pass
         
@@ -4485,13 +4125,10 @@ class ComprehensiveDUXBot:
         customer_name = ""
         
         try:
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['customer_id'] == customer_id:
-                        target_telegram_id = row['telegram_id']
-                        customer_name = row['name']
-                        break
+            target_user = self.users.find_by_customer_id(customer_id)
+            if target_user:
+                target_telegram_id = target_user['telegram_id']
+                customer_name = target_user['name']
         except:
             pass
         
@@ -4624,40 +4261,20 @@ class ComprehensiveDUXBot:
     
     def get_all_payment_methods(self):
         """الحصول على جميع وسائل الدفع"""
-        methods = []
         try:
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row.get('status') == 'active':
-                        methods.append(row)
+            return self.catalog.all_methods(active_only=True)
         except:
             pass
-        return methods
+        return []
     
     def delete_payment_method(self, method_id):
         """حذف وسيلة دفع"""
         try:
-            methods = []
-            deleted = False
-            deleted_method = None
-            
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] != str(method_id):
-                        methods.append(row)
-                    else:
-                        deleted = True
-                        deleted_method = row
-            
-            if deleted:
-                # إعادة كتابة الملف بدون الوسيلة المحذوفة
-                with open('payment_methods.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(methods)
+            deleted_method = self.catalog.method(method_id)
+            
+            if deleted_method:
+                # حذف الوسيلة
+                self.catalog.delete_method(method_id)
                 
                 return True, deleted_method
             else:
@@ -4780,11 +4397,7 @@ class ComprehensiveDUXBot:
     def get_payment_method_by_id(self, method_id):
         """الحصول على وسيلة دفع بواسطة المعرف"""
         try:
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        return row
+            return self.catalog.method(method_id)
         except:
             pass
         return None
@@ -4792,23 +4405,11 @@ class ComprehensiveDUXBot:
     def update_payment_method(self, method_id, new_account_data):
         """تحديث بيانات وسيلة الدفع - تحديث قديم"""
         try:
-            methods = []
-            updated = False
-            
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        row['account_data'] = new_account_data
-                        updated = True
-                    methods.append(row)
+            row = self.catalog.method(method_id)
             
-            if updated:
-                with open('payment_methods.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(methods)
+            if row:
+                row['account_data'] = new_account_data
+                self.catalog.save_method(row)
                 
                 return True
             return False
@@ -4818,31 +4419,19 @@ class ComprehensiveDUXBot:
     def update_payment_method_complete(self, method_id, new_data):
         """تحديث شامل لوسيلة الدفع - جميع الحقول"""
         try:
-            methods = []
-            updated = False
-            
-            with open('payment_methods.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == str(method_id):
-                        # تحديث جميع الحقول المطلوبة
-                        if 'method_name' in new_data:
-                            row['method_name'] = new_data['method_name']
-                        if 'method_type' in new_data:
-                            row['method_type'] = new_data['method_type']
-                        if 'account_data' in new_data:
-                            row['account_data'] = new_data['account_data']
-                        if 'additional_info' in new_data:
-                            row['additional_info'] = new_data['additional_info']
-                        updated = True
-                    methods.append(row)
-            
-            if updated:
-                with open('payment_methods.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(methods)
+            row = self.catalog.method(method_id)
+            
+            if row:
+                # تحديث جميع الحقول المطلوبة
+                if 'method_name' in new_data:
+                    row['method_name'] = new_data['method_name']
+                if 'method_type' in new_data:
+                    row['method_type'] = new_data['method_type']
+                if 'account_data' in new_data:
+                    row['account_data'] = new_data['account_data']
+                if 'additional_info' in new_data:
+                    row['additional_info'] = new_data['additional_info']
+                self.catalog.save_method(row)
                 
                 return True
             return False
@@ -4873,6 +4462,11 @@ class ComprehensiveDUXBot:
         
         try:
             with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                # تحديث ملفات التصدير المشتقة من سجل الأحداث ومحرك التخزين قبل النسخ
+                self.ledger.export()
+                for table in ('users', 'companies', 'payment_methods', 'exchange_addresses', 'system_settings'):
+                    self.storage.export_csv(table)
+                
                 # إضافة ملفات البيانات الأساسية
                 files_to_backup = [
                     'users.csv',
@@ -4881,7 +4475,8 @@ class ComprehensiveDUXBot:
                     'complaints.csv',
                     'payment_methods.csv',
                     'exchange_addresses.csv',
-                    'system_settings.csv'
+                    'system_settings.csv',
+                    'events.jsonl'
                 ]
                 
                 for file in files_to_backup:
@@ -4908,28 +4503,25 @@ class ComprehensiveDUXBot:
         
         try:
             # إحصائيات المستخدمين
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                users_count = len(list(csv.DictReader(f)))
-                report_content += f"• عدد المستخدمين المسجلين: {users_count}\n"
+            stats = self.stats.snapshot()
+            users_count = stats['users']['total']
+            report_content += f"• عدد المستخدمين المسجلين: {users_count}\n"
                 
             # إحصائيات المعاملات
-            with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                transactions = list(reader)
-                total_transactions = len(transactions)
-                pending = sum(1 for t in transactions if t['status'] == 'pending')
-                approved = sum(1 for t in transactions if t['status'] == 'approved')
-                rejected = sum(1 for t in transactions if t['status'] == 'rejected')
-                
-                report_content += f"• إجمالي المعاملات: {total_transactions}\n"
-                report_content += f"  - معلقة: {pending}\n"
-                report_content += f"  - موافقة: {approved}\n"
-                report_content += f"  - مرفوضة: {rejected}\n"
+            status_counts = stats['transactions']['by_status']
+            total_transactions = stats['transactions']['total']
+            pending = status_counts.get('pending', 0)
+            approved = status_counts.get('approved', 0)
+            rejected = status_counts.get('rejected', 0)
+            
+            report_content += f"• إجمالي المعاملات: {total_transactions}\n"
+            report_content += f"  - معلقة: {pending}\n"
+            report_content += f"  - موافقة: {approved}\n"
+            report_content += f"  - مرفوضة: {rejected}\n"
                 
             # إحصائيات الشركات
-            with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                companies_count = len(list(csv.DictReader(f)))
-                report_content += f"• عدد الشركات: {companies_count}\n"
+            companies_count = self.catalog.company_counts()[0]
+            report_content += f"• عدد الشركات: {companies_count}\n"
                 
         except Exception as e:
             report_content += f"خطأ في جمع الإحصائيات: {e}\n"
@@ -4943,46 +4535,10 @@ class ComprehensiveDUXBot:
     def send_document(self, chat_id, file_path, caption=""):
         """إرسال ملف لمحادثة معينة"""
         try:
-            # قراءة الملف
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            
-            # إعداد البيانات للإرسال
+            # رفع متدفق: الملف يُقرأ على أجزاء بنوع المحتوى الصحيح حسب امتداده
             url = f"{self.api_url}/sendDocument"
-            
-            # إنشاء multipart/form-data
-            boundary = '----WebKitFormBoundary7MA4YWxkTrZu0gW'
-            
-            # بناء البيانات
-            data = []
-            data.append(f'--{boundary}')
-            data.append('Content-Disposition: form-data; name="chat_id"')
-            data.append('')
-            data.append(str(chat_id))
-            
-            if caption:
-                data.append(f'--{boundary}')
-                data.append('Content-Disposition: form-data; name="caption"')
-                data.append('')
-                data.append(caption)
-            
-            data.append(f'--{boundary}')
-            data.append(f'Content-Disposition: form-data; name="document"; filename="{os.path.basename(file_path)}"')
-            data.append('Content-Type: application/zip')
-            data.append('')
-            
-            # تحويل إلى bytes
-            body = '\r\n'.join(data).encode('utf-8')
-            body += b'\r\n' + file_data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
-            
-            # إنشاء الطلب
-            req = urllib.request.Request(url, data=body)
-            req.add_header('Content-Type', f'multipart/form-data; boundary={boundary}')
-            
-            # إرسال الطلب
-            with urllib.request.urlopen(req, timeout=30) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result
+            return self.transport.post_file(url, {'chat_id': chat_id, 'caption': caption},
+                                            'document', file_path, timeout=60)
                 
         except Exception as e:
             logger.error(f"فشل في إرسال الملف: {e}")
@@ -4996,17 +4552,10 @@ class ComprehensiveDUXBot:
                 username = username[1:]
             
             # استخدام getChat API للحصول على معلومات المحادثة
-            url = f"{self.api_url}/getChat"
-            data = {'chat_id': f'@{username}'}
-            
-            req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'))
-            req.add_header('Content-Type', 'application/json')
+            result = self.api_call('getChat', {'chat_id': f'@{username}'})
             
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                
-                if result.get('ok') and 'result' in result:
-                    return result['result']['id']
+            if result and result.get('ok') and 'result' in result:
+                return result['result']['id']
                     
         except Exception as e:
             logger.error(f"فشل في الحصول على معرف {username}: {e}")
@@ -5165,35 +4714,10 @@ class ComprehensiveDUXBot:
     def save_complaint_reply(self, complaint_id, reply_message):
         """حفظ رد الشكوى"""
         try:
-            complaints = []
-            updated = False
-            
-            with open('complaints.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == complaint_id:
-                        row['status'] = 'resolved'
-                        row['admin_response'] = reply_message
-                        updated = True
-                        logger.info(f"تم العثور على الشكوى {complaint_id} وتحديثها")
-                    complaints.append(row)
+            updated = self.ledger.amend_complaint(complaint_id, status='resolved', admin_response=reply_message)
             
             if updated:
-                with open('complaints.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    fieldnames = ['id', 'customer_id', 'subject', 'message', 'status', 'date', 'admin_response']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    
-                    # تنظيف البيانات قبل الكتابة
-                    clean_complaints = []
-                    for complaint in complaints:
-                        clean_complaint = {}
-                        for field in fieldnames:
-                            clean_complaint[field] = complaint.get(field, '')
-                        clean_complaints.append(clean_complaint)
-                    
-                    writer.writerows(clean_complaints)
-                
+                logger.info(f"تم العثور على الشكوى {complaint_id} وتحديثها")
                 return True
             
             return False
@@ -5207,20 +4731,12 @@ class ComprehensiveDUXBot:
             # البحث عن بيانات العميل
             customer_telegram_id = None
             
-            with open('complaints.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['id'] == complaint_id:
-                        customer_id = row['customer_id']
-                        
-                        # البحث عن التليجرام ID من ملف المستخدمين
-                        with open('users.csv', 'r', encoding='utf-8-sig') as users_file:
-                            users_reader = csv.DictReader(users_file)
-                            for user_row in users_reader:
-                                if user_row['customer_id'] == customer_id:
-                                    customer_telegram_id = user_row['telegram_id']
-                                    break
-                        break
+            complaint = self.ledger.get_complaint(complaint_id)
+            if complaint:
+                # البحث عن التليجرام ID من جدول المستخدمين
+                customer_user = self.users.find_by_customer_id(complaint['customer_id'])
+                if customer_user:
+                    customer_telegram_id = customer_user['telegram_id']
             
             if customer_telegram_id:
                 customer_message = f"""📞 رد على شكواك:
@@ -5245,26 +4761,17 @@ class ComprehensiveDUXBot:
     def send_message_without_keyboard(self, chat_id, text):
         """إرسال رسالة بدون كيبورد"""
         try:
-            url = f"https://api.telegram.org/bot{self.token}/sendMessage"
             data = {
                 'chat_id': chat_id,
                 'text': text,
                 'parse_mode': 'Markdown'
             }
             
-            # تحويل البيانات إلى JSON
-            json_data = json.dumps(data).encode('utf-8')
-            
-            # إنشاء الطلب
-            req = urllib.request.Request(url, data=json_data, headers={
-                'Content-Type': 'application/json',
-                'Content-Length': len(json_data)
-            })
-            
             # إرسال الطلب
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result
+            result = self.api_call('sendMessage', data)
+            if result is None:
+                raise RuntimeError("sendMessage failed")
+            return result
                 
         except Exception as e:
             logger.error(f"Error sending message without keyboard: {e}")
@@ -5404,42 +4911,16 @@ class ComprehensiveDUXBot:
     def save_support_setting(self, key, value):
         """حفظ إعداد الدعم"""
         try:
-            # قراءة الإعدادات الموجودة
-            settings = []
-            setting_exists = False
-            
-            try:
-                with open('system_settings.csv', 'r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        if row['setting_key'] == key:
-                            row['setting_value'] = value
-                            setting_exists = True
-                        settings.append(row)
-            except FileNotFoundError:
-                pass
+            # وصف الإعداد عند إضافته لأول مرة
+            descriptions = {
+                'support_phone': 'رقم هاتف الدعم الفني',
+                'support_telegram': 'حساب التليجرام للدعم',
+                'support_email': 'بريد إلكتروني للدعم',
+                'support_hours': 'ساعات عمل خدمة الدعم'
+            }
             
-            # إضافة الإعداد الجديد إذا لم يكن موجوداً
-            if not setting_exists:
-                descriptions = {
-                    'support_phone': 'رقم هاتف الدعم الفني',
-                    'support_telegram': 'حساب التليجرام للدعم',
-                    'support_email': 'بريد إلكتروني للدعم',
-                    'support_hours': 'ساعات عمل خدمة الدعم'
-                }
-                
-                settings.append({
-                    'setting_key': key,
-                    'setting_value': value,
-                    'description': descriptions.get(key, 'إعداد الدعم')
-                })
-            
-            # حفظ الإعدادات
-            with open('system_settings.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                fieldnames = ['setting_key', 'setting_value', 'description']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(settings)
+            # حفظ الإعداد (يُضاف إذا لم يكن موجوداً)
+            self.settings.set(key, value, descriptions.get(key, 'إعداد الدعم'), create=True)
                 
             logger.info(f"تم حفظ إعداد الدعم: {key} = {value}")
             
@@ -5449,11 +4930,7 @@ class ComprehensiveDUXBot:
     def get_support_setting(self, key, default='غير محدد'):
         """قراءة إعداد الدعم"""
         try:
-            with open('system_settings.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['setting_key'] == key:
-                        return row['setting_value']
+            return self.settings.get(key, default)
         except:
             pass
         return default
@@ -5515,29 +4992,9 @@ class ComprehensiveDUXBot:
                 return
             
             # تحديث عملة المستخدم
-            users = []
-            updated = False
-            
-            with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['telegram_id'] == str(user_id):
-                        row['currency'] = selected_currency
-                        updated = True
-                    # إضافة العملة للمستخدمين الذين لا يملكونها
-                    if 'currency' not in row or not row['currency']:
-                        row['currency'] = selected_currency if row['telegram_id'] == str(user_id) else 'SAR'
-                    users.append(row)
+            updated = self.users.update_by_telegram_id(user_id, currency=selected_currency)
             
             if updated:
-                # إضافة عمود العملة إذا لم يكن موجوداً
-                fieldnames = ['telegram_id', 'name', 'phone', 'customer_id', 'language', 'date', 'is_banned', 'ban_reason', 'currency']
-                
-                with open('users.csv', 'w', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(users)
-                
                 curr_info = self.currencies[selected_currency]
                 success_msg = f"""✅ تم تغيير العملة بنجاح!
                 
@@ -5638,55 +5095,55 @@ class ComprehensiveDUXBot:
                 
                 # قسم 2: بيانات المستخدمين
                 writer.writerow(['👥═══ بيانات المستخدمين ═══'])
-                if os.path.exists('users.csv'):
-                    with open('users.csv', 'r', encoding='utf-8-sig') as uf:
-                        user_reader = csv.reader(uf)
-                        for row in user_reader:
-                            writer.writerow(row)
+                users = self.users.all_users()
+                if users:
+                    writer.writerow(USER_FIELDS)
+                    for row in users:
+                        writer.writerow([row[field] for field in USER_FIELDS])
                 else:
                     writer.writerow(['لا توجد بيانات مستخدمين'])
                 writer.writerow([''])
                 
                 # قسم 3: بيانات المعاملات
                 writer.writerow(['💳═══ بيانات المعاملات ═══'])
-                if os.path.exists('transactions.csv'):
-                    with open('transactions.csv', 'r', encoding='utf-8-sig') as tf:
-                        trans_reader = csv.reader(tf)
-                        for row in trans_reader:
-                            writer.writerow(row)
+                transactions = self.ledger.all_transactions()
+                if transactions:
+                    writer.writerow(TRANSACTION_FIELDS)
+                    for row in transactions:
+                        writer.writerow([row[field] for field in TRANSACTION_FIELDS])
                 else:
                     writer.writerow(['لا توجد بيانات معاملات'])
                 writer.writerow([''])
                 
                 # قسم 4: بيانات الشكاوى
                 writer.writerow(['📨═══ بيانات الشكاوى ═══'])
-                if os.path.exists('complaints.csv'):
-                    with open('complaints.csv', 'r', encoding='utf-8-sig') as cf:
-                        comp_reader = csv.reader(cf)
-                        for row in comp_reader:
-                            writer.writerow(row)
+                complaints = self.ledger.all_complaints()
+                if complaints:
+                    writer.writerow(COMPLAINT_FIELDS)
+                    for row in complaints:
+                        writer.writerow([row[field] for field in COMPLAINT_FIELDS])
                 else:
                     writer.writerow(['لا توجد بيانات شكاوى'])
                 writer.writerow([''])
                 
                 # قسم 5: بيانات الشركات
                 writer.writerow(['🏢═══ بيانات الشركات ═══'])
-                if os.path.exists('companies.csv'):
-                    with open('companies.csv', 'r', encoding='utf-8-sig') as compf:
-                        comp_reader = csv.reader(compf)
-                        for row in comp_reader:
-                            writer.writerow(row)
+                companies = self.catalog.all_companies()
+                if companies:
+                    writer.writerow(COMPANY_FIELDS)
+                    for row in companies:
+                        writer.writerow([row[field] for field in COMPANY_FIELDS])
                 else:
                     writer.writerow(['لا توجد بيانات شركات'])
                 writer.writerow([''])
                 
                 # قسم 6: وسائل الدفع
                 writer.writerow(['💳═══ وسائل الدفع ═══'])
-                if os.path.exists('payment_methods.csv'):
-                    with open('payment_methods.csv', 'r', encoding='utf-8-sig') as pmf:
-                        pm_reader = csv.reader(pmf)
-                        for row in pm_reader:
-                            writer.writerow(row)
+                methods = self.catalog.all_methods()
+                if methods:
+                    writer.writerow(PAYMENT_METHOD_FIELDS)
+                    for row in methods:
+                        writer.writerow([row[field] for field in PAYMENT_METHOD_FIELDS])
                 else:
                     writer.writerow(['لا توجد وسائل دفع'])
                 writer.writerow([''])
@@ -5703,100 +5160,80 @@ class ComprehensiveDUXBot:
             return None
     
     def calculate_comprehensive_statistics(self):
-        """حساب إحصائيات شاملة للنظام"""
+        """حساب إحصائيات شاملة للنظام من العدادات المحدّثة تدريجياً"""
         stats = {}
         
+        def percent(count, total):
+            return f"{(count/total*100):.1f}%"
+        
         try:
+            snapshot = self.stats.snapshot()
+            
             # إحصائيات المستخدمين
-            if os.path.exists('users.csv'):
-                with open('users.csv', 'r', encoding='utf-8-sig') as f:
-                    users = list(csv.DictReader(f))
-                    
-                    # تحليل العملات واللغات
-                    currency_stats = {}
-                    language_stats = {}
-                    for user in users:
-                        currency = user.get('currency', 'SAR')
-                        language = user.get('language', 'ar')
-                        currency_stats[currency] = currency_stats.get(currency, 0) + 1
-                        language_stats[language] = language_stats.get(language, 0) + 1
-                    
-                    user_stats = {
-                        'إجمالي المستخدمين': len(users),
-                        'المستخدمين النشطين': len([u for u in users if u.get('is_banned', 'no').lower() != 'yes']),
-                        'المستخدمين المحظورين': len([u for u in users if u.get('is_banned', 'no').lower() == 'yes']),
-                        'نسبة المستخدمين النشطين': f"{(len([u for u in users if u.get('is_banned', 'no').lower() != 'yes'])/len(users)*100):.1f}%" if users else "0%"
-                    }
-                    
-                    # إضافة إحصائيات العملات
-                    for currency, count in currency_stats.items():
-                        currency_name = self.currencies.get(currency, {}).get('name', currency)
-                        user_stats[f'مستخدمي {currency_name}'] = f"{count} ({(count/len(users)*100):.1f}%)"
-                    
-                    stats['إحصائيات المستخدمين'] = user_stats
+            users = snapshot['users']
+            total_users = users['total']
+            user_stats = {
+                'إجمالي المستخدمين': total_users,
+                'المستخدمين النشطين': users['active'],
+                'المستخدمين المحظورين': users['banned'],
+                'نسبة المستخدمين النشطين': percent(users['active'], total_users) if total_users else "0%"
+            }
+            
+            # إضافة إحصائيات العملات
+            for currency, count in users['by_currency'].items():
+                currency_name = self.currencies.get(currency, {}).get('name', currency)
+                user_stats[f'مستخدمي {currency_name}'] = f"{count} ({percent(count, total_users)})"
+            
+            stats['إحصائيات المستخدمين'] = user_stats
             
             # إحصائيات المعاملات
-            if os.path.exists('transactions.csv'):
-                with open('transactions.csv', 'r', encoding='utf-8-sig') as f:
-                    transactions = list(csv.DictReader(f))
-                    
-                    approved = [t for t in transactions if t.get('status') == 'approved']
-                    rejected = [t for t in transactions if t.get('status') == 'rejected']
-                    pending = [t for t in transactions if t.get('status') == 'pending']
-                    deposits = [t for t in transactions if t.get('type') == 'deposit']
-                    withdrawals = [t for t in transactions if t.get('type') == 'withdraw']
-                    
-                    def safe_float(value):
-                        try:
-                            return float(str(value).replace(',', '')) if value else 0.0
-                        except:
-                            return 0.0
-                    
-                    total_approved_amount = sum(safe_float(t.get('amount', 0)) for t in approved)
-                    total_deposit_amount = sum(safe_float(t.get('amount', 0)) for t in deposits if t.get('status') == 'approved')
-                    total_withdrawal_amount = sum(safe_float(t.get('amount', 0)) for t in withdrawals if t.get('status') == 'approved')
-                    
-                    transaction_stats = {
-                        'إجمالي المعاملات': len(transactions),
-                        'المعاملات المُوافقة': f"{len(approved)} ({(len(approved)/len(transactions)*100):.1f}%)" if transactions else "0",
-                        'المعاملات المرفوضة': f"{len(rejected)} ({(len(rejected)/len(transactions)*100):.1f}%)" if transactions else "0",
-                        'المعاملات المعلقة': f"{len(pending)} ({(len(pending)/len(transactions)*100):.1f}%)" if transactions else "0",
-                        'طلبات الإيداع': f"{len(deposits)} ({(len(deposits)/len(transactions)*100):.1f}%)" if transactions else "0",
-                        'طلبات السحب': f"{len(withdrawals)} ({(len(withdrawals)/len(transactions)*100):.1f}%)" if transactions else "0",
-                        'معدل الموافقة': f"{(len(approved)/len(transactions)*100):.1f}%" if transactions else "0%",
-                        'إجمالي المبالغ المُوافقة': f"{total_approved_amount:,.2f}",
-                        'إجمالي الإيداعات المُوافقة': f"{total_deposit_amount:,.2f}",
-                        'إجمالي السحوبات المُوافقة': f"{total_withdrawal_amount:,.2f}",
-                        'صافي الحركة': f"{total_deposit_amount - total_withdrawal_amount:,.2f}",
-                        'متوسط قيمة المعاملة': f"{(total_approved_amount/len(approved)):,.2f}" if approved else "0"
-                    }
-                    
-                    stats['إحصائيات المعاملات'] = transaction_stats
+            transactions = snapshot['transactions']
+            total = transactions['total']
+            approved = transactions['by_status'].get('approved', 0)
+            rejected = transactions['by_status'].get('rejected', 0)
+            pending = transactions['by_status'].get('pending', 0)
+            deposits = transactions['by_type'].get('deposit', 0)
+            withdrawals = transactions['by_type'].get('withdraw', 0)
+            
+            total_approved_amount = transactions['approved_amount']
+            total_deposit_amount = transactions['approved_amount_by_type'].get('deposit', 0)
+            total_withdrawal_amount = transactions['approved_amount_by_type'].get('withdraw', 0)
+            
+            stats['إحصائيات المعاملات'] = {
+                'إجمالي المعاملات': total,
+                'المعاملات المُوافقة': f"{approved} ({percent(approved, total)})" if total else "0",
+                'المعاملات المرفوضة': f"{rejected} ({percent(rejected, total)})" if total else "0",
+                'المعاملات المعلقة': f"{pending} ({percent(pending, total)})" if total else "0",
+                'طلبات الإيداع': f"{deposits} ({percent(deposits, total)})" if total else "0",
+                'طلبات السحب': f"{withdrawals} ({percent(withdrawals, total)})" if total else "0",
+                'معدل الموافقة': percent(approved, total) if total else "0%",
+                'إجمالي المبالغ المُوافقة': f"{total_approved_amount:,.2f}",
+                'إجمالي الإيداعات المُوافقة': f"{total_deposit_amount:,.2f}",
+                'إجمالي السحوبات المُوافقة': f"{total_withdrawal_amount:,.2f}",
+                'صافي الحركة': f"{total_deposit_amount - total_withdrawal_amount:,.2f}",
+                'متوسط قيمة المعاملة': f"{(total_approved_amount/approved):,.2f}" if approved else "0"
+            }
             
             # إحصائيات الشكاوى والشركات
-            if os.path.exists('complaints.csv'):
-                with open('complaints.csv', 'r', encoding='utf-8-sig') as f:
-                    complaints = list(csv.DictReader(f))
-                    resolved = [c for c in complaints if c.get('status') == 'resolved']
-                    pending_complaints = [c for c in complaints if c.get('status') == 'pending']
-                    
-                    stats['إحصائيات الشكاوى'] = {
-                        'إجمالي الشكاوى': len(complaints),
-                        'الشكاوى المحلولة': f"{len(resolved)} ({(len(resolved)/len(complaints)*100):.1f}%)" if complaints else "0",
-                        'الشكاوى المعلقة': f"{len(pending_complaints)} ({(len(pending_complaints)/len(complaints)*100):.1f}%)" if complaints else "0",
-                        'معدل الحل': f"{(len(resolved)/len(complaints)*100):.1f}%" if complaints else "0%"
-                    }
-            
-            if os.path.exists('companies.csv'):
-                with open('companies.csv', 'r', encoding='utf-8-sig') as f:
-                    companies = list(csv.DictReader(f))
-                    active = [c for c in companies if c.get('is_active', '').lower() == 'active']
-                    
-                    stats['إحصائيات الشركات'] = {
-                        'إجمالي الشركات': len(companies),
-                        'الشركات النشطة': f"{len(active)} ({(len(active)/len(companies)*100):.1f}%)" if companies else "0",
-                        'الشركات غير النشطة': f"{len(companies) - len(active)}"
-                    }
+            complaints = snapshot['complaints']
+            total_complaints = complaints['total']
+            resolved = complaints['by_status'].get('resolved', 0)
+            pending_complaints = complaints['by_status'].get('pending', 0)
+            
+            stats['إحصائيات الشكاوى'] = {
+                'إجمالي الشكاوى': total_complaints,
+                'الشكاوى المحلولة': f"{resolved} ({percent(resolved, total_complaints)})" if total_complaints else "0",
+                'الشكاوى المعلقة': f"{pending_complaints} ({percent(pending_complaints, total_complaints)})" if total_complaints else "0",
+                'معدل الحل': percent(resolved, total_complaints) if total_complaints else "0%"
+            }
+            
+            total_companies, active_companies = self.catalog.company_counts()
+            
+            stats['إحصائيات الشركات'] = {
+                'إجمالي الشركات': total_companies,
+                'الشركات النشطة': f"{active_companies} ({percent(active_companies, total_companies)})" if total_companies else "0",
+                'الشركات غير النشطة': f"{total_companies - active_companies}"
+            }
         
         except Exception as e:
             logger.error(f"خطأ في حساب الإحصائيات: {e}")
@@ -5810,6 +5247,10 @@ if __name__ == "__main__":
         logger.error("BOT_TOKEN غير موجود في متغيرات البيئة")
         exit(1)
     
-    # تشغيل البوت
-    bot = ComprehensiveDUXBot(bot_token)
-    bot.run()
\ No newline at end of file
+    # تشغيل البوت (DUX_ENGINE=async لمحرك asyncio)
+    if os.getenv('DUX_ENGINE', 'threads').strip().lower() == 'async':
+        from async_engine import AsyncBotEngine
+        AsyncBotEngine(ComprehensiveDUXBot(bot_token, background_backups=False)).run()
+    else:
+        bot = ComprehensiveDUXBot(bot_token)
+        bot.run()
\ No newline at end of file
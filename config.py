@@ -30,6 +30,13 @@ BROADCAST_RATE_LIMIT = int(os.getenv("BROADCAST_RATE_LIMIT", "30"))  # messages
 BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "100"))  # users per batch
 BROADCAST_RETRY_ATTEMPTS = int(os.getenv("BROADCAST_RETRY_ATTEMPTS", "3"))
 BROADCAST_RETRY_DELAY = int(os.getenv("BROADCAST_RETRY_DELAY", "5"))  # seconds
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))  # requests in flight
+
+# FSM Storage Configuration (conversation state shared by all bot processes)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))  # seconds before an idle conversation is dropped
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.1"))  # seconds to coalesce writes
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "1"))  # seconds a read may be served from memory
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "1000"))  # cached conversations per process
 
 # Localization Configuration
 DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "ar")
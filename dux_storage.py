@@ -0,0 +1,1362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+طبقة التخزين المقيمة في الذاكرة لبوت DUX
+In-memory storage layer for the DUX bot
+"""
+
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from itertools import islice
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger(__name__)
+
+# أعمدة ملف المستخدمين
+USER_FIELDS = ['telegram_id', 'name', 'phone', 'customer_id', 'language', 'date', 'is_banned', 'ban_reason', 'currency']
+
+# أعمدة ملف المعاملات (العمود الأخير هو عملة العميل وقت إنشاء الطلب)
+TRANSACTION_FIELDS = ['id', 'customer_id', 'telegram_id', 'name', 'type', 'company', 'wallet_number', 'amount',
+                      'exchange_address', 'status', 'date', 'admin_note', 'processed_by', 'currency']
+
+# أعمدة ملف الشكاوى
+COMPLAINT_FIELDS = ['id', 'customer_id', 'subject', 'message', 'status', 'date', 'admin_response']
+
+# أعمدة ملفات الشركات ووسائل الدفع
+COMPANY_FIELDS = ['id', 'name', 'type', 'details', 'is_active']
+PAYMENT_METHOD_FIELDS = ['id', 'company_id', 'method_name', 'method_type', 'account_data', 'additional_info', 'status', 'created_date']
+
+# أعمدة ملف عناوين الصرافة
+EXCHANGE_ADDRESS_FIELDS = ['id', 'address', 'is_active']
+
+# أعمدة ملف إعدادات النظام
+SETTING_FIELDS = ['setting_key', 'setting_value', 'description']
+
+# جداول النظام: الاسم -> (ملف CSV، الأعمدة، المفتاح الأساسي)
+TABLES = {
+    'users': ('users.csv', USER_FIELDS, 'telegram_id'),
+    'transactions': ('transactions.csv', TRANSACTION_FIELDS, 'id'),
+    'complaints': ('complaints.csv', COMPLAINT_FIELDS, 'id'),
+    'companies': ('companies.csv', COMPANY_FIELDS, 'id'),
+    'payment_methods': ('payment_methods.csv', PAYMENT_METHOD_FIELDS, 'id'),
+    'exchange_addresses': ('exchange_addresses.csv', EXCHANGE_ADDRESS_FIELDS, 'id'),
+    'system_settings': ('system_settings.csv', SETTING_FIELDS, 'setting_key'),
+}
+
+# الفهارس الثانوية في قاعدة SQLite
+TABLE_INDEXES = {
+    'users': ['customer_id', 'phone'],
+    'transactions': ['customer_id', 'status'],
+    'complaints': ['customer_id', 'status'],
+    'payment_methods': ['company_id'],
+}
+
+# القيم التي تعني أن الشركة نشطة
+ACTIVE_VALUES = ['active', 'yes', '1', 'true']
+
+
+# تحويل الأرقام العربية-الهندية والفارسية إلى أرقام لاتينية
+DIGIT_TRANSLATION = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+
+# توحيد أشكال الحروف العربية المتقاربة للبحث
+ARABIC_LETTER_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و', 'ئ': 'ي', 'ى': 'ي', 'ة': 'ه',
+})
+
+# التشكيل (الفتحة ... السكون، الألف الخنجرية) والتطويل
+ARABIC_MARKS = set(chr(code) for code in range(0x064B, 0x0653)) | {'\u0670', '\u0640'}
+
+
+def normalize_phone(phone):
+    """توحيد رقم الهاتف للفهرسة (أرقام فقط)"""
+    return ''.join(ch for ch in str(phone or '').translate(DIGIT_TRANSLATION) if ch.isdigit())
+
+
+def normalize_arabic(text):
+    """توحيد النص للبحث: حذف التشكيل والتطويل وتوحيد الألف والهمزة والتاء المربوطة والياء والأرقام"""
+    text = str(text or '').translate(DIGIT_TRANSLATION).translate(ARABIC_LETTER_FOLDING).casefold()
+    return ''.join(ch for ch in text if ch not in ARABIC_MARKS)
+
+
+def unique_id(base, taken):
+    """أول معرف غير مستخدم: base ثم base-2 ثم base-3 ..."""
+    record_id, number = base, 1
+    while record_id in taken:
+        number += 1
+        record_id = f"{base}-{number}"
+    return record_id
+
+
+def atomic_write_csv(path, fieldnames, rows):
+    """كتابة ملف CSV كاملاً عبر ملف مؤقت ثم استبداله دفعة واحدة"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_csv_rows(path, fieldnames):
+    """قراءة ملف CSV قديم مع دعم الصفوف التي تحتوي أعمدة أكثر من العنوان"""
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positional = fieldnames[:len(header)] == header
+        for values in reader:
+            if not values:
+                continue
+            if positional:
+                row = dict(zip(fieldnames, values))
+            else:
+                row = dict(zip(header, values))
+            rows.append({field: row.get(field) or '' for field in fieldnames})
+    return rows
+
+
+class CsvBackend:
+    """محرك التخزين الافتراضي: ملف CSV لكل جدول (نفس سلوك النظام الحالي)
+
+    لا يدعم تعديل صف واحد دون إعادة كتابة الملف، لذلك row_updates = False
+    والمخازن المقيمة في الذاكرة تجمع التعديلات وتكتب الملف كاملاً.
+    """
+
+    name = 'csv'
+    row_updates = False
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self.lock = threading.RLock()
+
+    def path(self, table):
+        """مسار ملف الجدول"""
+        return os.path.join(self.directory, TABLES[table][0])
+
+    def signature(self, table):
+        """بصمة الجدول (وقت التعديل والحجم) لاكتشاف التعديلات الخارجية"""
+        try:
+            stat = os.stat(self.path(table))
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def load(self, table):
+        """قراءة جميع صفوف الجدول بترتيب الملف"""
+        with self.lock:
+            return read_csv_rows(self.path(table), TABLES[table][1])
+
+    def append(self, table, row):
+        """إلحاق صف واحد بنهاية الملف"""
+        fieldnames = TABLES[table][1]
+        path = self.path(table)
+        with self.lock:
+            if not os.path.exists(path):
+                atomic_write_csv(path, fieldnames, [])
+            with open(path, 'a', newline='', encoding='utf-8-sig') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writerow(row)
+
+    def replace(self, table, rows):
+        """إعادة كتابة الجدول كاملاً بشكل ذري"""
+        with self.lock:
+            atomic_write_csv(self.path(table), TABLES[table][1], rows)
+
+    def upsert(self, table, row):
+        """تحديث صف بالمفتاح الأساسي أو إضافته (يعيد كتابة الملف)"""
+        key = TABLES[table][2]
+        with self.lock:
+            rows = self.load(table)
+            for i, existing in enumerate(rows):
+                if existing[key] == row[key]:
+                    rows[i] = row
+                    break
+            else:
+                rows.append(row)
+            self.replace(table, rows)
+
+    def delete(self, table, key_value):
+        """حذف صف بالمفتاح الأساسي"""
+        key = TABLES[table][2]
+        with self.lock:
+            rows = self.load(table)
+            remaining = [row for row in rows if row[key] != str(key_value)]
+            if len(remaining) != len(rows):
+                self.replace(table, remaining)
+            return len(remaining) != len(rows)
+
+    def export_csv(self, table):
+        """الجدول نفسه ملف CSV فلا حاجة للتصدير"""
+        return self.path(table)
+
+
+class SqliteBackend:
+    """محرك تخزين SQLite مع فهارس ووضع WAL للنشر عالي الحمل
+
+    الجداول بنفس أعمدة ملفات CSV (نصوص) ومفتاح أساسي لكل جدول. عند أول تشغيل
+    تُستورد ملفات CSV الموجودة، ويبقى تصدير CSV متاحاً بنفس الصيغة للإدارة.
+    """
+
+    name = 'sqlite'
+    row_updates = True
+
+    def __init__(self, db_path='dux_bot.db', csv_directory='.'):
+        self.db_path = db_path
+        self.csv_directory = csv_directory
+        self.lock = threading.RLock()
+        self.writes = {table: 0 for table in TABLES}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_schema()
+        self.import_csv_files()
+
+    def create_schema(self):
+        """إنشاء الجداول والفهارس إذا لم تكن موجودة"""
+        with self.lock:
+            for table, (_, fieldnames, key) in TABLES.items():
+                columns = ', '.join(f'"{field}" TEXT NOT NULL DEFAULT \'\'' for field in fieldnames)
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns}, PRIMARY KEY ("{key}"))')
+                for column in TABLE_INDEXES.get(table, []):
+                    self.conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_{column}" ON "{table}" ("{column}")')
+
+    def import_csv_files(self):
+        """استيراد ملفات CSV الحالية إلى الجداول الفارغة (مرة واحدة)"""
+        for table, (filename, fieldnames, key) in TABLES.items():
+            count = self.conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            csv_path = os.path.join(self.csv_directory, filename)
+            if count or not os.path.exists(csv_path):
+                continue
+            rows = read_csv_rows(csv_path, fieldnames)
+            if key == 'id':
+                # معرفات مكررة في الملفات القديمة: يُحفظ السجل المكرر باسم جديد بدل تجاهله
+                seen = set()
+                for row in rows:
+                    if row['id'] in seen:
+                        new_id = unique_id(row['id'], seen)
+                        logger.warning(f"معرف مكرر {row['id']} في {filename}: تم استيراده باسم {new_id}")
+                        row['id'] = new_id
+                    seen.add(row['id'])
+            if rows:
+                self.insert_rows(table, rows, 'INSERT OR IGNORE')
+                logger.info(f"تم استيراد {len(rows)} صف من {filename} إلى قاعدة البيانات")
+
+    def insert_rows(self, table, rows, verb):
+        """إدخال مجموعة صفوف في معاملة واحدة"""
+        fieldnames = TABLES[table][1]
+        columns = ', '.join(f'"{field}"' for field in fieldnames)
+        placeholders = ', '.join('?' for _ in fieldnames)
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(f'{verb} INTO "{table}" ({columns}) VALUES ({placeholders})',
+                                      [[str(row.get(field, '')) for field in fieldnames] for row in rows])
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.writes[table] += 1
+
+    def signature(self, table):
+        """بصمة الجدول: تتغير عند كتابة اتصال آخر (data_version) أو عند كتابتنا"""
+        with self.lock:
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            return (data_version, self.writes[table])
+
+    def load(self, table):
+        """قراءة جميع صفوف الجدول بترتيب الإدخال"""
+        fieldnames = TABLES[table][1]
+        columns = ', '.join(f'"{field}"' for field in fieldnames)
+        with self.lock:
+            cursor = self.conn.execute(f'SELECT {columns} FROM "{table}" ORDER BY rowid')
+            return [dict(zip(fieldnames, values)) for values in cursor]
+
+    def append(self, table, row):
+        """إضافة صف (أو تحديثه إذا كان المفتاح موجوداً)"""
+        self.upsert(table, row)
+
+    def replace(self, table, rows):
+        """استبدال محتوى الجدول كاملاً في معاملة واحدة"""
+        fieldnames = TABLES[table][1]
+        columns = ', '.join(f'"{field}"' for field in fieldnames)
+        placeholders = ', '.join('?' for _ in fieldnames)
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.execute(f'DELETE FROM "{table}"')
+                self.conn.executemany(f'INSERT OR REPLACE INTO "{table}" ({columns}) VALUES ({placeholders})',
+                                      [[str(row.get(field, '')) for field in fieldnames] for row in rows])
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.writes[table] += 1
+
+    def upsert(self, table, row):
+        """تحديث صف واحد بالمفتاح الأساسي أو إضافته (عملية مفهرسة)"""
+        _, fieldnames, key = TABLES[table]
+        columns = ', '.join(f'"{field}"' for field in fieldnames)
+        placeholders = ', '.join('?' for _ in fieldnames)
+        updates = ', '.join(f'"{field}" = excluded."{field}"' for field in fieldnames if field != key)
+        with self.lock:
+            self.conn.execute(
+                f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders}) '
+                f'ON CONFLICT ("{key}") DO UPDATE SET {updates}',
+                [str(row.get(field, '')) for field in fieldnames])
+            self.writes[table] += 1
+
+    def delete(self, table, key_value):
+        """حذف صف بالمفتاح الأساسي"""
+        key = TABLES[table][2]
+        with self.lock:
+            cursor = self.conn.execute(f'DELETE FROM "{table}" WHERE "{key}" = ?', [str(key_value)])
+            self.writes[table] += 1
+            return cursor.rowcount > 0
+
+    def export_csv(self, table):
+        """تصدير الجدول إلى ملف CSV بنفس الصيغة المعتادة"""
+        filename, fieldnames, _ = TABLES[table]
+        path = os.path.join(self.csv_directory, filename)
+        atomic_write_csv(path, fieldnames, self.load(table))
+        return path
+
+
+def create_storage_backend():
+    """اختيار محرك التخزين من متغيرات البيئة
+
+    DUX_STORAGE_BACKEND = csv (افتراضي) أو sqlite
+    DUX_SQLITE_PATH = مسار قاعدة البيانات (افتراضي dux_bot.db)
+    """
+    backend = os.getenv('DUX_STORAGE_BACKEND', 'csv').strip().lower()
+    if backend == 'sqlite':
+        return SqliteBackend(os.getenv('DUX_SQLITE_PATH', 'dux_bot.db'))
+    if backend != 'csv':
+        logger.warning(f"محرك تخزين غير معروف '{backend}'، سيتم استخدام CSV")
+    return CsvBackend()
+
+
+def parse_amount(value):
+    """تحويل مبلغ نصي إلى رقم عشري دقيق (القيم غير الصالحة تُعامل كصفر)"""
+    try:
+        return Decimal(str(value).replace(',', '').strip()) if value else Decimal('0')
+    except (InvalidOperation, ValueError):
+        return Decimal('0')
+
+
+class StatsAggregator:
+    """إحصائيات لوحة الأدمن محدّثة تدريجياً مع كل عملية كتابة
+
+    المخازن (UserTable و EventLedger) تستدعي *_changed بالصف القديم والجديد
+    عند كل إضافة أو تعديل، فيُطرح أثر الصف القديم ويُضاف أثر الجديد. بذلك
+    يصبح عرض الإحصائيات قراءة عدادات جاهزة مهما كبر حجم السجل.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset_users([])
+        self.reset_records('transaction', [])
+        self.reset_records('complaint', [])
+
+    @staticmethod
+    def bump(counter, key, delta):
+        """تعديل عداد مع حذف المفاتيح التي وصلت للصفر"""
+        value = counter.get(key, 0) + delta
+        if value:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+
+    def reset_users(self, rows):
+        """إعادة حساب إحصائيات المستخدمين بالكامل (عند التحميل فقط)"""
+        with self.lock:
+            self.users_total = 0
+            self.users_banned = 0
+            self.users_by_currency = {}
+            self.users_by_language = {}
+            for row in rows:
+                self.apply_user(row, 1)
+
+    def apply_user(self, row, sign):
+        """إضافة (+1) أو طرح (-1) أثر مستخدم واحد"""
+        self.users_total += sign
+        if row.get('is_banned', 'no').lower() == 'yes':
+            self.users_banned += sign
+        self.bump(self.users_by_currency, row.get('currency', ''), sign)
+        self.bump(self.users_by_language, row.get('language', ''), sign)
+
+    def user_changed(self, old, new):
+        """تحديث الإحصائيات بعد إضافة مستخدم أو تعديله"""
+        with self.lock:
+            if old is not None:
+                self.apply_user(old, -1)
+            if new is not None:
+                self.apply_user(new, 1)
+
+    def reset_records(self, entity, rows):
+        """إعادة حساب إحصائيات المعاملات أو الشكاوى بالكامل (عند التحميل فقط)"""
+        with self.lock:
+            if entity == 'transaction':
+                self.transactions_total = 0
+                self.transactions_by_status = {}
+                self.transactions_by_type = {}
+                self.approved_amount_by_type = {}
+                self.approved_amount_by_currency = {}
+            else:
+                self.complaints_total = 0
+                self.complaints_by_status = {}
+            for row in rows:
+                self.apply_record(entity, row, 1)
+
+    def apply_record(self, entity, row, sign):
+        """إضافة أو طرح أثر معاملة أو شكوى واحدة"""
+        status = row.get('status', '')
+        if entity == 'complaint':
+            self.complaints_total += sign
+            self.bump(self.complaints_by_status, status, sign)
+            return
+        self.transactions_total += sign
+        self.bump(self.transactions_by_status, status, sign)
+        self.bump(self.transactions_by_type, row.get('type', ''), sign)
+        if status == 'approved':
+            amount = parse_amount(row.get('amount')) * sign
+            self.bump(self.approved_amount_by_type, row.get('type', ''), amount)
+            self.bump(self.approved_amount_by_currency, row.get('currency', ''), amount)
+
+    def record_changed(self, entity, old, new):
+        """تحديث الإحصائيات بعد إنشاء معاملة/شكوى أو تعديلها"""
+        with self.lock:
+            if old is not None:
+                self.apply_record(entity, old, -1)
+            if new is not None:
+                self.apply_record(entity, new, 1)
+
+    def snapshot(self):
+        """نسخة ثابتة من جميع العدادات لعرضها"""
+        with self.lock:
+            return {
+                'users': {
+                    'total': self.users_total,
+                    'banned': self.users_banned,
+                    'active': self.users_total - self.users_banned,
+                    'by_currency': dict(self.users_by_currency),
+                    'by_language': dict(self.users_by_language),
+                },
+                'transactions': {
+                    'total': self.transactions_total,
+                    'by_status': dict(self.transactions_by_status),
+                    'by_type': dict(self.transactions_by_type),
+                    'approved_amount': sum(self.approved_amount_by_type.values(), Decimal('0')),
+                    'approved_amount_by_type': dict(self.approved_amount_by_type),
+                    'approved_amount_by_currency': dict(self.approved_amount_by_currency),
+                },
+                'complaints': {
+                    'total': self.complaints_total,
+                    'by_status': dict(self.complaints_by_status),
+                },
+            }
+
+
+class UserSearchIndex:
+    """فهرس بحث المستخدمين للأدمن (الاسم ورقم العميل والهاتف)
+
+    كل حقل يُوحّد بـ normalize_arabic ثم يُفهرس بمقاطع ثلاثية (n-grams) للبحث
+    داخل الكلمة، وبالبادئات القصيرة (حرف أو حرفين) للاستعلامات القصيرة.
+    المرشحون هم تقاطع قوائم المقاطع، ثم يُتحقق منهم ويُرتبون حسب قوة التطابق.
+    """
+
+    GRAM = 3
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.postings = {}
+
+    @staticmethod
+    def fields(row):
+        """الحقول الموحدة لمستخدم: (كلمات الاسم، رقم العميل، أرقام الهاتف)"""
+        return normalize_arabic(row.get('name')).split(), normalize_arabic(row.get('customer_id')).strip(), \
+            normalize_phone(row.get('phone'))
+
+    @classmethod
+    def grams(cls, term):
+        """مقاطع البحث لكلمة واحدة (ثلاثية، أو بادئة الكلمة إذا كانت قصيرة)"""
+        if len(term) < cls.GRAM:
+            return {('p', term)}
+        return {('g', term[i:i + cls.GRAM]) for i in range(len(term) - cls.GRAM + 1)}
+
+    @classmethod
+    def terms(cls, fields):
+        """جميع مفاتيح الفهرس لحقول مستخدم موحدة"""
+        name_tokens, customer_id, phone = fields
+        terms = set()
+        for term in name_tokens + [customer_id, phone]:
+            if not term:
+                continue
+            terms |= cls.grams(term)
+            terms.update(('p', term[:length]) for length in range(1, cls.GRAM) if len(term) >= length)
+        return terms
+
+    def reset_users(self, rows):
+        """إعادة بناء الفهرس بالكامل (عند التحميل فقط)"""
+        with self.lock:
+            self.docs = {}
+            self.postings = {}
+            for row in rows:
+                self.add(row)
+
+    def add(self, row):
+        """فهرسة مستخدم"""
+        key = row['telegram_id']
+        if key in self.docs:
+            self.remove(self.docs[key][0])
+        fields = self.fields(row)
+        self.docs[key] = (dict(row), fields)
+        for term in self.terms(fields):
+            self.postings.setdefault(term, set()).add(key)
+
+    def remove(self, row):
+        """حذف مستخدم من الفهرس"""
+        key = row['telegram_id']
+        if key not in self.docs:
+            return
+        for term in self.terms(self.docs.pop(key)[1]):
+            keys = self.postings.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[term]
+
+    def user_changed(self, old, new):
+        """تحديث الفهرس بعد إضافة مستخدم أو تعديله"""
+        with self.lock:
+            if old is not None:
+                self.remove(old)
+            if new is not None:
+                self.add(new)
+
+    @staticmethod
+    def query_tokens(query):
+        """كلمات البحث الموحدة: ما يشبه رقم هاتف (+ وأرقام وشرطات وأقواس) يُوحّد مثل الهاتف
+        المفهرس، والأجزاء المتتالية منه (مثل +966 50 123 4567) تُدمج في كلمة واحدة"""
+        tokens = []
+        previous_phone = False
+        for token in normalize_arabic(query).split():
+            is_phone = bool(normalize_phone(token)) and not token.strip('+-()0123456789')
+            if is_phone:
+                token = normalize_phone(token)
+                if previous_phone:
+                    tokens[-1] += token
+                    continue
+            tokens.append(token)
+            previous_phone = is_phone
+        return tokens
+
+    @staticmethod
+    def variants(token):
+        """صيغ كلمة البحث (رقم الهاتف المحلي يُبحث عنه أيضاً بدون الصفر البادئ)"""
+        variants = {token}
+        if token.isdigit() and token.lstrip('0'):
+            variants.add(token.lstrip('0'))
+        return variants
+
+    def candidates(self, token):
+        """المستخدمون المرشحون لكلمة بحث واحدة"""
+        keys = set()
+        for variant in self.variants(token):
+            postings = [self.postings.get(term, set()) for term in self.grams(variant)]
+            postings.sort(key=len)
+            matched = set(postings[0])
+            for other in postings[1:]:
+                matched &= other
+            keys |= matched
+        return keys
+
+    @staticmethod
+    def score(token, variants, fields):
+        """قوة تطابق كلمة بحث مع حقول مستخدم موحدة (0 = غير مطابق)"""
+        name_tokens, customer_id, phone = fields
+        if token == customer_id:
+            return 100
+        if phone and (token == phone or (len(token) >= 7 and any(phone.endswith(v) for v in variants))):
+            return 90
+        if token in name_tokens:
+            return 60
+        if any(name.startswith(token) for name in name_tokens):
+            return 40
+        if customer_id.startswith(token) or any(phone.startswith(v) for v in variants if phone):
+            return 30
+        if token in customer_id or any(v in phone for v in variants if phone) or \
+                any(token in name for name in name_tokens):
+            return 20
+        return 0
+
+    def search(self, query, offset=0, limit=10):
+        """بحث مرتب ومقسم لصفحات: يُرجع (نتائج الصفحة، إجمالي النتائج)"""
+        tokens = self.query_tokens(query)
+        if not tokens:
+            return [], 0
+        with self.lock:
+            keys = None
+            for token in tokens:
+                matched = self.candidates(token)
+                keys = matched if keys is None else keys & matched
+                if not keys:
+                    return [], 0
+            ranked = []
+            token_variants = [(token, self.variants(token)) for token in tokens]
+            for key in keys:
+                fields = self.docs[key][1]
+                scores = [self.score(token, variants, fields) for token, variants in token_variants]
+                if all(scores):
+                    ranked.append((-sum(scores), fields[0], fields[1], key))
+            ranked.sort()
+            return [dict(self.docs[item[3]][0]) for item in ranked[offset:offset + limit]], len(ranked)
+
+
+class UserTable:
+    """جدول المستخدمين المقيم في الذاكرة مع فهارس على telegram_id و customer_id و phone"""
+
+    def __init__(self, backend, listeners=()):
+        self.backend = backend
+        # مستقبلو التغييرات (الإحصائيات وفهرس البحث): reset_users و user_changed
+        self.listeners = list(listeners)
+        self.lock = threading.RLock()
+        self.rows = []
+        self.by_telegram_id = {}
+        self.by_customer_id = {}
+        self.by_phone = {}
+        self.signature = None
+        self.reload()
+
+    def reload(self):
+        """إعادة تحميل الجدول وبناء الفهارس من التخزين"""
+        with self.lock:
+            self.rows = self.backend.load('users')
+            self.rebuild_indexes()
+            self.signature = self.backend.signature('users')
+            for listener in self.listeners:
+                listener.reset_users(self.rows)
+
+    def rebuild_indexes(self):
+        """بناء الفهارس الثانوية (كل مفتاح يشير لقائمة صفوف للحفاظ على التكرارات)"""
+        self.by_telegram_id = {}
+        self.by_customer_id = {}
+        self.by_phone = {}
+        for row in self.rows:
+            self.index_row(row)
+
+    def index_row(self, row):
+        """إضافة صف واحد للفهارس"""
+        self.by_telegram_id.setdefault(row['telegram_id'], []).append(row)
+        if row['customer_id']:
+            self.by_customer_id.setdefault(row['customer_id'], []).append(row)
+        phone_key = normalize_phone(row['phone'])
+        if phone_key:
+            self.by_phone.setdefault(phone_key, []).append(row)
+
+    def refresh(self):
+        """إعادة التحميل فقط إذا تغير التخزين من خارج البوت"""
+        if self.backend.signature('users') != self.signature:
+            self.reload()
+
+    def lookup(self, index, key):
+        """جلب أول صف مطابق كنسخة مستقلة"""
+        with self.lock:
+            self.refresh()
+            matches = index().get(key)
+            return dict(matches[0]) if matches else None
+
+    def find_by_telegram_id(self, telegram_id):
+        """البحث بمعرف التليجرام"""
+        return self.lookup(lambda: self.by_telegram_id, str(telegram_id))
+
+    def find_by_customer_id(self, customer_id):
+        """البحث برقم العميل"""
+        return self.lookup(lambda: self.by_customer_id, str(customer_id))
+
+    def find_by_phone(self, phone):
+        """البحث برقم الهاتف"""
+        return self.lookup(lambda: self.by_phone, normalize_phone(phone))
+
+    def all_users(self):
+        """نسخة من جميع المستخدمين بترتيب الملف"""
+        with self.lock:
+            self.refresh()
+            return [dict(row) for row in self.rows]
+
+    def new_customer_id(self):
+        """رقم عميل غير مستخدم: C وآخر 6 أرقام من الوقت، ثم الرقم التالي إذا كان محجوزاً"""
+        with self.lock:
+            number = int(time.time()) % 1000000
+            while f"C{number:06d}" in self.by_customer_id:
+                number = (number + 1) % 1000000
+            return f"C{number:06d}"
+
+    def add_user(self, user):
+        """إضافة مستخدم جديد (إلحاق صف واحد)، ويُولّد رقم العميل تحت القفل إذا لم يُحدد"""
+        with self.lock:
+            self.refresh()
+            row = {field: str(user.get(field) or '') for field in USER_FIELDS}
+            if not row['customer_id']:
+                row['customer_id'] = self.new_customer_id()
+            self.backend.append('users', row)
+            self.rows.append(row)
+            self.index_row(row)
+            self.signature = self.backend.signature('users')
+            for listener in self.listeners:
+                listener.user_changed(None, row)
+            return dict(row)
+
+    def update_users(self, rows, changes):
+        """تعديل صفوف موجودة ثم حفظها (صف واحد في SQLite، الملف كاملاً في CSV)"""
+        if not rows:
+            return False
+        for row in rows:
+            old = dict(row)
+            row.update({key: str(value) for key, value in changes.items()})
+            for listener in self.listeners:
+                listener.user_changed(old, row)
+        if 'customer_id' in changes or 'phone' in changes or 'telegram_id' in changes:
+            self.rebuild_indexes()
+        if self.backend.row_updates:
+            for row in rows:
+                self.backend.upsert('users', row)
+        else:
+            self.backend.replace('users', self.rows)
+        self.signature = self.backend.signature('users')
+        return True
+
+    def update_by_telegram_id(self, telegram_id, **changes):
+        """تحديث بيانات مستخدم بمعرف التليجرام"""
+        with self.lock:
+            self.refresh()
+            return self.update_users(self.by_telegram_id.get(str(telegram_id), []), changes)
+
+    def update_by_customer_id(self, customer_id, **changes):
+        """تحديث بيانات مستخدم برقم العميل"""
+        with self.lock:
+            self.refresh()
+            return self.update_users(self.by_customer_id.get(str(customer_id), []), changes)
+
+
+class EventLedger:
+    """سجل أحداث إلحاقي للمعاملات والشكاوى مع حالة حالية مجسّدة في الذاكرة
+
+    كل إنشاء أو تعديل يُكتب كحدث JSON في سطر واحد بنهاية events.jsonl (مصدر
+    الحقيقة وسجل التدقيق)، فتكلفة الإنشاء أو التعديل ثابتة مهما كبر السجل.
+    الحالة الحالية تُبنى عند التشغيل من آخر نقطة حفظ (checkpoint) ثم إعادة
+    تشغيل الأحداث التالية لها، وتُحفظ نقطة جديدة دورياً في خيط خلفي.
+    ملفات transactions.csv و complaints.csv تصدير مشتق يُحدّث مع كل نقطة حفظ
+    وعند الطلب (export) قبل النسخ الاحتياطي أو التقارير، وفي SQLite يُحدّث الصف
+    مع كل حدث. readonly=True يبني الحالة دون كتابة أي شيء عدا التصدير، للأدوات
+    الخارجية التي تحتاج ملفات CSV محدّثة.
+    """
+
+    ENTITIES = {
+        'transaction': (TRANSACTION_FIELDS, 'transactions'),
+        'complaint': (COMPLAINT_FIELDS, 'complaints'),
+    }
+
+    def __init__(self, backend, log_path='events.jsonl', checkpoint_path='events_checkpoint.json',
+                 checkpoint_every=500, checkpoint_interval=300, stats=None, readonly=False):
+        self.backend = backend
+        self.stats = stats
+        self.readonly = readonly
+        self.log_path = log_path
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.lock = threading.RLock()
+        self.state = {entity: {} for entity in self.ENTITIES}
+        # فهرس ثانوي: رقم العميل -> معرفات معاملاته بترتيب إنشائها
+        self.by_customer = {}
+        # تقسيم المعاملات حسب الحالة: الحالة -> معرفات مرتبة حسب وقت دخولها لهذه الحالة
+        self.by_status = {}
+        self.seq = 0
+        self.pending_events = 0
+        self.last_checkpoint = time.time()
+        self.dirty = set()
+        # يمنع تداخل كتابة نقطتي حفظ أو تصديرين (يُؤخذ دائماً قبل self.lock)
+        self.checkpoint_lock = threading.Lock()
+        self.checkpoint_thread = None
+        self.load()
+
+    def load(self):
+        """استعادة الحالة: نقطة الحفظ ثم إعادة تشغيل الأحداث اللاحقة"""
+        if not os.path.exists(self.checkpoint_path) and not os.path.exists(self.log_path):
+            if not self.readonly:
+                self.migrate_from_backend()
+            return
+        with self.lock:
+            offset = 0
+            if os.path.exists(self.checkpoint_path):
+                with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+                self.seq = checkpoint['seq']
+                offset = checkpoint['offset']
+                for entity in self.ENTITIES:
+                    self.state[entity] = checkpoint['state'].get(entity, {})
+                self.rebuild_indexes()
+            replayed = self.replay(offset)
+            if self.readonly:
+                # كل الكيانات تُصدّر عند الطلب لأن ملفات CSV قد تكون أقدم من السجل
+                self.dirty = set(self.ENTITIES)
+                return
+            if self.backend.row_updates:
+                # مزامنة جداول المحرك مع الحالة المستعادة مرة واحدة عند التشغيل
+                for entity, (_, table) in self.ENTITIES.items():
+                    self.backend.replace(table, self.state[entity].values())
+        if replayed:
+            logger.info(f"تمت إعادة تشغيل {replayed} حدث من سجل الأحداث")
+            self.checkpoint()
+
+    def replay(self, offset):
+        """إعادة تشغيل الأحداث من موضع محدد في السجل"""
+        if not os.path.exists(self.log_path):
+            return 0
+        replayed = 0
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    if self.readonly:
+                        # قد يكون البوت في منتصف كتابة هذا السطر
+                        break
+                    # سطر ناقص بسبب توقف مفاجئ أثناء الكتابة: يُحذف
+                    logger.warning(f"حذف حدث غير مكتمل في نهاية {self.log_path}")
+                    f.close()
+                    with open(self.log_path, 'r+b') as wf:
+                        wf.truncate(offset)
+                    break
+                offset += len(line)
+                event = json.loads(line.decode('utf-8'))
+                if event['seq'] <= self.seq:
+                    continue
+                self.apply(event)
+                self.seq = event['seq']
+                replayed += 1
+        return replayed
+
+    def migrate_from_backend(self):
+        """الترحيل الأول: تحويل صفوف جداول المعاملات والشكاوى الحالية إلى أحداث إنشاء"""
+        migrated = 0
+        for entity, (_, table) in self.ENTITIES.items():
+            rows = {}
+            for row in self.backend.load(table):
+                if row['id'] in rows:
+                    # معرف مكرر في البيانات القديمة: يُحفظ السجل باسم جديد بدل حذفه
+                    new_id = unique_id(row['id'], rows)
+                    logger.warning(f"معرف مكرر {row['id']} في {table}: تم حفظ السجل المكرر باسم {new_id}")
+                    row = dict(row, id=new_id)
+                rows[row['id']] = row
+            for row in rows.values():
+                self.append_event(entity, 'created', row['id'], row, auto_checkpoint=False, sync_backend=False)
+                migrated += 1
+        open(self.log_path, 'ab').close()
+        if migrated:
+            logger.info(f"تم ترحيل {migrated} سجل إلى سجل الأحداث")
+        if self.backend.row_updates:
+            for entity, (_, table) in self.ENTITIES.items():
+                self.backend.replace(table, self.state[entity].values())
+        self.checkpoint()
+
+    def rebuild_indexes(self):
+        """بناء الفهارس الثانوية من الحالة الحالية"""
+        self.by_customer = {}
+        self.by_status = {}
+        for trans_id, row in self.state['transaction'].items():
+            self.by_customer.setdefault(row.get('customer_id', ''), []).append(trans_id)
+            self.by_status.setdefault(row.get('status', ''), {})[trans_id] = None
+        if self.stats:
+            for entity in self.ENTITIES:
+                self.stats.reset_records(entity, self.state[entity].values())
+
+    def move_status(self, trans_id, old_status, new_status):
+        """نقل معاملة بين أقسام الحالات"""
+        if old_status is not None:
+            self.by_status.get(old_status, {}).pop(trans_id, None)
+        self.by_status.setdefault(new_status, {})[trans_id] = None
+
+    def apply(self, event):
+        """تطبيق حدث واحد على الحالة المجسّدة"""
+        table = self.state[event['entity']]
+        previous = table.get(event['id'])
+        old_status = previous.get('status', '') if previous else None
+        if event['type'] == 'created':
+            table[event['id']] = dict(event['data'])
+            if event['entity'] == 'transaction' and previous is None:
+                self.by_customer.setdefault(event['data'].get('customer_id', ''), []).append(event['id'])
+        elif previous is not None:
+            # صف جديد بدل تعديل القديم: نسخة الجدول السطحية تبقى لقطة ثابتة لنقطة الحفظ
+            table[event['id']] = {**previous, **event['data']}
+        else:
+            return
+        if self.stats:
+            self.stats.record_changed(event['entity'], previous, table[event['id']])
+        if event['entity'] == 'transaction':
+            new_status = table[event['id']].get('status', '')
+            if new_status != old_status:
+                self.move_status(event['id'], old_status, new_status)
+        self.dirty.add(event['entity'])
+
+    def append_event(self, entity, event_type, record_id, data, auto_checkpoint=True, sync_backend=True):
+        """إلحاق حدث بالسجل (سطر واحد مع fsync) ثم تطبيقه وتحديث جدول المحرك"""
+        with self.lock:
+            event = {
+                'seq': self.seq + 1,
+                'ts': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'entity': entity,
+                'type': event_type,
+                'id': record_id,
+                'data': data
+            }
+            with open(self.log_path, 'ab') as f:
+                f.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            self.seq = event['seq']
+            self.apply(event)
+            if sync_backend and self.backend.row_updates:
+                self.backend.upsert(self.ENTITIES[entity][1], self.state[entity][record_id])
+            self.pending_events += 1
+            if auto_checkpoint and (self.pending_events >= self.checkpoint_every or
+                                    time.time() - self.last_checkpoint >= self.checkpoint_interval):
+                self.checkpoint_soon()
+            return dict(self.state[entity][record_id])
+
+    def checkpoint_soon(self):
+        """بدء نقطة حفظ في خيط خلفي حتى لا ينتظر الطلب الحالي كتابة الحالة كاملة"""
+        with self.lock:
+            if self.checkpoint_thread is not None and self.checkpoint_thread.is_alive():
+                return
+            self.checkpoint_thread = threading.Thread(target=self.run_checkpoint, name='ledger-checkpoint',
+                                                      daemon=True)
+            self.checkpoint_thread.start()
+
+    def run_checkpoint(self):
+        """تنفيذ نقطة الحفظ في الخيط الخلفي"""
+        try:
+            self.checkpoint()
+        except Exception as e:
+            logger.error(f"خطأ في حفظ نقطة استعادة سجل الأحداث: {e}")
+
+    def snapshot(self):
+        """لقطة ثابتة للحالة ونسخ الجداول السطحية فقط (الصفوف لا تُعدّل في مكانها)"""
+        with self.lock:
+            state = {entity: dict(rows) for entity, rows in self.state.items()}
+            entities = set(self.dirty)
+            self.dirty.clear()
+            return state, entities
+
+    def checkpoint(self):
+        """حفظ نقطة استعادة ذرية للحالة الحالية وتحديث ملفات التصدير
+
+        تحت قفل السجل تُؤخذ لقطة سطحية فقط، والكتابة (صفاً صفاً حتى لا يحتكر
+        الخيط الخلفي المفسّر) تتم بعد تحريره فلا تتأخر الأحداث الجديدة.
+        """
+        with self.checkpoint_lock:
+            with self.lock:
+                offset = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+                seq = self.seq
+                state, entities = self.snapshot()
+                self.pending_events = 0
+                self.last_checkpoint = time.time()
+            tmp_path = f"{self.checkpoint_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(f'{{"seq": {seq}, "offset": {offset}, "state": {{')
+                for i, (entity, rows) in enumerate(state.items()):
+                    f.write(f'{", " if i else ""}{json.dumps(entity)}: {{')
+                    for j, (record_id, row) in enumerate(rows.items()):
+                        f.write(f'{", " if j else ""}{json.dumps(record_id, ensure_ascii=False)}: '
+                                f'{json.dumps(row, ensure_ascii=False)}')
+                    f.write('}')
+                f.write('}}')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_path)
+            self.write_exports(entities, state)
+
+    def export(self):
+        """كتابة ملفات CSV المشتقة للكيانات التي تغيرت منذ آخر تصدير (قبل النسخ الاحتياطي والتقارير)"""
+        with self.checkpoint_lock:
+            state, entities = self.snapshot()
+            self.write_exports(entities, state)
+
+    def write_exports(self, entities, state):
+        """كتابة ملفات CSV للكيانات المحددة من لقطة الحالة (خارج قفل السجل)"""
+        try:
+            for entity in entities:
+                table = self.ENTITIES[entity][1]
+                if self.backend.row_updates:
+                    self.backend.export_csv(table)
+                else:
+                    self.backend.replace(table, state[entity].values())
+        except Exception:
+            with self.lock:
+                self.dirty |= entities
+            raise
+
+    def new_id(self, entity, prefix):
+        """معرف جديد بالبادئة ووقت الإنشاء (مثل DEP20250101120000) لا يتكرر داخل السجل"""
+        with self.lock:
+            return unique_id(f"{prefix}{datetime.now().strftime('%Y%m%d%H%M%S')}", self.state[entity])
+
+    def create(self, entity, record, prefix=None):
+        """إنشاء سجل جديد (مع prefix يُولّد المعرف هنا تحت القفل فلا يتصادم طلبان في نفس الثانية)"""
+        fieldnames = self.ENTITIES[entity][0]
+        with self.lock:
+            if prefix:
+                record = dict(record, id=self.new_id(entity, prefix))
+            row = {field: str(record.get(field, '')) for field in fieldnames}
+            if not row['id'] or row['id'] in self.state[entity]:
+                raise ValueError(f"معرف غير صالح أو مستخدم مسبقاً: {row['id']!r}")
+            return self.append_event(entity, 'created', row['id'], row)
+
+    def update(self, entity, record_id, changes):
+        """تعديل سجل موجود (يُرجع None إذا لم يوجد)"""
+        with self.lock:
+            if record_id not in self.state[entity]:
+                return None
+            return self.append_event(entity, 'updated', record_id,
+                                     {key: str(value) for key, value in changes.items()})
+
+    def add_transaction(self, transaction, prefix=None):
+        """إضافة معاملة جديدة"""
+        return self.create('transaction', transaction, prefix)
+
+    def amend(self, trans_id, **changes):
+        """تعديل حالة/ملاحظة/منفذ معاملة"""
+        return self.update('transaction', trans_id, changes)
+
+    def get(self, trans_id):
+        """جلب معاملة بمعرفها"""
+        with self.lock:
+            row = self.state['transaction'].get(trans_id)
+            return dict(row) if row else None
+
+    def all_transactions(self):
+        """جميع المعاملات بترتيب إنشائها"""
+        with self.lock:
+            return [dict(row) for row in self.state['transaction'].values()]
+
+    def customer_transactions(self, customer_id):
+        """معاملات عميل واحد عبر الفهرس الثانوي (بدون مسح السجل كاملاً)"""
+        with self.lock:
+            table = self.state['transaction']
+            return [dict(table[trans_id]) for trans_id in self.by_customer.get(customer_id, [])]
+
+    def transactions_by_status(self, status, newest_first=False, limit=None):
+        """معاملات حالة واحدة فقط (الأحدث دخولاً للحالة أولاً عند الطلب)"""
+        with self.lock:
+            table = self.state['transaction']
+            ids = self.by_status.get(status, {})
+            ordered = reversed(ids) if newest_first else iter(ids)
+            rows = []
+            for trans_id in ordered:
+                if limit is not None and len(rows) >= limit:
+                    break
+                rows.append(dict(table[trans_id]))
+            return rows
+
+    def transactions_page(self, status, offset=0, limit=10, newest_first=False):
+        """صفحة من معاملات حالة واحدة: (صفوف الصفحة فقط، إجمالي معاملات الحالة)"""
+        with self.lock:
+            table = self.state['transaction']
+            ids = self.by_status.get(status, {})
+            ordered = reversed(ids) if newest_first else iter(ids)
+            return [dict(table[trans_id]) for trans_id in islice(ordered, offset, offset + limit)], len(ids)
+
+    def status_counts(self):
+        """عدد المعاملات في كل حالة"""
+        with self.lock:
+            return {status: len(ids) for status, ids in self.by_status.items()}
+
+    def add_complaint(self, complaint, prefix=None):
+        """إضافة شكوى جديدة"""
+        return self.create('complaint', complaint, prefix)
+
+    def amend_complaint(self, complaint_id, **changes):
+        """تعديل حالة شكوى أو الرد عليها"""
+        return self.update('complaint', complaint_id, changes)
+
+    def get_complaint(self, complaint_id):
+        """جلب شكوى بمعرفها"""
+        with self.lock:
+            row = self.state['complaint'].get(complaint_id)
+            return dict(row) if row else None
+
+    def all_complaints(self):
+        """جميع الشكاوى بترتيب إنشائها"""
+        with self.lock:
+            return [dict(row) for row in self.state['complaint'].values()]
+
+
+class SettingsStore:
+    """ذاكرة مؤقتة لإعدادات النظام مع دوال قراءة مُنمّطة
+
+    الإعدادات تُحمّل مرة واحدة، وتُعاد قراءتها فقط عند تغير بصمة الجدول
+    (تُفحص مرة كل check_interval ثانية على الأكثر) أو عند الحفظ من البوت.
+    """
+
+    def __init__(self, backend, check_interval=5):
+        self.backend = backend
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.settings = {}
+        self.signature = None
+        self.last_check = 0
+        self.reload()
+
+    def reload(self):
+        """تحميل الإعدادات من التخزين"""
+        with self.lock:
+            self.settings = {row['setting_key']: row for row in self.backend.load('system_settings')
+                             if row['setting_key']}
+            self.signature = self.backend.signature('system_settings')
+            self.last_check = time.time()
+
+    def refresh(self):
+        """فحص التعديل من الخارج بحد أقصى مرة كل check_interval ثانية"""
+        now = time.time()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        if self.backend.signature('system_settings') != self.signature:
+            self.reload()
+
+    def get(self, key, default=None):
+        """قراءة إعداد كنص"""
+        with self.lock:
+            self.refresh()
+            row = self.settings.get(key)
+            return row['setting_value'] if row else default
+
+    def get_str(self, key, default=''):
+        """قراءة إعداد نصي (القيمة الفارغة تُعامل كغير موجودة)"""
+        return self.get(key) or default
+
+    def get_int(self, key, default=0):
+        """قراءة إعداد كرقم صحيح"""
+        try:
+            return int(str(self.get(key)).strip())
+        except (TypeError, ValueError):
+            return int(default)
+
+    def get_decimal(self, key, default='0'):
+        """قراءة إعداد كرقم عشري دقيق (للمبالغ)"""
+        try:
+            return Decimal(str(self.get(key)).replace(',', '').strip())
+        except (InvalidOperation, TypeError, ValueError):
+            return Decimal(str(default))
+
+    def all_settings(self):
+        """جميع الإعدادات بترتيب الملف"""
+        with self.lock:
+            self.refresh()
+            return [dict(row) for row in self.settings.values()]
+
+    def set(self, key, value, description=None, create=False):
+        """حفظ إعداد وتحديث الذاكرة فوراً (يُرجع False إذا لم يوجد ولم يُطلب إنشاؤه)"""
+        with self.lock:
+            self.reload()
+            row = self.settings.get(key)
+            if row is None:
+                if not create:
+                    return False
+                row = self.settings[key] = {'setting_key': key, 'setting_value': '', 'description': description or ''}
+            row['setting_value'] = str(value)
+            self.backend.upsert('system_settings', row)
+            self.signature = self.backend.signature('system_settings')
+            return True
+
+
+class Catalog:
+    """كتالوج الشركات ووسائل الدفع المقيم في الذاكرة مع لوحات مفاتيح جاهزة
+
+    يُحمّل الجدولان مرة واحدة ويُفهرسان بالمعرف ونوع الخدمة والشركة. لا يُعاد
+    التحميل إلا عند استدعاء invalidate() من مسارات التعديل (معالج الشركات،
+    تعديل وسائل الدفع وتفعيلها/إيقافها)، ومع كل إبطال يزيد رقم الإصدار.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.RLock()
+        self.version = 0
+        self.loaded = False
+        self.companies = {}
+        self.companies_by_type = {}
+        self.companies_active_count = 0
+        self.methods = {}
+        self.methods_by_company = {}
+        self.keyboards = {}
+        # نصوص الرسائل المبنية من الكتالوج (منفصلة عن لوحات المفاتيح الجاهزة)
+        self.texts = {}
+
+    def invalidate(self):
+        """إبطال الكتالوج بعد أي تعديل على الشركات أو وسائل الدفع"""
+        with self.lock:
+            self.loaded = False
+            self.keyboards = {}
+            self.texts = {}
+            self.version += 1
+
+    def load(self):
+        """تحميل الجدولين وبناء الفهارس"""
+        companies = {row['id']: row for row in self.backend.load('companies')}
+        methods = {row['id']: row for row in self.backend.load('payment_methods')}
+
+        # الشركات النشطة حسب نوع الخدمة (None = جميع الشركات النشطة)
+        companies_by_type = {None: [], 'deposit': [], 'withdraw': []}
+        for company_id, company in companies.items():
+            if company['is_active'].lower() not in ACTIVE_VALUES:
+                continue
+            companies_by_type[None].append(company_id)
+            for service_type in ('deposit', 'withdraw'):
+                if company['type'] in (service_type, 'both'):
+                    companies_by_type[service_type].append(company_id)
+            if company['type'] not in ('deposit', 'withdraw', 'both'):
+                companies_by_type.setdefault(company['type'], []).append(company_id)
+
+        # وسائل الدفع النشطة لكل شركة
+        methods_by_company = {}
+        for method_id, method in methods.items():
+            if method['status'] == 'active':
+                methods_by_company.setdefault(method['company_id'], []).append(method_id)
+
+        self.companies = companies
+        self.companies_by_type = companies_by_type
+        self.companies_active_count = sum(1 for company in companies.values()
+                                          if company['is_active'].lower() == 'active')
+        self.methods = methods
+        self.methods_by_company = methods_by_company
+        self.keyboards = {}
+        self.texts = {}
+        self.loaded = True
+
+    def ensure_loaded(self):
+        """تحميل الكتالوج عند أول استخدام بعد الإبطال"""
+        if not self.loaded:
+            self.load()
+
+    def active_companies(self, service_type=None):
+        """الشركات النشطة (مع فلترة اختيارية حسب نوع الخدمة)"""
+        with self.lock:
+            self.ensure_loaded()
+            return [dict(self.companies[company_id]) for company_id in self.companies_by_type.get(service_type, [])]
+
+    def all_companies(self):
+        """جميع الشركات بما فيها غير النشطة"""
+        with self.lock:
+            self.ensure_loaded()
+            return [dict(company) for company in self.companies.values()]
+
+    def company_counts(self):
+        """عدد الشركات الكلي وعدد الشركات النشطة (محسوبان عند التحميل)"""
+        with self.lock:
+            self.ensure_loaded()
+            return len(self.companies), self.companies_active_count
+
+    def company(self, company_id, include_inactive=False):
+        """جلب شركة بالمعرف"""
+        with self.lock:
+            self.ensure_loaded()
+            company = self.companies.get(str(company_id))
+            if not company:
+                return None
+            if not include_inactive and company['is_active'].lower() not in ACTIVE_VALUES:
+                return None
+            return dict(company)
+
+    def company_methods(self, company_id):
+        """وسائل الدفع النشطة لشركة"""
+        with self.lock:
+            self.ensure_loaded()
+            return [dict(self.methods[method_id]) for method_id in self.methods_by_company.get(str(company_id), [])]
+
+    def all_methods(self, active_only=False):
+        """جميع وسائل الدفع"""
+        with self.lock:
+            self.ensure_loaded()
+            return [dict(method) for method in self.methods.values()
+                    if not active_only or method['status'] == 'active']
+
+    def methods_page(self, offset=0, limit=10):
+        """صفحة من جميع وسائل الدفع: (وسائل الصفحة، الإجمالي)"""
+        with self.lock:
+            self.ensure_loaded()
+            return [dict(method) for method in islice(self.methods.values(), offset, offset + limit)], len(self.methods)
+
+    def method(self, method_id):
+        """جلب وسيلة دفع بالمعرف"""
+        with self.lock:
+            self.ensure_loaded()
+            method = self.methods.get(str(method_id))
+            return dict(method) if method else None
+
+    def add_company(self, company):
+        """إضافة شركة جديدة"""
+        with self.lock:
+            self.backend.append('companies', {field: str(company.get(field, '')) for field in COMPANY_FIELDS})
+            self.invalidate()
+
+    def save_company(self, company):
+        """حفظ تعديلات شركة موجودة"""
+        with self.lock:
+            self.backend.upsert('companies', {field: str(company.get(field, '')) for field in COMPANY_FIELDS})
+            self.invalidate()
+
+    def delete_company(self, company_id):
+        """حذف شركة بالمعرف"""
+        with self.lock:
+            deleted = self.backend.delete('companies', company_id)
+            self.invalidate()
+            return deleted
+
+    def add_method(self, method):
+        """إضافة وسيلة دفع جديدة"""
+        with self.lock:
+            self.backend.append('payment_methods', {field: str(method.get(field, '')) for field in PAYMENT_METHOD_FIELDS})
+            self.invalidate()
+
+    def save_method(self, method):
+        """حفظ تعديلات وسيلة دفع موجودة"""
+        with self.lock:
+            self.backend.upsert('payment_methods', {field: str(method.get(field, '')) for field in PAYMENT_METHOD_FIELDS})
+            self.invalidate()
+
+    def delete_method(self, method_id):
+        """حذف وسيلة دفع بالمعرف"""
+        with self.lock:
+            deleted = self.backend.delete('payment_methods', method_id)
+            self.invalidate()
+            return deleted
+
+    def keyboard(self, key, builder):
+        """لوحة مفاتيح محفوظة حسب المفتاح (تُبنى مرة واحدة لكل إصدار من الكتالوج)
+
+        اللوحة المُرجعة مشتركة بين جميع المستخدمين ولا يجب تعديلها.
+        """
+        with self.lock:
+            self.ensure_loaded()
+            if key not in self.keyboards:
+                self.keyboards[key] = builder()
+            return self.keyboards[key]
+
+    def text(self, key, builder):
+        """نص رسالة محفوظ حسب المفتاح (مثل قائمة وسائل دفع شركة)، يُبطل مع الكتالوج"""
+        with self.lock:
+            self.ensure_loaded()
+            if key not in self.texts:
+                self.texts[key] = builder()
+            return self.texts[key]
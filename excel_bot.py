@@ -8,12 +8,11 @@ import os
 import json
 import time
 import logging
-from urllib.request import urlopen, Request
-from urllib.parse import urlencode
-from urllib.error import URLError, HTTPError
 from datetime import datetime
 import csv
 
+from telegram_transport import get_transport, TRANSPORT_ERRORS
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +24,7 @@ class ExcelTelegramBot:
     def __init__(self, token):
         self.token = token
         self.api_url = f"https://api.telegram.org/bot{token}"
+        self.transport = get_transport()
         self.offset = 0
         self.users_file = 'users_data.csv'
         self.transactions_file = 'transactions_data.csv'
@@ -69,21 +69,11 @@ class ExcelTelegramBot:
         """Make HTTP request to Telegram API"""
         url = f"{self.api_url}/{method}"
         
-        if params:
-            if method in ['sendMessage', 'sendPhoto', 'sendDocument']:
-                data = urlencode(params).encode('utf-8')
-                request = Request(url, data=data)
-                request.add_header('Content-Type', 'application/x-www-form-urlencoded')
-            else:
-                url += '?' + urlencode(params)
-                request = Request(url)
-        else:
-            request = Request(url)
-            
         try:
-            with urlopen(request, timeout=30) as response:
-                return json.loads(response.read().decode('utf-8'))
-        except (URLError, HTTPError, json.JSONDecodeError) as e:
+            if params and method in ['sendMessage', 'sendPhoto', 'sendDocument']:
+                return self.transport.post_form(url, params, timeout=30)
+            return self.transport.get_json(url, params, timeout=30)
+        except TRANSPORT_ERRORS + (json.JSONDecodeError,) as e:
             logger.error(f"API request failed: {e}")
             return None
             
@@ -13,6 +13,22 @@ from openpyxl.worksheet.table import Table, TableStyleInfo
 from datetime import datetime
 import os
 
+from dux_storage import EventLedger, create_storage_backend
+
+
+def refresh_ledger_exports():
+    """تحديث transactions.csv و complaints.csv من سجل الأحداث قبل قراءتها
+
+    البوت يكتب هذه الملفات مع نقاط الحفظ فقط، لذلك تُبنى الحالة الحالية من
+    events.jsonl (دون الكتابة فيه) وتُصدّر عند الطلب.
+    """
+    if not os.path.exists('events.jsonl'):
+        return
+    try:
+        EventLedger(create_storage_backend(), readonly=True).export()
+    except Exception as e:
+        print(f"خطأ في تحديث ملفات المعاملات من سجل الأحداث: {e}")
+
 class ExcelFormatter:
     def __init__(self):
         # ألوان النظام
@@ -41,6 +57,7 @@ class ExcelFormatter:
     
     def create_professional_workbook(self, filename='DUX_Professional_Report.xlsx'):
         """إنشاء مصنف Excel احترافي"""
+        refresh_ledger_exports()
         wb = openpyxl.Workbook()
         
         # حذف الورقة الافتراضية
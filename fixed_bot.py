@@ -5,14 +5,12 @@ LangSense Bot - مُحسن ومُبسط
 """
 
 import os
-import json
 import time
 import logging
 import csv
 from datetime import datetime
-import urllib.request
-import urllib.parse
-import urllib.error
+
+from telegram_transport import get_transport, TelegramHTTPError
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -25,6 +23,7 @@ class LangSenseBot:
     def __init__(self, token):
         self.token = token
         self.api_url = f"https://api.telegram.org/bot{token}"
+        self.transport = get_transport()
         self.offset = 0
         self.init_files()
         
@@ -66,20 +65,12 @@ class LangSenseBot:
         
         try:
             if data:
-                # تحويل البيانات إلى JSON
-                json_data = json.dumps(data).encode('utf-8')
-                req = urllib.request.Request(url, data=json_data)
-                req.add_header('Content-Type', 'application/json')
-            else:
-                req = urllib.request.Request(url)
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result
+                # إرسال البيانات بصيغة JSON
+                return self.transport.post_json(url, data, timeout=10)
+            return self.transport.get_json(url, timeout=10)
                 
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8')
-            logger.error(f"HTTP Error {e.code}: {error_body}")
+        except TelegramHTTPError as e:
+            logger.error(f"HTTP Error {e.status}: {e.body}")
             return None
         except Exception as e:
             logger.error(f"خطأ في API: {e}")
@@ -103,8 +94,7 @@ class LangSenseBot:
         url = f"{self.api_url}/getUpdates?offset={self.offset + 1}&timeout=10"
         
         try:
-            with urllib.request.urlopen(url, timeout=15) as response:
-                return json.loads(response.read().decode('utf-8'))
+            return self.transport.get_json(url, timeout=15)
         except Exception as e:
             logger.error(f"خطأ في جلب التحديثات: {e}")
             return None
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+توجيه الرسائل بالجداول: قاموس للنصوص المطابقة وشجرة بادئات للأوامر النصية
+Table-driven message routing (exact-match dict + prefix trie)
+"""
+
+
+def state_step(state):
+    """اسم مرحلة الحالة: الحالة النصية نفسها أو الحقل step في الحالة المنظمة (dict)"""
+    if isinstance(state, dict):
+        return state.get('step', '')
+    return state if isinstance(state, str) else ''
+
+
+class PrefixTrie:
+    """شجرة بادئات: أطول بادئة مسجلة تطابق بداية النص بمرور واحد على حروفه"""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, prefix, value):
+        """تسجيل بادئة وقيمتها"""
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        # المفتاح None لا يتعارض مع أي حرف
+        node[None] = value
+
+    def longest(self, text):
+        """(القيمة، طول البادئة) لأطول بادئة تطابق النص، أو (None, 0)"""
+        node = self.root
+        match, length = None, 0
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                match, length = node[None], i + 1
+        return match, length
+
+
+class MessageRouter:
+    """جدول توجيه: النص المطابق تماماً يُبحث عنه في قاموس، والأوامر ذات المعامل
+    (مثل "حظر C810563 سبب") في شجرة البادئات ويُمرر باقي النص للمعالج.
+
+    يُبنى الجدول مرة واحدة عند تشغيل البوت، والبحث لا يمر على قائمة الشروط.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = PrefixTrie()
+
+    def add(self, keys, handler):
+        """تسجيل معالج لنص أو مجموعة نصوص مطابقة: handler(message)"""
+        for key in ([keys] if isinstance(keys, str) else keys):
+            self.exact[key] = handler
+        return handler
+
+    def add_prefix(self, prefixes, handler, with_rest=True):
+        """تسجيل معالج لبادئة أو أكثر: handler(message, باقي_النص)
+
+        with_rest=False للمعالجات التي تقرأ الرسالة أو الحالة كاملة: handler(message)
+        """
+        for prefix in ([prefixes] if isinstance(prefixes, str) else prefixes):
+            self.prefixes.insert(prefix, (handler, with_rest))
+        return handler
+
+    def resolve(self, key):
+        """(المعالج، المعاملات الإضافية) أو (None, ()) إذا لم يوجد تطابق"""
+        handler = self.exact.get(key)
+        if handler is not None:
+            return handler, ()
+        match, length = self.prefixes.longest(key)
+        if match is None:
+            return None, ()
+        handler, with_rest = match
+        return handler, ((key[length:].strip(),) if with_rest else ())
+
+    def dispatch(self, key, message):
+        """تنفيذ المعالج المطابق، وإرجاع False إذا لم يوجد"""
+        handler, args = self.resolve(key)
+        if handler is None:
+            return False
+        handler(message, *args)
+        return True
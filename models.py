@@ -229,3 +229,15 @@ class OutboxRecipient(Base):
     
     def __repr__(self):
         return f"<OutboxRecipient(outbox_id={self.outbox_id}, user_id={self.user_id}, status={self.status})>"
+
+class FSMRecord(Base):
+    """Persisted aiogram FSM state and data, shared by all bot processes"""
+    __tablename__ = 'fsm_states'
+    
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, nullable=False, default='{}')  # JSON
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+    
+    def __repr__(self):
+        return f"<FSMRecord(key={self.key}, state={self.state})>"
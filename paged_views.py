@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+عروض مقسمة لصفحات بأزرار تنقل inline وتقسيم الرسائل الطويلة
+Paginated inline views and long-message chunking
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+
+# الحد الأقصى لطول نص رسالة Telegram
+TELEGRAM_TEXT_LIMIT = 4096
+
+# بادئة بيانات أزرار التنقل (callback_data محدودة بـ 64 بايت)
+CALLBACK_PREFIX = 'pg'
+
+
+def split_text(text, limit=TELEGRAM_TEXT_LIMIT):
+    """تقسيم نص طويل إلى أجزاء لا تتجاوز الحد، عند نهايات الأسطر قدر الإمكان"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    chunks.append(text)
+    return chunks
+
+
+class PagedViews:
+    """سجل العروض المقسمة ومؤشراتها على الخادم
+
+    كل عرض دالة render(params, offset, limit) ترجع (نص الصفحة، إجمالي العناصر)
+    وتقرأ عناصر الصفحة فقط من الجدول. فتح العرض ينشئ مؤشراً قصيراً يحفظ
+    المعاملات (مثل نص البحث) في الذاكرة، وأزرار التنقل تحمل المؤشر ورقم
+    الصفحة فقط. المؤشر عشوائي حتى لا تشير أزرار رسالة قديمة بعد إعادة التشغيل
+    إلى عرض آخر، وأقدم المؤشرات تُحذف عند تجاوز max_cursors.
+    """
+
+    def __init__(self, max_cursors=1000):
+        self.views = {}
+        self.cursors = OrderedDict()
+        self.max_cursors = max_cursors
+        self.lock = threading.Lock()
+
+    def register(self, name, render, page_size=10):
+        """تسجيل عرض جديد"""
+        self.views[name] = (render, page_size)
+
+    def open(self, name, params=None):
+        """إنشاء مؤشر لعرض بمعاملاته"""
+        with self.lock:
+            token = secrets.token_hex(4)
+            while token in self.cursors:
+                token = secrets.token_hex(4)
+            self.cursors[token] = (name, params or {})
+            while len(self.cursors) > self.max_cursors:
+                self.cursors.popitem(last=False)
+            return token
+
+    def render(self, token, page):
+        """نص الصفحة وأزرار التنقل، أو None إذا انتهت صلاحية المؤشر"""
+        with self.lock:
+            cursor = self.cursors.get(token)
+            if cursor is None:
+                return None
+            self.cursors.move_to_end(token)
+        name, params = cursor
+        render, page_size = self.views[name]
+        page = max(page, 1)
+        text, total = render(params, (page - 1) * page_size, page_size)
+        pages = max((total + page_size - 1) // page_size, 1)
+        if page > pages:
+            page = pages
+            text, total = render(params, (page - 1) * page_size, page_size)
+        if pages > 1:
+            text = f"{text}\n\n📄 الصفحة {page} من {pages}"
+        if len(text) > TELEGRAM_TEXT_LIMIT:
+            text = text[:TELEGRAM_TEXT_LIMIT - 1] + '…'
+        return text, self.markup(token, page, pages), pages
+
+    @staticmethod
+    def markup(token, page, pages):
+        """أزرار السابق/التالي (None إذا كانت صفحة واحدة)"""
+        if pages <= 1:
+            return None
+        row = []
+        if page > 1:
+            row.append({'text': '⬅️ السابق', 'callback_data': f"{CALLBACK_PREFIX}|{token}|{page - 1}"})
+        # زر رقم الصفحة للعرض فقط (لا يعدّل الرسالة)
+        row.append({'text': f"{page}/{pages}", 'callback_data': f"{CALLBACK_PREFIX}|{token}|-"})
+        if page < pages:
+            row.append({'text': 'التالي ➡️', 'callback_data': f"{CALLBACK_PREFIX}|{token}|{page + 1}"})
+        return {'inline_keyboard': [row]}
+
+    @staticmethod
+    def parse(data):
+        """استخراج (المؤشر، رقم الصفحة) من بيانات الزر، أو None"""
+        parts = (data or '').split('|')
+        if len(parts) != 3 or parts[0] != CALLBACK_PREFIX or not parts[2].isdigit():
+            return None
+        return parts[1], int(parts[2])
@@ -7,12 +7,12 @@ Manages broadcast queues, rate limiting, and delivery tracking
 import asyncio
 import logging
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from sqlalchemy import select, and_
+from sqlalchemy import select, insert, update, and_, literal, Row
 
 from models import (
     User, Outbox, OutboxRecipient, OutboxStatus, 
@@ -20,11 +20,67 @@ from models import (
 )
 from config import (
     BROADCAST_RATE_LIMIT, BROADCAST_CHUNK_SIZE, 
-    BROADCAST_RETRY_ATTEMPTS, BROADCAST_RETRY_DELAY
+    BROADCAST_RETRY_ATTEMPTS, BROADCAST_RETRY_DELAY, BROADCAST_CONCURRENCY
 )
 
 logger = logging.getLogger(__name__)
 
+class RatePacer:
+    """Token bucket that spaces sends exactly 1/rate seconds apart
+    
+    Each send reserves the next free time slot, so concurrent senders never
+    exceed the rate and never leave the budget idle. A TelegramRetryAfter
+    pauses every sender until `paused_until` (senders already sleeping on a
+    slot check it again when they wake up) and lowers the rate once per
+    pause; the rate then climbs back to the target after a second's worth of
+    successful sends.
+    """
+    
+    def __init__(self, rate: float):
+        self.target_rate = rate
+        self.rate = rate
+        self.next_slot = 0.0
+        self.paused_until = 0.0
+        self.successes = 0
+    
+    async def acquire(self):
+        """Wait for the next send slot outside any flood wait"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # A flood wait may have started while we slept on the slot
+            if loop.time() >= self.paused_until:
+                return
+    
+    def success(self):
+        """Record a delivered message and recover the rate gradually"""
+        self.successes += 1
+        if self.rate < self.target_rate and self.successes >= self.rate:
+            self.rate = min(self.target_rate, self.rate * 1.1)
+            self.successes = 0
+    
+    def retry_after(self, seconds: float) -> bool:
+        """Pause all senders for the time Telegram asked and slow down
+        
+        Returns True when this starts a new pause. A 429 for a request that was
+        already in flight when the pause began only extends the pause.
+        """
+        now = asyncio.get_running_loop().time()
+        new_pause = now >= self.paused_until
+        if new_pause:
+            self.rate = max(1.0, self.rate * 0.8)
+            self.successes = 0
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.next_slot = max(self.next_slot, self.paused_until)
+        return new_pause
+
 class BroadcastService:
     """Service for handling broadcast operations"""
     
@@ -33,6 +89,9 @@ class BroadcastService:
         self.session_maker = session_maker
         self.broadcast_queue = asyncio.Queue()
         self.is_running = False
+        # Shared by all broadcasts: the limit applies to the bot, not to one broadcast
+        self.pacer = RatePacer(BROADCAST_RATE_LIMIT)
+        self.in_flight = asyncio.Semaphore(BROADCAST_CONCURRENCY)
         
     async def queue_broadcast(self, outbox_id: int, target_type: str, 
                             target_value: Optional[str], message_text: str,
@@ -79,29 +138,22 @@ class BroadcastService:
         
         try:
             async with self.session_maker() as session:
-                # Get target users
-                users = await self.get_target_users(
-                    session, broadcast["target_type"], broadcast.get("target_value")
+                # Create recipient records for the target users in the database
+                total = await self.create_recipient_records(
+                    session, outbox_id, broadcast["target_type"], broadcast.get("target_value")
                 )
+                await session.commit()
                 
-                if not users:
+                if not total:
                     logger.warning(f"No target users found for broadcast {outbox_id}")
                     await self.update_broadcast_status(session, outbox_id, OutboxStatus.COMPLETED)
                     return
                 
-                # Create recipient records
-                await self.create_recipient_records(session, outbox_id, users)
-                await session.commit()
+                logger.info(f"Starting delivery for broadcast {outbox_id} to {total} users")
                 
-                logger.info(f"Starting delivery for broadcast {outbox_id} to {len(users)} users")
-                
-                # Process in chunks
-                for chunk in self.chunk_list(users, BROADCAST_CHUNK_SIZE):
+                # Process in chunks (pacing happens per message inside send_to_chunk)
+                async for chunk in self.pending_recipients(session, outbox_id, BROADCAST_CHUNK_SIZE):
                     await self.send_to_chunk(session, outbox_id, chunk, broadcast)
-                    
-                    # Rate limiting
-                    sleep_time = len(chunk) / BROADCAST_RATE_LIMIT
-                    await asyncio.sleep(sleep_time)
                 
                 # Update broadcast status
                 await self.update_broadcast_status(session, outbox_id, OutboxStatus.COMPLETED)
@@ -112,63 +164,116 @@ class BroadcastService:
             async with self.session_maker() as session:
                 await self.update_broadcast_status(session, outbox_id, OutboxStatus.FAILED)
     
-    async def get_target_users(self, session: AsyncSession, target_type: str, 
-                             target_value: Optional[str]) -> List[User]:
-        """Get target users based on targeting criteria"""
-        base_query = select(User).where(
+    @staticmethod
+    def target_users_query(target_type: str, target_value: Optional[str]):
+        """Select the ids of the target users, or None for an unknown target type"""
+        base_query = select(User.id).where(
             and_(User.is_active == True, User.is_banned == False)
         )
         
         if target_type == "all":
-            result = await session.execute(base_query)
+            return base_query
         elif target_type == "language":
-            result = await session.execute(
-                base_query.where(User.language_code == target_value)
-            )
+            return base_query.where(User.language_code == target_value)
         elif target_type == "country":
-            result = await session.execute(
-                base_query.where(User.country_code == target_value)
-            )
-        else:
-            logger.warning(f"Unknown target type: {target_type}")
-            return []
+            return base_query.where(User.country_code == target_value)
+        
+        logger.warning(f"Unknown target type: {target_type}")
+        return None
+    
+    async def create_recipient_records(self, session: AsyncSession, outbox_id: int,
+                                     target_type: str, target_value: Optional[str]) -> int:
+        """Create recipient tracking records with one INSERT ... SELECT from users
         
-        return list(result.scalars().all())
+        Returns the number of recipients created.
+        """
+        users_query = self.target_users_query(target_type, target_value)
+        if users_query is None:
+            return 0
+        
+        # Column defaults are applied by the ORM only, so they are selected explicitly
+        rows_query = users_query.with_only_columns(
+            literal(outbox_id),
+            User.id,
+            literal(DeliveryStatus.PENDING, OutboxRecipient.status.type),
+            literal(0),
+            literal(datetime.now(timezone.utc), OutboxRecipient.created_at.type),
+        )
+        result = await session.execute(
+            insert(OutboxRecipient).from_select(
+                ["outbox_id", "user_id", "status", "attempts", "created_at"], rows_query
+            )
+        )
+        return result.rowcount
     
-    async def create_recipient_records(self, session: AsyncSession, 
-                                     outbox_id: int, users: List[User]):
-        """Create recipient tracking records"""
-        for user in users:
-            recipient = OutboxRecipient(
-                outbox_id=outbox_id,
-                user_id=user.id,
-                status=DeliveryStatus.PENDING
+    async def pending_recipients(self, session: AsyncSession, outbox_id: int,
+                                 batch_size: int) -> AsyncIterator[List[Row]]:
+        """Stream pending recipients as (id, telegram_id) rows in batches
+        
+        Keyset pagination on the (outbox_id, user_id) unique index: each batch
+        starts after the last user id of the previous one, so every query reads
+        only one batch regardless of the audience size.
+        """
+        last_user_id = 0
+        while True:
+            result = await session.execute(
+                select(User.id, User.telegram_id)
+                .join(OutboxRecipient, OutboxRecipient.user_id == User.id)
+                .where(and_(
+                    OutboxRecipient.outbox_id == outbox_id,
+                    OutboxRecipient.status == DeliveryStatus.PENDING,
+                    OutboxRecipient.user_id > last_user_id
+                ))
+                .order_by(OutboxRecipient.user_id)
+                .limit(batch_size)
             )
-            session.add(recipient)
+            batch = list(result.all())
+            if not batch:
+                return
+            last_user_id = batch[-1].id
+            yield batch
     
     async def send_to_chunk(self, session: AsyncSession, outbox_id: int, 
-                          users: List[User], broadcast: Dict[str, Any]):
-        """Send broadcast to a chunk of users"""
-        for user in users:
-            try:
-                success = await self.send_to_user(user, broadcast)
-                
-                # Update recipient status
-                await self.update_recipient_status(
-                    session, outbox_id, user.id,
-                    DeliveryStatus.SENT if success else DeliveryStatus.FAILED
-                )
-                
-            except Exception as e:
-                logger.error(f"Error sending to user {user.telegram_id}: {e}")
-                await self.update_recipient_status(
-                    session, outbox_id, user.id, DeliveryStatus.FAILED, str(e)
-                )
+                          users: List[Row], broadcast: Dict[str, Any]):
+        """Send broadcast to a chunk of (id, telegram_id) user rows concurrently at the configured rate"""
+        errors = await asyncio.gather(*(self.deliver(user, broadcast) for user in users))
         
+        sent = [user.id for user, error in zip(users, errors) if error is None]
+        # One update per distinct failure reason
+        failed: Dict[str, List[int]] = {}
+        for user, error in zip(users, errors):
+            if error is not None:
+                failed.setdefault(error, []).append(user.id)
+        await self.mark_recipients(session, outbox_id, sent, DeliveryStatus.SENT)
+        for error, user_ids in failed.items():
+            await self.mark_recipients(session, outbox_id, user_ids, DeliveryStatus.FAILED, error)
         await session.commit()
     
-    async def send_to_user(self, user: User, broadcast: Dict[str, Any]) -> bool:
-        """Send broadcast message to a single user"""
+    async def deliver(self, user: Row, broadcast: Dict[str, Any]) -> Optional[str]:
+        """Send to one user within the in-flight limit, retrying after flood waits
+        
+        Returns None when delivered, otherwise the failure reason.
+        """
+        async with self.in_flight:
+            retries = 0
+            while True:
+                await self.pacer.acquire()
+                try:
+                    error = await self.send_to_user(user, broadcast)
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Flood wait {e.retry_after}s while broadcasting to {user.telegram_id}")
+                    # Only a flood wait this send triggered counts as a retry for the user
+                    if self.pacer.retry_after(e.retry_after):
+                        retries += 1
+                        if retries > BROADCAST_RETRY_ATTEMPTS:
+                            return f"Flood wait {e.retry_after}s"
+                    continue
+                if error is None:
+                    self.pacer.success()
+                return error
+    
+    async def send_to_user(self, user: Row, broadcast: Dict[str, Any]) -> Optional[str]:
+        """Send broadcast message to a single user (None on success, else the error)"""
         try:
             message_text = broadcast["message_text"]
             message_type = broadcast.get("message_type", "text")
@@ -202,19 +307,22 @@ class BroadcastService:
                     caption_entities=broadcast.get("message_entities")
                 )
             
-            return True
+            return None
             
+        except TelegramRetryAfter:
+            # Handled by deliver(): pause the pacer and retry
+            raise
         except TelegramForbiddenError:
             # User blocked the bot
             logger.info(f"User {user.telegram_id} blocked the bot")
-            return False
+            return "Blocked by user"
         except TelegramBadRequest as e:
             # Invalid user or other API error
             logger.warning(f"Bad request for user {user.telegram_id}: {e}")
-            return False
+            return str(e)
         except Exception as e:
             logger.error(f"Unexpected error sending to user {user.telegram_id}: {e}")
-            return False
+            return str(e) or type(e).__name__
     
     async def update_broadcast_status(self, session: AsyncSession, 
                                     outbox_id: int, status: OutboxStatus):
@@ -229,34 +337,30 @@ class BroadcastService:
             outbox.updated_at = datetime.now(timezone.utc)
             await session.commit()
     
-    async def update_recipient_status(self, session: AsyncSession, outbox_id: int,
-                                    user_id: int, status: DeliveryStatus,
-                                    error_message: Optional[str] = None):
-        """Update recipient delivery status"""
-        result = await session.execute(
-            select(OutboxRecipient).where(
-                and_(
-                    OutboxRecipient.outbox_id == outbox_id,
-                    OutboxRecipient.user_id == user_id
-                )
-            )
+    async def mark_recipients(self, session: AsyncSession, outbox_id: int,
+                            user_ids: List[int], status: DeliveryStatus,
+                            error_message: Optional[str] = None):
+        """Update the delivery status of many recipients in one statement"""
+        if not user_ids:
+            return
+        now = datetime.now(timezone.utc)
+        values = {
+            "status": status,
+            "last_attempt": now,
+            "attempts": OutboxRecipient.attempts + 1,
+        }
+        if status == DeliveryStatus.SENT:
+            values["delivered_at"] = now
+        elif error_message:
+            values["error_message"] = error_message
+        await session.execute(
+            update(OutboxRecipient)
+            .where(and_(
+                OutboxRecipient.outbox_id == outbox_id,
+                OutboxRecipient.user_id.in_(user_ids)
+            ))
+            .values(**values)
         )
-        recipient = result.scalar_one_or_none()
-        
-        if recipient:
-            recipient.status = status
-            recipient.last_attempt = datetime.now(timezone.utc)
-            recipient.attempts += 1
-            
-            if status == DeliveryStatus.SENT:
-                recipient.delivered_at = datetime.now(timezone.utc)
-            elif error_message:
-                recipient.error_message = error_message
-    
-    @staticmethod
-    def chunk_list(lst: List, chunk_size: int) -> List[List]:
-        """Split list into chunks"""
-        return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
     
     async def stop(self):
         """Stop the broadcast service"""
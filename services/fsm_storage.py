@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+SQLAlchemy-backed FSM storage for aiogram
+Keeps conversation state in the bot database so it survives restarts and is shared across bot processes
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import FSMRecord
+from config import FSM_STATE_TTL, FSM_FLUSH_INTERVAL, FSM_CACHE_TTL, FSM_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# How often stale conversations are purged from the table
+CLEANUP_INTERVAL = 3600
+
+Record = Tuple[Optional[str], Dict[str, Any]]
+
+def json_default(value: Any) -> Any:
+    """Serialize aiogram objects (e.g. MessageEntity) stored in FSM data"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class SQLAlchemyStorage(BaseStorage):
+    """FSM storage in the `fsm_states` table
+
+    Writes are coalesced: every set_state/set_data only updates a pending record
+    in memory, and a background task writes all pending records in one upsert
+    every `flush_interval` seconds (and on close). Reads are served from the
+    pending writes, then from a small LRU cache kept for `cache_ttl` seconds,
+    then from the database. Another process sees a change after at most
+    `flush_interval + cache_ttl` seconds; set FSM_CACHE_TTL=0 when updates of
+    one chat may be routed to different processes back to back.
+    Conversations idle for longer than `state_ttl` are treated as empty and
+    deleted periodically.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, state_ttl: int = FSM_STATE_TTL,
+                 flush_interval: float = FSM_FLUSH_INTERVAL, cache_ttl: float = FSM_CACHE_TTL,
+                 cache_size: int = FSM_CACHE_SIZE):
+        self.session_maker = session_maker
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        # key -> (expires_at, state, data)
+        self.cache: "OrderedDict[str, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        # key -> (state, data) waiting for the next flush
+        self.pending: Dict[str, Record] = {}
+        # records of the flush currently being written
+        self.flushing: Dict[str, Record] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.last_cleanup = 0.0
+        self.closed = False
+
+    @staticmethod
+    def record_key(key: StorageKey) -> str:
+        """Row key for a storage key (same parts as aiogram's default key builder)"""
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        thread_id = getattr(key, "thread_id", None)
+        if thread_id:
+            parts.append(str(thread_id))
+        business_connection_id = getattr(key, "business_connection_id", None)
+        if business_connection_id:
+            parts.append(str(business_connection_id))
+        if key.destiny != "default":
+            parts.append(key.destiny)
+        return ":".join(parts)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Set the conversation state"""
+        row_key = self.record_key(key)
+        _, data = await self.record(row_key)
+        self.write(row_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        """Get the conversation state"""
+        state, _ = await self.record(self.record_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        """Replace the conversation data"""
+        row_key = self.record_key(key)
+        state, _ = await self.record(row_key)
+        self.write(row_key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        """Get a copy of the conversation data"""
+        _, data = await self.record(self.record_key(key))
+        return dict(data)
+
+    async def record(self, row_key: str) -> Record:
+        """Current (state, data) from pending writes, the cache or the database"""
+        local = self.local(row_key)
+        if local is not None:
+            return local
+        cached = self.cache.get(row_key)
+        if cached and cached[0] > time.monotonic():
+            self.cache.move_to_end(row_key)
+            return cached[1], cached[2]
+
+        async with self.session_maker() as session:
+            row = await session.get(FSMRecord, row_key)
+            state, data = None, {}
+            if row and not self.is_expired(row.updated_at):
+                state, data = row.state, json.loads(row.data or "{}")
+
+        # A write made while we were waiting wins over what was read
+        local = self.local(row_key)
+        if local is not None:
+            return local
+        self.remember(row_key, state, data)
+        return state, data
+
+    def local(self, row_key: str) -> Optional[Record]:
+        """A record written in this process but not committed yet"""
+        if row_key in self.pending:
+            return self.pending[row_key]
+        return self.flushing.get(row_key)
+
+    def is_expired(self, updated_at: Optional[datetime]) -> bool:
+        """Whether a stored conversation has been idle for longer than the TTL"""
+        if updated_at is None:
+            return False
+        if updated_at.tzinfo is None:
+            # SQLite returns naive datetimes
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return updated_at < datetime.now(timezone.utc) - timedelta(seconds=self.state_ttl)
+
+    def remember(self, row_key: str, state: Optional[str], data: Dict[str, Any]):
+        """Put a record in the read cache"""
+        if self.cache_ttl <= 0:
+            return
+        self.cache[row_key] = (time.monotonic() + self.cache_ttl, state, data)
+        self.cache.move_to_end(row_key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def write(self, row_key: str, state: Optional[str], data: Dict[str, Any]):
+        """Queue a record for the next flush"""
+        self.pending[row_key] = (state, data)
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.flush_soon())
+
+    async def flush_soon(self):
+        """Flush after the coalescing window until nothing is pending (backing off on errors)"""
+        delay = self.flush_interval
+        while self.pending and not self.closed:
+            await asyncio.sleep(delay)
+            delay = self.flush_interval if await self.flush() else min(max(delay * 2, 1), 30)
+
+    async def flush(self) -> bool:
+        """Write all pending records in one transaction"""
+        if not self.pending:
+            return True
+        batch, self.pending = self.pending, {}
+        self.flushing = batch
+        now = datetime.now(timezone.utc)
+        rows, cleared = [], []
+        for row_key, (state, data) in batch.items():
+            if state is None and not data:
+                cleared.append(row_key)
+            else:
+                rows.append({"key": row_key, "state": state, "updated_at": now,
+                             "data": json.dumps(data, ensure_ascii=False, default=json_default)})
+
+        try:
+            async with self.session_maker() as session:
+                if rows:
+                    await self.upsert(session, rows)
+                if cleared:
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(cleared)))
+                if time.monotonic() - self.last_cleanup >= CLEANUP_INTERVAL:
+                    await self.cleanup(session)
+                await session.commit()
+        except Exception as e:
+            self.flushing = {}
+            logger.error(f"Error flushing FSM states: {e}")
+            # Keep the records unless they were overwritten meanwhile
+            for row_key, record in batch.items():
+                self.pending.setdefault(row_key, record)
+            return False
+
+        self.flushing = {}
+        for row_key, (state, data) in batch.items():
+            if row_key not in self.pending:
+                self.remember(row_key, state, data)
+        return True
+
+    async def upsert(self, session: AsyncSession, rows):
+        """Insert or update records with a single statement"""
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            for row in rows:
+                await session.merge(FSMRecord(**row))
+            return
+
+        statement = insert(FSMRecord).values(rows)
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[FSMRecord.key],
+            set_={
+                "state": statement.excluded.state,
+                "data": statement.excluded.data,
+                "updated_at": statement.excluded.updated_at,
+            }
+        ))
+
+    async def cleanup(self, session: AsyncSession):
+        """Delete conversations idle for longer than the TTL"""
+        self.last_cleanup = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.state_ttl)
+        result = await session.execute(delete(FSMRecord).where(FSMRecord.updated_at < cutoff))
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} stale FSM states")
+
+    async def close(self) -> None:
+        """Flush pending writes (called by the dispatcher on shutdown)"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.flusher and not self.flusher.done():
+            # Let a running flush finish instead of cancelling it mid-transaction
+            await self.flusher
+        await self.flush()
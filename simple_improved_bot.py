@@ -2,13 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import os
-import json
 import csv
-import urllib.request
-import urllib.parse
 import logging
 from datetime import datetime
 
+from telegram_transport import get_transport
+
 # إعداد التسجيل
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -17,6 +16,7 @@ class SimpleLangSenseBot:
     def __init__(self, token):
         self.token = token
         self.api_url = f"https://api.telegram.org/bot{token}"
+        self.transport = get_transport()
         self.offset = 0
         self.user_states = {}
         self.init_files()
@@ -65,14 +65,8 @@ class SimpleLangSenseBot:
         url = f"{self.api_url}/{method}"
         try:
             if data:
-                json_data = json.dumps(data).encode('utf-8')
-                req = urllib.request.Request(url, data=json_data)
-                req.add_header('Content-Type', 'application/json')
-            else:
-                req = urllib.request.Request(url)
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                return json.loads(response.read().decode('utf-8'))
+                return self.transport.post_json(url, data, timeout=10)
+            return self.transport.get_json(url, timeout=10)
         except Exception as e:
             logger.error(f"خطأ في API: {e}")
             return None
@@ -88,8 +82,7 @@ class SimpleLangSenseBot:
         """جلب التحديثات"""
         url = f"{self.api_url}/getUpdates?offset={self.offset + 1}&timeout=10"
         try:
-            with urllib.request.urlopen(url, timeout=15) as response:
-                return json.loads(response.read().decode('utf-8'))
+            return self.transport.get_json(url, timeout=15)
         except Exception as e:
             logger.error(f"خطأ في جلب التحديثات: {e}")
             return None
@@ -12,8 +12,11 @@ import logging
 import urllib.request
 import urllib.parse
 import json
+import threading
 from datetime import datetime
 
+from webhook_server import WebhookConfig, serve_webhook, delete_webhook
+
 # إعداد نظام السجلات
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -23,6 +26,7 @@ class SimpleLangSenseBot:
         self.token = token
         self.base_url = f"https://api.telegram.org/bot{token}"
         self.user_states = {}
+        self.update_lock = threading.Lock()  # معالجة تحديث واحد في كل مرة (خادم الـ webhook متعدد الـ threads)
         self.init_files()
         logger.info("تم إنشاء البوت المبسط بنجاح")
     
@@ -672,9 +676,22 @@ class SimpleLangSenseBot:
             logger.error(f"خطأ في جلب التحديثات: {e}")
             return None
     
+    def handle_update(self, update):
+        """معالجة تحديث واحد (من polling أو webhook)"""
+        with self.update_lock:
+            if 'message' in update:
+                self.handle_message(update['message'])
+    
     def run(self):
         """تشغيل البوت"""
         logger.info("✅ البوت المبسط يعمل الآن")
+        
+        # وضع الـ webhook (UPDATE_MODE=webhook) بنفس مسار المعالجة
+        webhook_config = WebhookConfig.from_env()
+        if webhook_config.enabled:
+            serve_webhook(self.base_url, self.handle_update, webhook_config)
+            return
+        delete_webhook(self.base_url)
         offset = None
         
         while True:
@@ -682,8 +699,7 @@ class SimpleLangSenseBot:
                 updates = self.get_updates(offset)
                 if updates and updates.get('ok'):
                     for update in updates['result']:
-                        if 'message' in update:
-                            self.handle_message(update['message'])
+                        self.handle_update(update)
                         offset = update['update_id'] + 1
                 
                 time.sleep(1)
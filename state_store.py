@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مخزن حالات المحادثات بانتهاء صلاحية وحد أقصى للذاكرة ولقطات دورية على القرص
+Conversation state store with TTL/LRU eviction and disk snapshots
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """بديل للقاموس في user_states و temp_company_data
+
+    يدعم نفس عمليات القاموس المستخدمة في البوت (in، [] ، del، get، pop).
+    كل حالة تنتهي صلاحيتها بعد ttl ثانية من آخر كتابة، وعند تجاوز max_entries
+    تُحذف الحالات الأقل استخداماً (LRU). الحالات تُحفظ كلقطة JSON مضغوطة
+    كل snapshot_interval ثانية على الأكثر (وعند الإيقاف) وتُستعاد عند التشغيل،
+    فيكمل المستخدم معالج الإيداع أو السحب بعد إعادة النشر.
+    """
+
+    def __init__(self, path=None, ttl=86400, max_entries=10000, snapshot_interval=30):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.RLock()
+        # المفتاح -> [القيمة، وقت انتهاء الصلاحية] بترتيب آخر استخدام
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.last_snapshot = time.time()
+        self.load()
+
+    def load(self):
+        """استعادة آخر لقطة (مع تجاهل الحالات المنتهية)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+            now = time.time()
+            for key, value, expires in rows:
+                if expires > now:
+                    self.entries[key] = [value, expires]
+            logger.info(f"تمت استعادة {len(self.entries)} حالة من {self.path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"خطأ في قراءة لقطة الحالات {self.path}: {e}")
+
+    def live_entry(self, key):
+        """العنصر إن كان موجوداً ولم تنتهِ صلاحيته"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self.entries[key]
+            self.dirty = True
+            return None
+        self.entries.move_to_end(key)
+        if isinstance(entry[0], (dict, list)):
+            # قيمة قابلة للتعديل في مكانها: تُحفظ في اللقطة التالية
+            self.dirty = True
+        return entry
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.live_entry(key) is not None
+
+    def __getitem__(self, key):
+        with self.lock:
+            entry = self.live_entry(key)
+            if entry is None:
+                raise KeyError(key)
+            return entry[0]
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.live_entry(key)
+            return default if entry is None else entry[0]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries[key] = [value, time.time() + self.ttl]
+            self.entries.move_to_end(key)
+            self.dirty = True
+            self.evict()
+            self.maybe_snapshot()
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.entries[key]
+            self.dirty = True
+            self.maybe_snapshot()
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self:
+                return default
+            value = self.entries.pop(key)[0]
+            self.dirty = True
+            return value
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def evict(self):
+        """حذف الحالات المنتهية من بداية الترتيب ثم الأقدم استخداماً فوق الحد"""
+        now = time.time()
+        while self.entries:
+            key, (_, expires) = next(iter(self.entries.items()))
+            if expires > now and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[key]
+
+    def maybe_snapshot(self):
+        """حفظ لقطة إذا مرت المدة المحددة منذ آخر حفظ"""
+        if self.path and time.time() - self.last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """حفظ ذري للحالات الحية (فقط إذا تغيرت)"""
+        with self.lock:
+            self.last_snapshot = time.time()
+            if not self.path or not self.dirty:
+                return
+            now = time.time()
+            rows = [[key, value, expires] for key, (value, expires) in self.entries.items() if expires > now]
+            self.dirty = False
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(rows, f, ensure_ascii=False, separators=(',', ':'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except (OSError, TypeError, ValueError) as e:
+                self.dirty = True
+                logger.error(f"خطأ في حفظ لقطة الحالات {self.path}: {e}")
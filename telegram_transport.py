@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ناقل HTTP مشترك لواجهة Telegram Bot API مع اتصالات دائمة (keep-alive)
+Shared keep-alive HTTP transport for the Telegram Bot API
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import mimetypes
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramHTTPError(Exception):
+    """رد HTTP برمز خطأ (4xx/5xx) من الخادم"""
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+        super().__init__(f"HTTP Error {status}: {body[:300]}")
+
+
+# الأخطاء التي قد يرفعها الناقل (للاستخدام في except)
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException, TelegramHTTPError)
+
+
+class RawJSON(str):
+    """جزء JSON مُرمّز مسبقاً (مثل لوحة مفاتيح محفوظة) يُدرج في جسم الطلب كما هو"""
+
+
+def encode_json(data):
+    """ترميز بيانات الطلب مع إدراج أجزاء RawJSON بدون إعادة ترميزها"""
+    raw = [(key, value) for key, value in data.items() if isinstance(value, RawJSON)]
+    if not raw:
+        return json.dumps(data).encode('utf-8')
+    rest = {key: value for key, value in data.items() if not isinstance(value, RawJSON)}
+    items = [json.dumps(rest)[1:-1]] if rest else []
+    items.extend(f"{json.dumps(key)}:{value}" for key, value in raw)
+    return ('{' + ','.join(items) + '}').encode('utf-8')
+
+
+# طرق الإرسال الخاضعة لحدود Telegram (رسالة لكل محادثة)
+RATE_LIMITED_PREFIXES = ('send', 'forward', 'copy', 'edit')
+
+
+class TokenBucket:
+    """دلو رموز: rate رمز في الثانية مع سماح بدفعة حتى capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """حجز رمز وإرجاع مدة الانتظار اللازمة قبل استخدامه (0 إن كان متاحاً الآن)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self, now):
+        """الدلو ممتلئ ولم يعد لحفظه فائدة"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """حدود الإرسال: حد عام للبوت، وحد لكل محادثة خاصة، وحد أبطأ للمجموعات
+
+    الحجز يتم على الدلو العام ودلو المحادثة معاً ثم ينتظر المرسل أطول المدتين،
+    فتسير الإرسالات الكبيرة بأعلى معدل مسموح بدل أن تُرفض بـ 429. عند وصول 429
+    يتوقف كل الإرسال حتى انتهاء retry_after.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, group_rate=20 / 60, chat_burst=3):
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.chats = {}
+        self.paused_until = 0
+
+    @classmethod
+    def from_env(cls):
+        """قراءة الحدود من متغيرات البيئة"""
+        return cls(global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', '30')),
+                   chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', '1')),
+                   group_rate=float(os.getenv('TELEGRAM_GROUP_RATE', '20')) / 60)
+
+    def bucket_for(self, chat_id, now):
+        """دلو المحادثة (المجموعات والقنوات معرفاتها سالبة أو بصيغة @username)"""
+        key = str(chat_id)
+        bucket = self.chats.get(key)
+        if bucket is None:
+            if len(self.chats) > 10000:
+                self.chats = {k: b for k, b in self.chats.items() if not b.idle(now)}
+            if key.startswith(('-', '@')):
+                bucket = TokenBucket(self.group_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chats[key] = bucket
+        return bucket
+
+    def reserve(self, chat_id):
+        """حجز مكان لرسالة لهذه المحادثة وإرجاع مدة الانتظار قبل إرسالها"""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.paused_until)
+            wait = max(self.global_bucket.reserve(start), self.bucket_for(chat_id, start).reserve(start))
+            return wait + start - now
+
+    def acquire(self, chat_id):
+        """الانتظار حتى يُسمح بإرسال رسالة لهذه المحادثة"""
+        wait = self.reserve(chat_id)
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """إيقاف كل الإرسال لمدة retry_after"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_after(error):
+    """مدة الانتظار المطلوبة من رد 429 (parameters.retry_after)"""
+    try:
+        return float(json.loads(error.body)['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class MultipartBody:
+    """جسم multipart/form-data يُقرأ فيه الملف على أجزاء بدلاً من تحميله كاملاً في الذاكرة
+
+    الطول يُحسب مسبقاً (Content-Length) من أحجام الأجزاء والملف، وكل مرور على
+    الكائن يعيد فتح الملف من بدايته، لذلك يمكن إعادة الطلب على اتصال جديد.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields, file_field, file_path, filename=None):
+        self.boundary = f"----DUXBoundary{uuid.uuid4().hex}"
+        self.file_path = file_path
+        filename = (filename or os.path.basename(file_path)).replace('"', '')
+        file_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        head = []
+        for name, value in fields.items():
+            if value is None or value == '':
+                continue
+            head.append(f'--{self.boundary}\r\n'
+                        f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n')
+        head.append(f'--{self.boundary}\r\n'
+                    f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                    f'Content-Type: {file_type}\r\n\r\n')
+        self.head = ''.join(head).encode('utf-8')
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.head) + os.path.getsize(self.file_path) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with open(self.file_path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail
+
+
+class ConnectionPool:
+    """مجموعة اتصالات HTTP/1.1 دائمة لخادم واحد، آمنة للاستخدام من عدة threads
+
+    عدد الاتصالات المفتوحة في نفس الوقت محدود بـ max_size؛ الطلبات الزائدة
+    تنتظر حتى يتحرر اتصال. الاتصال يعود للمجموعة بعد قراءة الرد كاملاً.
+    """
+
+    def __init__(self, scheme, host, port=None, max_size=8):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_size)
+
+    def new_connection(self, timeout):
+        """فتح اتصال جديد"""
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def acquire(self, timeout, fresh=False):
+        """أخذ اتصال خامل (أو فتح اتصال جديد) مع ضبط مهلة هذا الطلب"""
+        self.slots.acquire()
+        try:
+            if fresh:
+                return self.new_connection(timeout), False
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            return self.new_connection(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def release(self, conn, reusable):
+        """إرجاع الاتصال للمجموعة أو إغلاقه"""
+        try:
+            if reusable:
+                self.idle.put(conn)
+            else:
+                conn.close()
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """إغلاق جميع الاتصالات الخاملة"""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class TelegramTransport:
+    """ناقل مشترك: مجموعة اتصالات لكل خادم، ومهلة مستقلة لكل طلب
+
+    إذا كان الاتصال الخامل قد أغلقه الخادم، يُعاد الطلب مرة واحدة على اتصال
+    جديد (الخادم يغلق الاتصالات الخاملة قبل قراءة أي طلب جديد عليها).
+    طلبات الإرسال لمحادثة (chat_id) تمر عبر RateLimiter وتُعاد عند رد 429.
+    """
+
+    def __init__(self, pool_size=8, timeout=10, limiter=None, max_retries=5):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter.from_env()
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def pool_for(self, scheme, host, port):
+        """مجموعة الاتصالات الخاصة بخادم"""
+        key = (scheme, host, port)
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(scheme, host, port, self.pool_size)
+            return self.pools[key]
+
+    def request(self, url, body=None, content_type=None, timeout=None, headers=None, chat_id=None):
+        """إرسال طلب (GET بدون body، وPOST مع body) وإرجاع الرد كـ JSON
+
+        مع chat_id يخضع الطلب لحدود الإرسال، ورد 429 يؤدي للانتظار retry_after
+        ثم إعادة الطلب (مع تأخير متزايد إن لم يحدد الخادم المدة).
+        """
+        if chat_id is None:
+            return self.send_once(url, body, content_type, timeout, headers)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(chat_id)
+            try:
+                return self.send_once(url, body, content_type, timeout, headers)
+            except TelegramHTTPError as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                delay = retry_after(e) or min(2 ** attempt, 30)
+                logger.warning(f"تجاوز حد الإرسال (429) للمحادثة {chat_id}، إعادة المحاولة بعد {delay} ثانية")
+                self.limiter.pause(delay)
+
+    def send_once(self, url, body, content_type, timeout, headers):
+        """تنفيذ طلب واحد على اتصال من المجموعة"""
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        pool = self.pool_for(parts.scheme, parts.hostname, parts.port)
+        method = 'GET' if body is None else 'POST'
+        headers = dict(headers or {}, Connection='keep-alive')
+        if content_type:
+            headers['Content-Type'] = content_type
+        if isinstance(body, MultipartBody):
+            headers['Content-Length'] = str(len(body))
+        timeout = timeout or self.timeout
+
+        for attempt in range(2):
+            conn, reused = pool.acquire(timeout, fresh=attempt > 0)
+            reusable = False
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+                reusable = not response.will_close
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if reused and attempt == 0:
+                    # اتصال خامل أغلقه الخادم: إعادة المحاولة على اتصال جديد
+                    continue
+                raise
+            finally:
+                pool.release(conn, reusable)
+            text = payload.decode('utf-8')
+            if response.status >= 400:
+                raise TelegramHTTPError(response.status, text)
+            return json.loads(text)
+
+    def get_json(self, url, params=None, timeout=None):
+        """طلب GET مع معاملات اختيارية في الرابط"""
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        return self.request(url, timeout=timeout)
+
+    def post_json(self, url, data, timeout=None):
+        """طلب POST ببيانات JSON"""
+        return self.request(url, encode_json(data), 'application/json', timeout,
+                            chat_id=limited_chat(url, data))
+
+    def post_form(self, url, params, timeout=None):
+        """طلب POST ببيانات form-urlencoded"""
+        return self.request(url, urlencode(params).encode('utf-8'), 'application/x-www-form-urlencoded', timeout,
+                            chat_id=limited_chat(url, params))
+
+    def post_file(self, url, fields, file_field, file_path, timeout=None, retries=3):
+        """رفع ملف بطلب multipart متدفق (ذاكرة ثابتة مهما كان حجم الملف)
+
+        عند انقطاع الاتصال أو خطأ 5xx يُعاد الرفع من البداية بطلب جديد
+        مع تأخير متزايد بين المحاولات.
+        """
+        body = MultipartBody(fields, file_field, file_path)
+        for attempt in range(retries + 1):
+            try:
+                return self.request(url, body, body.content_type, timeout,
+                                    chat_id=limited_chat(url, fields))
+            except TRANSPORT_ERRORS as e:
+                server_error = isinstance(e, TelegramHTTPError) and e.status >= 500
+                if attempt == retries or (isinstance(e, TelegramHTTPError) and not server_error):
+                    raise
+                logger.warning(f"فشل رفع {os.path.basename(file_path)} ({e})، إعادة المحاولة {attempt + 1}")
+                time.sleep(min(2 ** attempt, 30))
+
+    def close(self):
+        """إغلاق جميع الاتصالات"""
+        with self.lock:
+            for pool in self.pools.values():
+                pool.close()
+
+
+def limited_chat(url, data):
+    """المحادثة التي يُحسب عليها الطلب إن كان من طرق الإرسال، وإلا None"""
+    method = urlsplit(url).path.rsplit('/', 1)[-1]
+    if method.startswith(RATE_LIMITED_PREFIXES) and data:
+        return data.get('chat_id')
+    return None
+
+
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def get_transport():
+    """الناقل المشترك لجميع البوتات في نفس العملية"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = TelegramTransport()
+        return _shared_transport
@@ -71,6 +71,23 @@ def test_bot_api():
         print(f"❌ API test failed: {e}")
         return False
 
+def test_user_search():
+    """Test phone lookups in the admin user search index"""
+    from dux_storage import UserSearchIndex
+    
+    print("\n🔎 Testing user search index...")
+    
+    index = UserSearchIndex()
+    index.reset_users([{'telegram_id': '1', 'name': 'محمد أحمد', 'customer_id': 'C100001',
+                        'phone': '+966501234567'}])
+    for query in ('+966501234567', '+9665', '966501234567', '0501234567',
+                  '+966 50 123 4567', '050-123-4567', 'محمد +966501234567'):
+        _, total = index.search(query)
+        assert total == 1, f"No match for phone query {query!r}"
+    
+    print("✅ User search test completed successfully!")
+    return True
+
 def display_bot_info():
     """Display bot setup information"""
     print("\n" + "="*50)
@@ -114,6 +131,9 @@ def main():
     # Test API
     api_ok = test_bot_api()
     
+    # Test user search
+    test_user_search()
+    
     if db_ok and api_ok:
         display_bot_info()
         print("\n🎉 All systems are GO! The bot is ready for use.")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+موزع التحديثات المتزامن مع الحفاظ على ترتيب رسائل كل محادثة
+Concurrent update dispatcher with per-chat ordering
+"""
+
+import os
+import json
+import queue
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedLock:
+    """أقفال حسب المفتاح (مثلاً لكل مستخدم) تُحذف تلقائياً عند عدم استخدامها"""
+
+    def __init__(self):
+        self.guard = threading.Lock()
+        self.locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        """حجز قفل المفتاح طوال مدة الكتلة"""
+        with self.guard:
+            entry = self.locks.get(key)
+            if entry is None:
+                entry = self.locks[key] = [threading.RLock(), 0]
+            entry[1] += 1
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self.guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.locks[key]
+
+
+class UpdateDispatcher:
+    """توزيع التحديثات على مجموعة عمال مع ترتيب صارم داخل المحادثة الواحدة
+
+    لكل محادثة طابور خاص بها، والمحادثة التي لديها تحديثات تنتظر تدخل طابور
+    الجاهزية مرة واحدة فقط، لذلك لا يعالج تحديثاتها أكثر من عامل في نفس الوقت
+    بينما تُعالج المحادثات الأخرى بالتوازي. عدد التحديثات المعلقة محدود بـ
+    max_pending: عند الامتلاء تتوقف submit (وبالتالي جلب التحديثات) حتى يتحرر مكان.
+    """
+
+    def __init__(self, handler, workers=8, max_pending=1000):
+        self.handler = handler
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.drained = threading.Condition(self.lock)
+        self.pending = {}
+        self.ready = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.threads = []
+
+    def start(self):
+        """تشغيل العمال"""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, name=f"dispatch-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, key, item):
+        """إضافة تحديث لطابور محادثته (ينتظر إذا امتلأت الطوابير)"""
+        self.slots.acquire()
+        with self.lock:
+            if key in self.pending:
+                self.pending[key].append(item)
+                return
+            self.pending[key] = deque([item])
+        self.ready.put(key)
+
+    def worker(self):
+        """عامل: يأخذ محادثة جاهزة ويعالج تحديثها التالي ثم يعيدها للطابور إن بقي لها تحديثات"""
+        while True:
+            key = self.ready.get()
+            if key is None:
+                return
+            with self.lock:
+                item = self.pending[key].popleft()
+            try:
+                self.handler(item)
+            except Exception as e:
+                logger.error(f"خطأ في معالجة التحديث: {e}")
+            finally:
+                self.slots.release()
+                with self.lock:
+                    if self.pending[key]:
+                        self.ready.put(key)
+                    else:
+                        del self.pending[key]
+                        if not self.pending:
+                            self.drained.notify_all()
+
+    def stop(self):
+        """إيقاف العمال بعد إنهاء ما في الطوابير"""
+        with self.lock:
+            while self.pending and self.threads:
+                self.drained.wait()
+        for _ in self.threads:
+            self.ready.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+class UpdateTracker:
+    """علامة آخر تحديث مُعالج محفوظة على القرص مع مجموعة محدودة من المعرفات المعالجة مؤخراً
+
+    العلامة (watermark) هي أكبر update_id تمت معالجة كل ما قبله؛ التحديثات
+    التي انتهت معالجتها بعد العلامة (بسبب المعالجة المتوازية) تبقى في مجموعة
+    المعرفات الأخيرة. عند إعادة التشغيل يبدأ الجلب من العلامة، ويُتجاهل أي
+    تحديث موجود في المجموعة، فلا تتكرر طلبات الإيداع أو السحب بعد انهيار أو نشر جديد.
+    """
+
+    def __init__(self, path='update_offset.json', recent_limit=1000):
+        self.path = path
+        self.recent_limit = recent_limit
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.watermark = 0
+        self.recent = deque()
+        self.recent_ids = set()
+        self.in_flight = set()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """قراءة آخر حالة محفوظة"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.watermark = int(data.get('watermark', 0))
+            for update_id in data.get('recent', [])[-self.recent_limit:]:
+                self.remember(int(update_id))
+        except (OSError, ValueError) as e:
+            logger.error(f"خطأ في قراءة علامة التحديثات: {e}")
+
+    def remember(self, update_id):
+        """إضافة معرف لمجموعة المعرفات الأخيرة مع حذف الأقدم عند تجاوز الحد"""
+        self.recent.append(update_id)
+        self.recent_ids.add(update_id)
+        while len(self.recent) > self.recent_limit:
+            self.recent_ids.discard(self.recent.popleft())
+
+    def begin(self, update_id):
+        """تسجيل تحديث جديد؛ ترجع False إذا كان مكرراً (عولج أو قيد المعالجة)"""
+        with self.lock:
+            if update_id <= self.watermark or update_id in self.recent_ids or update_id in self.in_flight:
+                return False
+            self.in_flight.add(update_id)
+            return True
+
+    def done(self, update_id):
+        """انتهاء معالجة تحديث وتقديم العلامة إن أمكن"""
+        with self.lock:
+            self.in_flight.discard(update_id)
+            self.remember(update_id)
+            limit = min(self.in_flight) - 1 if self.in_flight else max(self.recent)
+            self.watermark = max(self.watermark, max((i for i in self.recent if i <= limit), default=0))
+            self.dirty = True
+
+    def save(self):
+        """حفظ ذري للعلامة والمعرفات الأخيرة (فقط إذا تغيرت)"""
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = {'watermark': self.watermark, 'recent': [i for i in self.recent if i > self.watermark]}
+                self.dirty = False
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                self.dirty = True
+                logger.error(f"خطأ في حفظ علامة التحديثات: {e}")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+وضع الـ Webhook لبوتات urllib: خادم HTTP محلي يستقبل تحديثات Telegram
+Webhook ingestion mode for the urllib-based bots
+
+التفعيل عبر متغيرات البيئة:
+    UPDATE_MODE=webhook            (الافتراضي polling)
+    WEBHOOK_URL=https://example.com/telegram/webhook
+    WEBHOOK_SECRET=<نص سري يُرسل في ترويسة X-Telegram-Bot-Api-Secret-Token>
+    WEBHOOK_HOST=0.0.0.0  WEBHOOK_PORT=8080  WEBHOOK_PATH=/telegram/webhook
+
+بديل محلي للاختبار (يرسل تحديثات مسجلة بصيغة JSON سطراً بسطر):
+    python webhook_server.py replay updates.jsonl --url http://127.0.0.1:8080/telegram/webhook --secret <السر>
+"""
+
+import os
+import sys
+import hmac
+import json
+import logging
+import argparse
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from telegram_transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# أقصى حجم لتحديث واحد (Telegram يرسل تحديثات صغيرة)
+MAX_UPDATE_BYTES = 1024 * 1024
+
+
+class WebhookConfig:
+    """إعدادات وضع استقبال التحديثات"""
+
+    def __init__(self, mode='polling', url='', secret='', host='0.0.0.0', port=8080, path=None):
+        self.mode = mode
+        self.url = url
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.path = path or urlsplit(url).path or '/telegram/webhook'
+
+    @property
+    def enabled(self):
+        return self.mode == 'webhook'
+
+    @classmethod
+    def from_env(cls):
+        """قراءة الإعدادات من متغيرات البيئة"""
+        return cls(mode=os.getenv('UPDATE_MODE', 'polling').strip().lower(),
+                   url=os.getenv('WEBHOOK_URL', ''),
+                   secret=os.getenv('WEBHOOK_SECRET', ''),
+                   host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+                   port=int(os.getenv('WEBHOOK_PORT', '8080')),
+                   path=os.getenv('WEBHOOK_PATH') or None)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """معالج طلبات POST القادمة من Telegram"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(f"webhook: {format % args}")
+
+    def reply(self, status, body=b''):
+        self.send_response(status)
+        if status != 200:
+            # جسم الطلب المرفوض لم يُقرأ، فلا يمكن إعادة استخدام الاتصال
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        if self.path.split('?', 1)[0] != server.config.path:
+            return self.reply(404)
+        secret = self.headers.get(SECRET_HEADER, '')
+        if server.config.secret and not hmac.compare_digest(secret, server.config.secret):
+            logger.warning(f"رفض تحديث webhook بسر غير صحيح من {self.client_address[0]}")
+            return self.reply(403)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_UPDATE_BYTES:
+            return self.reply(413 if length else 400)
+        try:
+            update = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            return self.reply(400)
+        try:
+            server.handle_update(update)
+        except Exception as e:
+            # الرد بنجاح حتى لا يعيد Telegram إرسال تحديث يفشل دائماً
+            logger.error(f"خطأ في معالجة تحديث webhook: {e}")
+        self.reply(200, b'{"ok":true}')
+
+    def do_GET(self):
+        self.reply(200 if self.path == '/health' else 404)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """خادم HTTP محلي يمرر كل تحديث مقبول إلى handle_update"""
+
+    daemon_threads = True
+
+    def __init__(self, config, handle_update):
+        self.config = config
+        self.handle_update = handle_update
+        super().__init__((config.host, config.port), WebhookHandler)
+
+
+def set_webhook(api_url, config):
+    """تسجيل رابط الـ webhook والسر لدى Telegram"""
+    data = {'url': config.url}
+    if config.secret:
+        data['secret_token'] = config.secret
+    return get_transport().post_json(f"{api_url}/setWebhook", data, timeout=10)
+
+
+def delete_webhook(api_url):
+    """إلغاء الـ webhook عند العودة لوضع polling (وإلا يرفض Telegram طلبات getUpdates)"""
+    try:
+        return get_transport().post_json(f"{api_url}/deleteWebhook", {}, timeout=10)
+    except Exception as e:
+        logger.error(f"خطأ في إلغاء webhook: {e}")
+
+
+def serve_webhook(api_url, handle_update, config):
+    """تسجيل الـ webhook ثم استقبال التحديثات حتى الإيقاف"""
+    if config.url:
+        result = set_webhook(api_url, config)
+        logger.info(f"تسجيل webhook: {result}")
+    server = WebhookServer(config, handle_update)
+    logger.info(f"✅ خادم webhook يعمل على {config.host}:{config.port}{config.path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("تم إيقاف خادم webhook")
+    finally:
+        server.server_close()
+
+
+def replay_updates(path, url, secret=''):
+    """بديل محلي لـ Telegram: إرسال تحديثات مسجلة (سطر JSON لكل تحديث) إلى خادم الـ webhook"""
+    transport = get_transport()
+    sent = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            headers = {SECRET_HEADER: secret} if secret else None
+            transport.request(url, line.strip().encode('utf-8'), 'application/json', headers=headers)
+            sent += 1
+    return sent
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='أدوات وضع الـ webhook')
+    sub = parser.add_subparsers(dest='command', required=True)
+    replay = sub.add_parser('replay', help='إرسال تحديثات مسجلة إلى خادم webhook محلي')
+    replay.add_argument('updates_file')
+    replay.add_argument('--url', default='http://127.0.0.1:8080/telegram/webhook')
+    replay.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET', ''))
+    args = parser.parse_args()
+    count = replay_updates(args.updates_file, args.url, args.secret)
+    print(f"تم إرسال {count} تحديث")
+    sys.exit(0)